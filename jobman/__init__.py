@@ -1,18 +1,20 @@
 from __future__ import absolute_import
 from __future__ import unicode_literals
-import sys
+import importlib
 
-from . import runner
-from . import analyze_runner, check, findjob, raw_runner, rsync_runner
+from .runner import run_cmdline
+from .tools import make, make2, reval, resolve, DD, FrozenDD, freeze, defaults_merge, flatten, expand
 
-# The `sql_runner` module is not currently Python 2.4 compatible.
-if not sys.version.startswith('2.4.'):
-    from . import sql_runner
+# The modules defining the commands are imported when a command is used
+# (see runner.CommandRegistry), or when accessed as jobman.<module>: they
+# are slow to import (sqlalchemy, ...). So are the modules they used to
+# bring in with them.
+_command_modules = ('analyze_runner', 'cachesync_runner', 'check', 'findjob',
+                    'raw_runner', 'rsync_runner', 'sql_runner')
+_lazy_modules = _command_modules + ('api0', 'channel', 'sql')
 
-try:
-    from . import cachesync_runner
-except:
-    pass
 
-from .runner import run_cmdline
-from .tools import make, make2, reval, resolve, DD, defaults_merge, flatten, expand
+def __getattr__(name):
+    if name in _lazy_modules:
+        return importlib.import_module('.' + name, __name__)
+    raise AttributeError('module %r has no attribute %r' % (__name__, name))
@@ -0,0 +1,156 @@
+"""Commands of `jobman analyze` for the jobs of a database table
+(postgres:// or sqlite:// addresses).
+
+The commands run set-based SQL queries on the trial and keyval tables of
+the DbHandle, instead of loading the jobs as `Dict` objects.
+"""
+import itertools
+
+from sqlalchemy import and_, func, select
+
+from ..api0 import _keyval_value
+from ..analyze_runner import cmd
+from .. import sql
+
+# the columns holding the value of a key-value pair
+_VALUE_COLUMNS = ('type', 'ival', 'fval', 'sval', 'bval')
+
+
+def _value_columns(kv):
+    return [kv.c[name] for name in _VALUE_COLUMNS]
+
+
+######################
+# Commands for analyze
+######################
+
+@cmd
+def list_jobs(db, **kwargs):
+    """List jobs in the experiment"""
+    t = db._dict_table
+    kv = db._pair_table
+    q = (select([t.c.id, t.c.status, kv.c.name] + _value_columns(kv))
+         .select_from(t.outerjoin(kv, kv.c.dict_id == t.c.id))
+         .order_by(t.c.id, kv.c.name))
+    conn = db._engine.connect()
+    try:
+        # one query, the rows of each job are consecutive
+        rows = conn.execute(q)
+        for (id, status), job_rows in itertools.groupby(rows, lambda row: (row[0], row[1])):
+            state = dict((row[2], _keyval_value(*row[3:])) for row in job_rows
+                         if row[2] is not None)
+            print(id, status, state)
+    finally:
+        conn.close()
+
+
+def _dups_query(db):
+    """Return a query of (id, original) for the jobs that have the same
+    hash (see sql.hash_state) as the job `original` of lower id."""
+    t = db._dict_table
+    first = (select([t.c.hash, func.min(t.c.id).label('first')])
+             .where(t.c.hash.isnot(None))
+             .where(t.c.status != sql.FUCKED_UP)
+             .group_by(t.c.hash)
+             .having(func.count(t.c.id) > 1)
+             .alias('first'))
+    return (select([t.c.id, first.c.first, t.c.status])
+            .select_from(t.join(first, t.c.hash == first.c.hash))
+            .where(t.c.id != first.c.first)
+            .where(t.c.status != sql.FUCKED_UP)
+            .order_by(t.c.id))
+
+
+@cmd
+def list_dups(db, **kwargs):
+    """List duplicate jobs in the experiment"""
+    conn = db._engine.connect()
+    try:
+        for id, original, status in conn.execute(_dups_query(db)):
+            print(id, 'is dup of', original)
+    finally:
+        conn.close()
+
+
+@cmd
+def del_dups(db, **kwargs):
+    """Delete duplicate jobs in the experiment"""
+    # Like the empty dups of pkl experiments: only the dups that never
+    # started, and that no job is waiting for, are deleted.
+    t = db._dict_table
+    kv = db._pair_table
+    depend = db._depend_table
+    with db._engine.begin() as conn:
+        dups = conn.execute(_dups_query(db)).fetchall()
+        deleted = set()
+        for i in range(0, len(dups), 500):
+            ids = [id for id, original, status in dups[i:i + 500]]
+            # Lock the rows first: a worker can't book them, nor a job be
+            # made to wait for them (see DbHandle._add_dependencies), before
+            # the end of the transaction. The DELETE checks the status and
+            # the children again, as the dups were listed before the lock.
+            conn.execute(select([t.c.id]).where(t.c.id.in_(ids))
+                         .with_for_update()).fetchall()
+            conn.execute(t.delete()
+                         .where(t.c.id.in_(ids))
+                         .where(t.c.status == sql.START)
+                         .where(~t.c.id.in_(select([depend.c.parent_id]))))
+            left = set(id for id, in conn.execute(
+                select([t.c.id]).where(t.c.id.in_(ids))))
+            ids = [id for id in ids if id not in left]
+            # (the tables have ON DELETE CASCADE, but sqlite ignores it)
+            conn.execute(kv.delete().where(kv.c.dict_id.in_(ids)))
+            conn.execute(depend.delete().where(depend.c.child_id.in_(ids)))
+            conn.execute(db._pending_table.delete().where(db._pending_table.c.id.in_(ids)))
+            deleted.update(ids)
+        for id, original, status in dups:
+            if id in deleted:
+                print(id, 'is unstarted dup of', original, '...  deleted')
+            else:
+                print(id, 'is dup with results or children of', original)
+
+
+@cmd
+def summarize(db, args=(), **kwargs):
+    """Summarize a result key by the values of other keys (summarize <key> [<group key>...])"""
+    if not args:
+        print('Usage: jobman analyze --addr=<db> summarize <key> [<group key>...]')
+        return
+    key, group_keys = args[0], args[1:]
+    kv = db._pair_table
+    result = kv.alias('result')
+    groups = [kv.alias('group%i' % i) for i in range(len(group_keys))]
+
+    # numeric value of the result
+    value = func.coalesce(result.c.fval, result.c.ival)
+    from_ = result
+    for group, group_key in zip(groups, group_keys):
+        from_ = from_.join(group, and_(group.c.dict_id == result.c.dict_id,
+                                       group.c.name == group_key))
+    group_columns = []
+    for group in groups:
+        group_columns.extend(_value_columns(group))
+    q = (select(group_columns + [func.count(result.c.dict_id), func.avg(value),
+                                 func.min(value), func.max(value)])
+         .select_from(from_)
+         .where(result.c.name == key)
+         .where(result.c.type.in_(['i', 'f'])))
+    if group_columns:
+        q = q.group_by(*group_columns).order_by(*group_columns)
+
+    n = len(_VALUE_COLUMNS)
+    print('\t'.join(list(group_keys) + ['count', 'mean', 'min', 'max']))
+    conn = db._engine.connect()
+    try:
+        for row in conn.execute(q):
+            groups_values = [_keyval_value(*row[i * n:(i + 1) * n])
+                             for i in range(len(group_keys))]
+            count, mean, min_, max_ = row[len(group_keys) * n:]
+            if not count:
+                # Without groups, the query returns a row (count 0, NULL
+                # mean, min and max) even if no job has a value
+                continue
+            print('\t'.join([repr(v) for v in groups_values] +
+                            ['%i' % count, '%g' % mean, '%g' % min_, '%g' % max_]))
+    finally:
+        conn.close()
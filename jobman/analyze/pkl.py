@@ -1,5 +1,5 @@
 import os
-from ..expdir.pkl import load_all, args_filename, results_filename
+from ..expdir.pkl import load_all, iter_dups, args_filename
 from ..analyze_runner import cmd
 
 ######################
@@ -9,36 +9,25 @@ from ..analyze_runner import cmd
 @cmd
 def list_jobs(exproot, **kwargs):
     """List jobs in the experiment"""
-    for jobname, args, results in load_all(exproot):
-        print jobname, args, results
+    for jobname, args, results in load_all(exproot, results=True):
+        print(jobname, args, results)
 
 @cmd
 def list_dups(exproot, **kwargs):
     """List duplicate jobs in the experiment"""
-    seen_args = []
-    seen_names = []
-    for jobname, args, results in load_all(exproot):
-        if args in seen_args:
-            print jobname, 'is dup of', seen_names[seen_args.index(args)]
-        elif args != None:
-            seen_args.append(args)
-            seen_names.append(jobname)
+    for jobname, original in iter_dups(exproot):
+        print(jobname, 'is dup of', original)
 @cmd
 def del_dups(exproot, **kwargs):
     """Delete duplicate jobs in the experiment"""
-    seen_args = []
-    seen_names = []
-    for jobname, args, results in load_all(exproot):
-        if args in seen_args:
-            if os.listdir(os.path.join(exproot, jobname)) == [args_filename]:
-                print jobname, 'is empty dup of', seen_names[seen_args.index(args)],
-                print '...  deleting'
-                os.remove(os.path.join(exproot, jobname, args_filename))
-                os.rmdir(os.path.join(exproot, jobname))
-            else:
-                print jobname, 'is dup with files of', seen_names[seen_args.index(args)]
-        elif args != None:
-            seen_args.append(args)
-            seen_names.append(jobname)
+    # (the deleted jobs are dropped from the args index the next time it is
+    # loaded)
+    for jobname, original in iter_dups(exproot):
+        if os.listdir(os.path.join(exproot, jobname)) == [args_filename]:
+            print(jobname, 'is empty dup of', original, '...  deleting')
+            os.remove(os.path.join(exproot, jobname, args_filename))
+            os.rmdir(os.path.join(exproot, jobname))
+        else:
+            print(jobname, 'is dup with files of', original)
 
 
@@ -19,7 +19,7 @@ parser_analyze.add_option('--addr', dest = 'addr',
         type = 'str', default = 'pkl://'+os.getcwd(),
         help = 'Address of experiment root (starting with format prefix such'
         ' as postgres:// or pkl:// or dd://')
-def runner_analyze(options, cmdname):
+def runner_analyze(options, cmdname, *args):
     """Analyze the state/results of the experiment
 
     Example usage:
@@ -27,6 +27,7 @@ def runner_analyze(options, cmdname):
         jobman analyze --extra=jobs --addr=pkl://relpath/to/experiment <cmd>
         jobman analyze --extra=jobs --addr=pkl:///abspath/to/experiment <cmd>
         jobman analyze --extra=jobs --addr=postgres://user@host:dbname?table=tablename <cmd>
+        jobman analyze --addr=sqlite:////abspath/to/db?table=tablename <cmd> [<args>...]
 
     Try jobman analyze help for more information.
     """
@@ -35,8 +36,9 @@ def runner_analyze(options, cmdname):
         from .analyze import pkl
         exproot = options.addr[len('pkl://'):]
     elif options.addr.startswith('postgres://') or options.addr.startswith('sqlite://'):
-        raise NotImplementedError()
         from .analyze import pg
+        from .api0 import open_db
+        db = open_db(options.addr)
     elif options.addr.startswith('dd://'):
         raise NotImplementedError()
         from .analyze import dd
@@ -2,6 +2,7 @@
 This file defines class `DbHandle` and a few routines for creating instances of DbHandle.
 
 """
+import datetime
 import logging
 import time
 import random
@@ -13,7 +14,7 @@ if sql.sqlalchemy_ok:
 
     from sqlalchemy import create_engine  # , desc
     from sqlalchemy import (
-        Table, Column, MetaData, ForeignKeyConstraint  # ForeignKey,
+        Table, Column, MetaData, ForeignKeyConstraint, Index  # ForeignKey,
     )
     from sqlalchemy import (
         Integer, String, Float, DateTime, Text, LargeBinary as Binary  # Boolean,
@@ -44,6 +45,51 @@ class Todo(Exception):
     """Replace this with some working code!"""
 
 
+def _keyval_columns(val):
+    """Return the columns (type, ival, fval, sval, bval) of a key-value
+    row holding `val`."""
+    cols = dict(type=None, ival=None, fval=None, sval=None, bval=None)
+    if isinstance(val, str):
+        cols['type'] = 's'
+        cols['sval'] = val
+    elif isinstance(val, float):
+        cols['type'] = 'f'
+        # special cases
+        if str(val) in ('nan', 'inf', '-inf'):
+            # Special cases not handled by SQLAlchemy.
+            # To avoid crashes, setting value to None
+            cols['fval'] = None
+        else:
+            cols['fval'] = float(val)
+    elif isinstance(val, int):
+        cols['type'] = 'i'
+        cols['ival'] = int(val)
+    else:
+        cols['type'] = 'b'
+        bval = repr(val)
+        if isinstance(bval, str):
+            bval = bval.encode()
+
+        cols['bval'] = bval
+        assert eval(cols['bval']) == val
+    return cols
+
+
+def _keyval_value(type, ival, fval, sval, bval):
+    """Return the value held by a key-value row (see _keyval_columns)."""
+    if type == 'i':
+        return int(ival)
+    elif type == 'f':
+        if fval is None:
+            return float('nan')
+        return float(fval)
+    elif type == 'b':
+        return eval(bytes(bval))
+    elif type == 's':
+        return sval
+    raise ValueError('Incompatible value in column "type"', type)
+
+
 class DbHandle(object):
     """
     This class implements a persistant dictionary using an SQL database as storage.
@@ -73,7 +119,7 @@ class DbHandle(object):
 
             Column('id', Integer, primary_key=True)
             Column('create', DateTime)
-            Column('write', DateTime)
+            Column('write', DateTime)  # last heartbeat of a running job
             Column('read', DateTime)
 
             #TODO: reconsider create/read/write
@@ -99,10 +145,14 @@ class DbHandle(object):
 
     e_bad_table = 'incompatible columns in table'
 
-    def __init__(h_self, Session, engine, dict_table, pair_table):
+    def __init__(h_self, Session, engine, dict_table, pair_table,
+                 depend_table=None, pending_table=None):
         h_self._engine = engine
         h_self._dict_table = dict_table
         h_self._pair_table = pair_table
+        # dependencies between dictionaries, see add_dependencies
+        h_self._depend_table = depend_table
+        h_self._pending_table = pending_table
 
         # TODO: replace this crude algorithm (ticket #17)
         if ['id', 'create', 'write', 'read', 'status', 'priority', 'hash'] != [c.name for c in dict_table.c]:
@@ -111,6 +161,8 @@ class DbHandle(object):
             raise ValueError(h_self.e_bad_table, pair_table)
 
         h_self._session_fn = Session
+        # viewname -> (columns, mapped class), see createView
+        h_self._views = {}
 
         class KeyVal (object):
             """KeyVal interfaces between python types and the database.
@@ -125,52 +177,12 @@ class DbHandle(object):
                 return "<Param(%s,'%s', %s)>" % (k_self.id, k_self.name, repr(k_self.val))
 
             def __get_val(k_self):
-                val = None
-                if k_self.type == 'i':
-                    val = int(k_self.ival)
-                elif k_self.type == 'f':
-                    if k_self.fval is None:
-                        val = float('nan')
-                    else:
-                        val = float(k_self.fval)
-                elif k_self.type == 'b':
-                    val = eval(bytes(k_self.bval))
-                elif k_self.type == 's':
-                    val = k_self.sval
-                else:
-                    raise ValueError('Incompatible value in column "type"',
-                                     k_self.type)
-                return val
+                return _keyval_value(k_self.type, k_self.ival, k_self.fval,
+                                     k_self.sval, k_self.bval)
 
             def __set_val(k_self, val):
-                k_self.ival = None
-                k_self.fval = None
-                k_self.bval = None
-                k_self.sval = None
-
-                if isinstance(val, str):
-                    k_self.type = 's'
-                    k_self.sval = val
-                elif isinstance(val, float):
-                    k_self.type = 'f'
-                    # special cases
-                    if str(val) in ('nan', 'inf', '-inf'):
-                        # Special cases not handled by SQLAlchemy.
-                        # To avoid crashes, setting value to None
-                        k_self.fval = None
-                    else:
-                        k_self.fval = float(val)
-                elif isinstance(val, int):
-                    k_self.type = 'i'
-                    k_self.ival = int(val)
-                else:
-                    k_self.type = 'b'
-                    bval = repr(val)
-                    if isinstance(bval, str):
-                        bval = bval.encode()
-
-                    k_self.bval = bval
-                    assert eval(k_self.bval) == val
+                for name, v in _keyval_columns(val).items():
+                    setattr(k_self, name, v)
 
             val = property(__get_val, __set_val)
 
@@ -591,17 +603,82 @@ class DbHandle(object):
         if session is None:
             s = h_self.session()
             rval = h_self._Dict(s)
+            # used by sql.BookingPolicy to age the waiting jobs
+            rval.create = datetime.datetime.utcnow()
             if dct:
                 rval.update_simple(dct, session=s)
             s.commit()
             s.close()
         else:
             rval = h_self._Dict(session)
+            rval.create = datetime.datetime.utcnow()
             if dct:
                 rval.update_simple(dct, session=session)
             session.commit()
         return rval
 
+    def insert_many(h_self, dcts, after=()):
+        """Insert the dictionaries `dcts`, in a single transaction, and
+        return the list of their ids.
+
+        This is much faster than calling insert() for each of them: it is
+        done outside of the ORM, and the key-value pairs of all the
+        dictionaries are inserted by a single executemany.
+
+        With `after`, each dictionary waits for the jobs `after` (see
+        add_dependencies), in the same transaction: if a parent is missing,
+        nothing is inserted.
+        """
+        t = h_self._dict_table
+        kv = h_self._pair_table
+        now = datetime.datetime.utcnow()
+        ids = []
+        rows = []
+        with h_self._engine.begin() as conn:
+            for dct in dcts:
+                # the mirrored columns, as in Dict._set_in_session
+                cols = {'create': now}
+                if 'jobman.status' in dct:
+                    cols['status'] = int(dct['jobman.status'])
+                if 'jobman.sql.priority' in dct:
+                    cols['priority'] = float(dct['jobman.sql.priority'])
+                if 'jobman.hash' in dct:
+                    cols['hash'] = int(dct['jobman.hash'])
+                id = conn.execute(t.insert().values(**cols)).inserted_primary_key[0]
+                ids.append(id)
+                for k, v in dct.items():
+                    row = _keyval_columns(v)
+                    row['dict_id'] = id
+                    row['name'] = k
+                    rows.append(row)
+            if rows:
+                conn.execute(kv.insert(), rows)
+            if after:
+                for id in ids:
+                    h_self._add_dependencies(conn, id, after)
+        return ids
+
+    def get_many(h_self, ids, chunksize=500):
+        """Return a dict mapping each of the dictionaries `ids` to its
+        content (as a plain dict), read `chunksize` dictionaries per query.
+
+        Ids that are not in the table are left out.
+        """
+        kv = h_self._pair_table
+        ids = list(ids)
+        rval = {}
+        conn = h_self._engine.connect()
+        try:
+            for i in range(0, len(ids), chunksize):
+                q = select([kv.c.dict_id, kv.c.name, kv.c.type, kv.c.ival,
+                            kv.c.fval, kv.c.sval, kv.c.bval]).where(
+                    kv.c.dict_id.in_(ids[i:i + chunksize]))
+                for row in conn.execute(q):
+                    rval.setdefault(row[0], {})[row[1]] = _keyval_value(*row[2:])
+        finally:
+            conn.close()
+        return rval
+
     def query(h_self, session):
         """Construct an SqlAlchemy query, which can be subsequently filtered
         using the instance methods of DbQuery"""
@@ -685,12 +762,22 @@ class DbHandle(object):
         s.commit()
         s.close()
 
-        # Create mapper class for the view
+        # Create mapper class for the view, unless the view had the same
+        # columns the last time
+        signature = tuple((c.name, c.type.__class__) for c in cols)
+        try:
+            cached_signature, MappedView = h_self._views[viewname]
+            if cached_signature == signature:
+                return MappedView
+        except KeyError:
+            pass
+
         class MappedView(object):
             pass
 
         t_view = Table(viewname, MetaData(), *cols)
         mapper(MappedView, t_view)
+        h_self._views[viewname] = (signature, MappedView)
 
         return MappedView
 
@@ -713,6 +800,145 @@ class DbHandle(object):
     def session(h_self):
         return h_self._session_fn()
 
+    def create_indexes(h_self):
+        """Create the indexes missing from tables created by an older jobman.
+
+        (create_all() only creates the indexes of the tables it creates.)
+        """
+        for table in (h_self._dict_table, h_self._pair_table):
+            for index in table.indexes:
+                index.create(h_self._engine, checkfirst=True)
+
+    def utcnow(h_self, seconds_ago=0):
+        """Return an SQL expression for the current UTC time of the database
+        server, minus `seconds_ago` seconds.
+
+        The leases (see heartbeat) are written and compared with the clock
+        of the server, so that the clocks of the nodes running the jobs
+        don't have to agree.
+        """
+        from sqlalchemy import func
+        dialect = h_self._engine.dialect.name
+        if dialect == 'sqlite':
+            # (in the format of the sqlite DateTime columns of sqlalchemy)
+            return func.strftime('%Y-%m-%d %H:%M:%f000', 'now',
+                                 '-%f seconds' % seconds_ago)
+        if dialect == 'postgresql':
+            now = func.timezone('UTC', func.now())
+        else:
+            now = func.now()
+        if seconds_ago:
+            return now - datetime.timedelta(seconds=seconds_ago)
+        return now
+
+    def heartbeat(h_self, id):
+        """Set the `write` time of dictionary `id` to now (UTC, see utcnow).
+
+        This renews the lease of a running job (see sql.reap_expired_jobs).
+        It is done outside of the ORM, in a single statement, so it can run
+        from a background thread without interfering with the sessions.
+        """
+        t = h_self._dict_table
+        conn = h_self._engine.connect().execution_options(
+            isolation_level='AUTOCOMMIT')
+        try:
+            conn.execute(t.update().where(t.c.id == id).values(
+                write=h_self.utcnow()))
+        finally:
+            conn.close()
+
+    def _set_status(h_self, conn, ids, status, old_status):
+        """Set the status of the dictionaries `ids` whose status is
+        `old_status`, in the column and in the 'jobman.status' key."""
+        t = h_self._dict_table
+        kv = h_self._pair_table
+        conn.execute(t.update()
+                     .where(t.c.id.in_(ids))
+                     .where(t.c.status == old_status)
+                     .values(status=status))
+        conn.execute(kv.update()
+                     .where(kv.c.dict_id.in_(ids))
+                     .where(kv.c.name == 'jobman.status')
+                     .where(kv.c.ival == old_status)
+                     .values(ival=status))
+
+    def add_dependencies(h_self, id, parent_ids):
+        """Make dictionary (job) `id` wait for the jobs `parent_ids`.
+
+        Job `id` must have been inserted with status sql.WAITING, so that
+        it is not booked before this is done. It is set to sql.START when
+        all its parents are DONE (see release_children), right away if they
+        already are.
+        """
+        with h_self._engine.begin() as conn:
+            h_self._add_dependencies(conn, id, parent_ids)
+
+    def _add_dependencies(h_self, conn, id, parent_ids):
+        t = h_self._dict_table
+        parent_ids = sorted(set(int(p) for p in parent_ids))
+        # The parent rows are locked until the end of the transaction: a
+        # parent can't become DONE (and run release_children, which would
+        # not see the edges inserted below yet) between the read of its
+        # status and the commit. (sqlite has no FOR UPDATE, but it
+        # serializes the write transactions.)
+        status = dict(conn.execute(select([t.c.id, t.c.status])
+                                   .where(t.c.id.in_(parent_ids))
+                                   .with_for_update()).fetchall())
+        missing = [p for p in parent_ids if p not in status]
+        if missing:
+            raise ValueError('No job with id(s) %s' % missing)
+        conn.execute(h_self._depend_table.insert(), [
+            {'parent_id': p, 'child_id': id, 'done': int(status[p] == sql.DONE)}
+            for p in parent_ids])
+        pending = sum(1 for p in parent_ids if status[p] != sql.DONE)
+        if pending:
+            conn.execute(h_self._pending_table.insert(),
+                         {'id': id, 'parents': pending})
+        else:
+            h_self._set_status(conn, [id], sql.START, sql.WAITING)
+
+    def release_children(h_self, id, num_retries=5):
+        """Record that dictionary (job) `id` is DONE: the jobs waiting for
+        it (see add_dependencies) have one parent less to wait for, those
+        that have none left are set to sql.START.
+
+        It only updates counters, so that booking a job doesn't need to
+        look at its parents. Calling it again for the same job does nothing.
+
+        Returns the ids of the jobs set to START.
+        """
+        d = h_self._depend_table
+        p = h_self._pending_table
+        for i in range(num_retries):
+            try:
+                with h_self._engine.begin() as conn:
+                    children = [c for c, in conn.execute(
+                        select([d.c.child_id])
+                        .where(d.c.parent_id == id)
+                        .where(d.c.done == 0))]
+                    if not children:
+                        return []
+                    conn.execute(d.update()
+                                 .where(d.c.parent_id == id)
+                                 .values(done=1))
+                    conn.execute(p.update()
+                                 .where(p.c.id.in_(children))
+                                 .values(parents=p.c.parents - 1))
+                    ready = [c for c, in conn.execute(
+                        select([p.c.id])
+                        .where(p.c.id.in_(children))
+                        .where(p.c.parents <= 0))]
+                    if ready:
+                        conn.execute(p.delete().where(p.c.id.in_(ready)))
+                        h_self._set_status(conn, ready, sql.START, sql.WAITING)
+                    return ready
+            except sqlalchemy.exc.DBAPIError:
+                # a concurrent transaction (another parent finished)
+                # updated the same counters
+                if i == num_retries - 1:
+                    raise
+                time.sleep(random.random())
+
     def get(h_self, id):
         s = h_self.session()
         rval = s.query(h_self._Dict).get(id)
@@ -757,7 +983,11 @@ def db_from_engine(engine,
                     Column('read', DateTime),
                     Column('status', Integer),
                     Column('priority', Float(53)),
-                    Column('hash', BigInteger))
+                    Column('hash', BigInteger, index=True))
+    # Used by sql.reap_expired_jobs to find the RUNNING jobs whose
+    # heartbeat (the `write` column) stopped.
+    Index(table_prefix + trial_suffix + '_status_write',
+          t_trial.c.status, t_trial.c.write)
 
     t_keyval = Table(table_prefix + keyval_suffix, metadata,
                      Column('id', Integer, primary_key=True),
@@ -771,13 +1001,27 @@ def db_from_engine(engine,
                      Column('bval', Binary),
                      ForeignKeyConstraint(['dict_id'], [table_prefix + trial_suffix + '.id'], ondelete='CASCADE'))
 
+    # Dependencies between trials: an edge is done when its parent is DONE
+    t_depend = Table(table_prefix + 'depend', metadata,
+                     Column('id', Integer, primary_key=True),
+                     Column('parent_id', Integer, index=True, nullable=False),
+                     Column('child_id', Integer, index=True, nullable=False),
+                     Column('done', Integer, nullable=False),
+                     ForeignKeyConstraint(['parent_id'], [table_prefix + trial_suffix + '.id'], ondelete='CASCADE'),
+                     ForeignKeyConstraint(['child_id'], [table_prefix + trial_suffix + '.id'], ondelete='CASCADE'))
+    # Number of parents not DONE yet of each WAITING trial
+    t_pending = Table(table_prefix + 'pending', metadata,
+                      Column('id', Integer, primary_key=True),
+                      Column('parents', Integer, nullable=False),
+                      ForeignKeyConstraint(['id'], [table_prefix + trial_suffix + '.id'], ondelete='CASCADE'))
+
     # , ForeignKey('%s.id' % t_trial)),
     metadata.bind = engine
     metadata.create_all()  # no-op when tables already exist
     # warning: tables can exist, but have incorrect schema
     # see bug mentioned in DbHandle constructor
 
-    db = DbHandle(Session, engine, t_trial, t_keyval)
+    db = DbHandle(Session, engine, t_trial, t_keyval, t_depend, t_pending)
     db.tablename = table_prefix
     db.dbname = dbname
     return db
@@ -829,19 +1073,46 @@ def parse_dbstring(dbstring):
         else:
             raise ValueError('no table name provided (add ?table=tablename)')
 
+    # URL objects are immutable
     if url.drivername == 'sqlite':
-        url.database = os.path.abspath(url.database)
-        url.query['dbname'] = 'SQLITE_DB'
+        url = url.set(database=os.path.abspath(url.database))
+        url = url.update_query_dict({'dbname': 'SQLITE_DB'})
 
     if url.password is None and url.drivername != 'sqlite':
-        url.password = get_password(url.host, url.database)
+        url = url.set(password=get_password(url.host, url.database))
 
     return url
 
 
-def open_db(dbstr, echo=False, serial=False, poolclass=sqlalchemy.pool.NullPool, **kwargs):
+# DbHandles returned by open_db, see its `cache` argument
+_db_handles = {}
+
+
+def clear_db_cache():
+    """Forget the DbHandles cached by open_db."""
+    for db in _db_handles.values():
+        db._engine.dispose()
+    _db_handles.clear()
+
+
+def open_db(dbstr, echo=False, serial=False, poolclass=sqlalchemy.pool.NullPool,
+            cache=True, **kwargs):
     """Create an engine to access a DbHandle.
+
+    If `cache` is True, the DbHandle is kept, and returned again by the
+    next calls with the same arguments in this process: the engine, the
+    mapped classes and the check of the tables are only done once.
     """
+    if cache:
+        key = (dbstr, echo, serial, poolclass, tuple(sorted(kwargs.items())))
+        try:
+            return _db_handles[key]
+        except KeyError:
+            db = _db_handles[key] = open_db(dbstr, echo=echo, serial=serial,
+                                            poolclass=poolclass, cache=False,
+                                            **kwargs)
+            return db
+
     url = parse_dbstring(dbstr)
 
     query = dict(url.query)
@@ -2,11 +2,10 @@ import sys
 import os
 import subprocess
 import os.path
-import glob
 import time
 import copy
 
-from .tools import DD, filemerge
+from .tools import DD, load_conf, load_conf_files, iter_job_dirs
 from .sql import RUNNING, DONE
 
 from optparse import OptionParser
@@ -183,9 +182,11 @@ class DistributedLock(object):
         return "DistributedLock(" + str(self.host_string) + ", " + str(self.lock_path) + ")"
 
 
-def sync_single_directory(dir_path, all_jobs=None, force=False):
-    if not all_jobs:
-        conf = DD(filemerge(os.path.join(dir_path, 'current.conf')))
+def sync_single_directory(dir_path, all_jobs=None, force=False, conf=None):
+    if conf is not None:
+        conf = DD(conf)
+    elif not all_jobs:
+        conf = DD(load_conf(os.path.join(dir_path, 'current.conf')))
     else:
         conf = [i for i in all_jobs if str(i.id) == os.path.split(dir_path)[-1]]
         assert len(conf) == 1
@@ -232,22 +233,18 @@ def perform_sync(dir_path, conf):
 
 
 def sync_all_directories(base_dir, all_jobs=None, force=False):
-    oldcwd = os.getcwd()
-    os.chdir(base_dir)
+    all_confs = [conf for dir, conf in iter_job_dirs(base_dir, recurse=False)]
 
-    all_dirs = glob.glob("*/current.conf")
-
-    if len(all_dirs) == 0:
+    if len(all_confs) == 0:
         print("No subdirectories containing a file named 'current.conf' found.")
 
-    os.chdir(oldcwd)
-
-    for dir_and_file in all_dirs:
-        dir, file = dir_and_file.split("/")
-
-        full_path = os.path.join(base_dir, dir)
-
-        sync_single_directory(full_path, all_jobs, force)
+    if all_jobs:
+        for conf in all_confs:
+            sync_single_directory(os.path.dirname(conf), all_jobs, force)
+    else:
+        # (read one by one: the time goes into syncing each job)
+        for conf, state in load_conf_files(all_confs):
+            sync_single_directory(os.path.dirname(conf), all_jobs, force, conf=state)
 
 
 def cachesync_runner(options, dir):
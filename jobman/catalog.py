@@ -0,0 +1,207 @@
+"""
+Catalog of the job states in a table directory (<exproot>/<dbname>/<tablename>).
+
+The flattened state of each job (its current.conf, or current.jbin) is
+indexed by key and value in a SQLite file in the table directory. The
+catalog is brought up to date incrementally: only the jobs whose state
+files changed since the last refresh are read again.
+
+"""
+import os
+import pickle
+import sqlite3
+import sys
+
+from .tools import load_conf_files, binary_state_path
+
+CATALOG_NAME = '.jobman_catalog.sqlite'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    name TEXT PRIMARY KEY,
+    mtime INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS kv (
+    job TEXT NOT NULL,
+    key TEXT NOT NULL,
+    num REAL,
+    text TEXT,
+    val BLOB
+);
+"""
+
+# (statements run one by one with execute(): executescript() would commit
+# the transaction of refresh())
+_INDEXES = [
+    'CREATE INDEX IF NOT EXISTS kv_job ON kv (job)',
+    'CREATE INDEX IF NOT EXISTS kv_num ON kv (key, num)',
+    'CREATE INDEX IF NOT EXISTS kv_text ON kv (key, text)',
+]
+
+_DROP_INDEXES = [
+    'DROP INDEX IF EXISTS kv_job',
+    'DROP INDEX IF EXISTS kv_num',
+    'DROP INDEX IF EXISTS kv_text',
+]
+
+# When more jobs than this changed, the indexes are rebuilt after the
+# update rather than maintained during it.
+_BULK_UPDATE = 1000
+
+
+def _index_value(value):
+    """Return the (num, text) columns used to match `value`.
+
+    Numbers are compared as numbers (so 1 matches 1.0, as in python),
+    other values by their repr.
+    """
+    if isinstance(value, (int, float)):
+        return float(value), None
+    return None, repr(value)
+
+
+def _state_mtime(confdir):
+    """Return the modification time of the state files in `confdir`, or
+    None if there is no current.conf."""
+    conf = os.path.join(confdir, 'current.conf')
+    try:
+        mtime = os.stat(conf).st_mtime_ns
+    except OSError:
+        return None
+    try:
+        mtime = max(mtime, os.stat(binary_state_path(conf)).st_mtime_ns)
+    except OSError:
+        pass
+    return mtime
+
+
+class Catalog(object):
+    """Index of the states of the jobs in the table directory `table_dir`.
+
+    If the catalog file can't be written in `table_dir` (e.g. it belongs
+    to someone else), an in-memory catalog is used instead.
+    """
+
+    def __init__(self, table_dir, path=None):
+        self.table_dir = table_dir
+        if path is None:
+            path = os.path.join(table_dir, CATALOG_NAME)
+        try:
+            self.conn = sqlite3.connect(path, timeout=60)
+            self.conn.executescript(_SCHEMA + ';\n'.join(_INDEXES))
+        except sqlite3.Error as e:
+            print('WARNING: cannot use the catalog %s (%s), using a temporary one' % (
+                path, e), file=sys.stderr)
+            self.conn = sqlite3.connect(':memory:')
+            self.conn.executescript(_SCHEMA + ';\n'.join(_INDEXES))
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type_, value, traceback):
+        self.close()
+
+    def refresh(self, processes=None):
+        """Index the jobs whose state changed since the last refresh, and
+        forget the jobs that were removed.
+
+        `processes` is the number of processes reading the state files
+        (see tools.load_conf_files).
+
+        Returns the number of jobs (re)indexed and of jobs removed.
+        """
+        known = dict(self.conn.execute('SELECT name, mtime FROM jobs'))
+        seen = set()
+        changed = []
+        for entry in os.scandir(self.table_dir):
+            if not entry.is_dir():
+                continue
+            mtime = _state_mtime(entry.path)
+            if mtime is None:
+                continue
+            seen.add(entry.name)
+            if known.get(entry.name) != mtime:
+                changed.append((entry.name, mtime))
+        removed = [name for name in known if name not in seen]
+
+        bulk = len(changed) > _BULK_UPDATE
+        with self.conn:
+            # (sqlite3 only starts the transaction by itself before the
+            # first INSERT or DELETE)
+            if not self.conn.in_transaction:
+                self.conn.execute('BEGIN')
+            for name in removed:
+                self._forget(name)
+            for name, mtime in changed:
+                if name in known:
+                    self._forget(name)
+            if bulk:
+                for statement in _DROP_INDEXES:
+                    self.conn.execute(statement)
+            mtimes = dict(changed)
+            paths = [os.path.join(self.table_dir, name, 'current.conf') for name, mtime in changed]
+            for path, state in load_conf_files(paths, processes=processes):
+                name = os.path.basename(os.path.dirname(path))
+                self.conn.execute('INSERT INTO jobs (name, mtime) VALUES (?, ?)',
+                                  (name, mtimes[name]))
+                self.conn.executemany(
+                    'INSERT INTO kv (job, key, num, text, val) VALUES (?, ?, ?, ?, ?)',
+                    self._rows(name, state))
+            if bulk:
+                for statement in _INDEXES:
+                    self.conn.execute(statement)
+        return len(changed), len(removed)
+
+    def _forget(self, name):
+        self.conn.execute('DELETE FROM jobs WHERE name = ?', (name,))
+        self.conn.execute('DELETE FROM kv WHERE job = ?', (name,))
+
+    def _rows(self, name, state):
+        for key, value in state.items():
+            num, text = _index_value(value)
+            try:
+                val = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+            except Exception:
+                val = None
+            yield name, key, num, text, val
+
+    def jobs(self):
+        """Return the names of all the jobs in the catalog, job ids in
+        numerical order first."""
+        names = [name for name, in self.conn.execute('SELECT name FROM jobs')]
+        names.sort(key=lambda name: (0, int(name), '') if name.isdigit() else (1, 0, name))
+        return names
+
+    def find(self, key, values):
+        """Return the set of the jobs in which `key` has one of `values`."""
+        rval = set()
+        for value in values:
+            num, text = _index_value(value)
+            if num is not None:
+                q = self.conn.execute('SELECT job FROM kv WHERE key = ? AND num = ?',
+                                      (key, num))
+            else:
+                q = self.conn.execute('SELECT job FROM kv WHERE key = ? AND text = ?',
+                                      (key, text))
+            rval.update(job for job, in q)
+        return rval
+
+    def values(self, key):
+        """Return a dict mapping the jobs that have `key` to
+        (value, text) where text is the string used to match the value."""
+        rval = {}
+        q = self.conn.execute('SELECT job, num, text, val FROM kv WHERE key = ?', (key,))
+        for job, num, text, val in q:
+            value = None
+            if val is not None:
+                try:
+                    value = pickle.loads(val)
+                except Exception:
+                    val = None
+            if val is None:
+                value = num if num is not None else text
+            rval[job] = (value, text if num is None else repr(num))
+        return rval
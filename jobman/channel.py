@@ -3,7 +3,9 @@ import sys
 import os
 import time
 import traceback
-from .tools import format_d, expand, defaults_merge, filemerge
+from .tools import (flatten, expand, defaults_merge, filemerge, load_conf,
+                    binary_state_path, dump_binary_state, atomic_write,
+                    write_state_file, state_file_complete)
 
 
 ################################################################################
@@ -137,21 +139,83 @@ class SingleChannel(Channel):
         else:
             self.save_interval = None
 
+        # If set, the interval between 'save' requests is stretched so that
+        # saving takes at most this fraction of the wall time (based on the
+        # mean duration of the saves so far).
+        self.max_save_fraction = None
+
+        # Deadlines on the time.monotonic() clock, set by __enter__. switch()
+        # only looks at the clock once next_deadline is passed.
+        self.finish_up_deadline = None
+        self.save_deadline = None
+        self.next_deadline = None
+
+        # Every call to save() is timed; the totals are recorded in
+        # state.jobman.save_count and state.jobman.save_time.
+        self.save_count = 0
+        self.save_time = 0.0
+
     def switch(self, message=None):
-        now = time.time()
-        if self.feedback is None and not self.finish_up_notified:
-            if self.finish_up_after is not None and\
-                    now - self.start_time > self.finish_up_after:
-                self.finish_up_notified = True
-                return 'finish-up'
-            if self.save_interval is not None and\
-                    now - self.last_saved_time > self.save_interval:
-                self.last_saved_time = now
-                return 'save'
-        else:
-            feedback = self.feedback
+        # This is called very often (e.g. at every minibatch), keep the
+        # common case cheap: the signal handlers only set self.feedback.
+        feedback = self.feedback
+        if feedback is not None:
             self.feedback = None
             return feedback
+        if self.next_deadline is None:
+            return None
+        now = time.monotonic()
+        if now < self.next_deadline:
+            return None
+
+        if self.finish_up_deadline is not None and now >= self.finish_up_deadline:
+            self.finish_up_notified = True
+            self.finish_up_deadline = None
+            self.save_deadline = None
+            self.next_deadline = None
+            return 'finish-up'
+        self.save_deadline = now + self.current_save_interval()
+        self._update_next_deadline()
+        return 'save'
+
+    def current_save_interval(self):
+        """Return the interval until the next 'save' request.
+
+        This is `save_interval`, unless saving is slow enough that it would
+        take more than `max_save_fraction` of the time.
+        """
+        interval = self.save_interval
+        if self.max_save_fraction and self.save_count:
+            mean_save_time = self.save_time / self.save_count
+            stretched = mean_save_time * (1 - self.max_save_fraction) / self.max_save_fraction
+            interval = max(interval, stretched)
+        return interval
+
+    def _update_next_deadline(self):
+        deadlines = [d for d in (self.finish_up_deadline, self.save_deadline)
+                     if d is not None]
+        self.next_deadline = min(deadlines) if deadlines else None
+
+    def save(self, *args, **kwargs):
+        # Subclasses save the state in _save(); this times it.
+        # The time spent in the save being done is only recorded by the next.
+        self.state.jobman.save_count = self.save_count + 1
+        self.state.jobman.save_time = self.save_time
+        t0 = time.monotonic()
+        try:
+            return self._save(*args, **kwargs)
+        finally:
+            now = time.monotonic()
+            self.save_count += 1
+            self.save_time += now - t0
+            # The state was just saved, wait a full interval before asking
+            # for the next save.
+            if self.save_deadline is not None:
+                self.save_deadline = now + self.current_save_interval()
+                self._update_next_deadline()
+
+    def _save(self):
+        raise NotImplementedError()
 
     def run(self, force=False):
         self.setup()
@@ -212,6 +276,13 @@ class SingleChannel(Channel):
         self.start_time = time.time()
         self.last_saved_time = self.start_time
         self.state.jobman.start_time = self.start_time
+
+        now = time.monotonic()
+        if self.finish_up_after is not None and not self.finish_up_notified:
+            self.finish_up_deadline = now + self.finish_up_after
+        if self.save_interval is not None and not self.finish_up_notified:
+            self.save_deadline = now + self.save_interval
+        self._update_next_deadline()
         self.save()
         return self
 
@@ -268,6 +339,17 @@ class StandardChannel(SingleChannel):
         self.path = os.path.realpath(path)
         self.redirect_stdout = redirect_stdout
         self.redirect_stderr = redirect_stderr
+        # Also save the state in the binary format next to current.conf. It
+        # is much faster to read back than the text file for large states.
+        self.save_binary = True
+        # State files are fsync'ed every `fsync_every` saves (0 means never).
+        # The last save, when the experiment returns, is always fsync'ed.
+        # Raising it makes frequent checkpoints cheaper, at the risk of losing
+        # the last few of them (not of corrupting the files) if the node
+        # crashes.
+        self.fsync_every = 1
+        self.n_unsynced_saves = 0
+        self.fsync_next_save = False
 
     def realpath(self, path):
         if os.getcwd() == self.path:
@@ -278,15 +360,37 @@ class StandardChannel(SingleChannel):
 
         return os.path.realpath(path)
 
-    def save(self):
+    def _save(self):
         sys.stdout.flush()
         sys.stderr.flush()
-        current = open(os.path.join(self.path, 'current.conf'), 'w')
+        currentf = os.path.join(self.path, 'current.conf')
+        flat = flatten(self.state)
+
+        self.n_unsynced_saves += 1
+        fsync = self.fsync_next_save or (
+            self.fsync_every and self.n_unsynced_saves >= self.fsync_every)
+        if fsync:
+            self.n_unsynced_saves = 0
+            self.fsync_next_save = False
+
+        # The previous version is kept in current.conf.prev, for setup() to
+        # fall back on if current.conf is ever found incomplete.
+        write_state_file(currentf, flat, fsync=fsync, backup=currentf + '.prev')
+        if self.save_binary:
+            self.save_binary_state(currentf, flat, fsync)
+
+    def save_binary_state(self, conf_path, flat, fsync=True):
+        bin_path = binary_state_path(conf_path)
         try:
-            current.write(format_d(self.state))
-            current.write('\n')
-        finally:
-            current.close()
+            data = dump_binary_state(flat)
+        except Exception as e:
+            # Some value can't be pickled: only keep the text version, and
+            # make sure a stale binary file won't be read instead.
+            print('WARNING: not saving the binary state: %s' % e, file=sys.stderr)
+            if os.path.exists(bin_path):
+                os.remove(bin_path)
+            return
+        atomic_write(bin_path, data, fsync=fsync)
 
     def __enter__(self):
         self.old_cwd = os.getcwd()
@@ -311,27 +415,45 @@ class StandardChannel(SingleChannel):
             new_stderr.close()
 
         os.chdir(self.old_cwd)
+        self.fsync_next_save = True
         self.save()
         return rval
 
+    def load_current(self):
+        """Return the flat state saved in current.conf (or current.jbin).
+
+        If current.conf is incomplete (it was written by a process killed in
+        the middle of the write by an older jobman), the previous version,
+        current.conf.prev, is used instead. Returns None if there is no saved
+        state.
+        """
+        currentf = os.path.join(self.path, 'current.conf')
+        prevf = currentf + '.prev'
+        if os.path.isfile(currentf):
+            # Files without the trailer were written by an older jobman, we
+            # can only check them if we have something to fall back on.
+            if not os.path.isfile(prevf) or state_file_complete(currentf):
+                return load_conf(currentf)
+            print('WARNING: %s is incomplete, using the last good snapshot %s' % (
+                currentf, prevf), file=sys.stderr)
+        if os.path.isfile(prevf):
+            return filemerge(prevf)
+        return None
+
     def setup(self):
         if not os.path.isdir(self.path):
             os.makedirs(self.path)
+        # Read the saved state before __enter__ saves the new one over it
+        # (and makes the saved one the backup).
+        current = self.load_current()
         # Python 2.4 compatibility: do not use `with` statement.
         self.__enter__()
         try:
             origf = os.path.join(self.path, 'orig.conf')
             if not os.path.isfile(origf):
-                orig = open(origf, 'w')
-                try:
-                    orig.write(format_d(self.state))
-                    orig.write('\n')
-                finally:
-                    orig.close()
-            currentf = os.path.join(self.path, 'current.conf')
-            if os.path.isfile(currentf):
-                current_data = list(map(str.strip, open(currentf, 'r').readlines()))
-                state = expand(filemerge(*current_data))
+                write_state_file(origf, self.state)
+            if current is not None:
+                state = expand(current)
                 defaults_merge(self.state, state)
         except Exception:
             # The exception info is passed to the __exit__ method which will
@@ -5,14 +5,13 @@ from __future__ import division
 from past.utils import old_div
 from subprocess import Popen, PIPE
 import os
-import re
 import time
+import xml.etree.ElementTree as ElementTree
 from optparse import OptionParser
 
 from . import sql
 from .runner import runner_registry
 from .tools import UsageError
-from .api0 import open_db
 
 parse_check = OptionParser(usage='%prog check <tablepath> ',
                            add_help_option=False)
@@ -26,14 +25,194 @@ def str_time(run_time):
     return run_time
 
 
-def check_running_pbs_jobs(r, now):
+################################################################################
+# Parsers for the output of the jobs schedulers' status commands
+################################################################################
+
+def expand_sge_tasks(tasks):
+    """Return the list of the task ids in a qstat ja-task-ID field.
+
+    >>> expand_sge_tasks('1,4-8:2')
+    ['1', '4', '6', '8']
+    """
+    rval = []
+    for part in tasks.split(','):
+        if '-' in part:
+            first, rest = part.split('-', 1)
+            if ':' in rest:
+                last, step = rest.split(':', 1)
+            else:
+                last, step = rest, 1
+            rval.extend(str(t) for t in range(int(first), int(last) + 1, int(step)))
+        elif part:
+            rval.append(part)
+    return rval
+
+
+def parse_sge_qstat(out):
+    """Parse the output of SGE's `qstat`.
+
+    Return a dict mapping (job id, task id) to the state of the task. The
+    task id of jobs that are not array jobs is 'undefined' (the value of
+    SGE_TASK_ID for those jobs).
+
+    qstat output:
+
+    job-ID  prior   name       user         state submit/start at     queue                          slots ja-task-ID
+    -----------------------------------------------------------------------------------------------------------------
+     776410 0.50000 dbi_6a5f45 bastienf     r     10/18/2010 13:26:46 smp@r106-n72                       1 1
+      776410 0.50000 dbi_6a5f45 bastienf     r     10/18/2010 13:26:46 smp@r106-n72                       1 2
+       776415 0.00000 dbi_5381a1 bastienf     qw    10/18/2010 13:30:21                                    1 1,2
+
+    >>> sorted(parse_sge_qstat(' 776415 0.00000 dbi_5381a1 bastienf     qw'
+    ...                        '    10/18/2010 13:30:21     1 1,2\\n').items())
+    [(('776415', '1'), 'qw'), (('776415', '2'), 'qw')]
+    """
+    rval = {}
+    for line in out.splitlines():
+        sp = line.split()
+        if len(sp) < 8 or sp[0] == 'job-ID' or line.startswith('---'):
+            continue
+        job_id, state = sp[0], sp[4]
+        # After the date and time: [queue] slots [ja-task-ID]. The queue is
+        # only there for running jobs.
+        rest = sp[7:]
+        if not rest[0].isdigit():
+            rest = rest[1:]
+        if len(rest) > 1:
+            tasks = expand_sge_tasks(rest[1])
+        else:
+            tasks = ['undefined']
+        for task in tasks:
+            rval[(job_id, task)] = state
+    return rval
+
+
+def parse_pbs_qstat_xml(out):
+    """Parse the output of Torque/PBS's `qstat -x`.
+
+    Return a dict mapping the job ids to dicts with the `job_state` and the
+    `walltime` (None if not set) of the job. The job ids are also
+    available without the server name.
+
+    >>> parse_pbs_qstat_xml('<Data><Job><Job_Id>12.srv</Job_Id>'
+    ...                     '<job_state>R</job_state><Resource_List>'
+    ...                     '<walltime>48:00:00</walltime></Resource_List>'
+    ...                     '</Job></Data>')['12']['walltime']
+    '48:00:00'
+    """
+    rval = {}
+    if not out.strip():
+        return rval
+    for job in ElementTree.fromstring(out).iter('Job'):
+        job_id = job.findtext('Job_Id')
+        if job_id is None:
+            continue
+        info = {'job_state': job.findtext('job_state'),
+                'walltime': job.findtext('Resource_List/walltime')}
+        rval[job_id] = info
+        rval.setdefault(job_id.split('.')[0], info)
+    return rval
+
+
+def parse_condor_q(out):
+    """Parse the output of `condor_q -af GlobalJobId JobStatus`.
+
+    Return a dict mapping the GlobalJobId to the JobStatus (as a string).
+
+    >>> parse_condor_q('srv#12.0#1287 2\\n')
+    {'srv#12.0#1287': '2'}
+    """
+    rval = {}
+    for line in out.splitlines():
+        sp = line.split()
+        if len(sp) == 2:
+            rval[sp[0]] = sp[1]
+    return rval
+
+
+def parse_condor_status(out):
+    """Parse the output of
+    `condor_status -af Name State Activity RemoteUser RemoteOwner`.
+
+    Return a dict mapping the slot names to the list of the other fields.
+    Undefined fields are 'undefined'.
+
+    >>> parse_condor_status('slot1@brams0b Claimed Busy bob@x bob@x\\n')
+    {'slot1@brams0b': ['Claimed', 'Busy', 'bob@x', 'bob@x']}
+    """
+    rval = {}
+    for line in out.splitlines():
+        sp = line.split()
+        if sp:
+            rval[sp[0]] = sp[1:]
+    return rval
+
+
+def run_command(cmd):
+    """Return the exit code and the output of the shell command `cmd`."""
+    p = Popen(cmd, shell=True, stdout=PIPE, stderr=PIPE)
+    out, err = p.communicate()
+    return p.returncode, out.decode('utf-8', 'replace')
+
+
+class SchedulerQueues(object):
+    """Run each jobs scheduler's status command at most once, and keep its
+    parsed output. The result of each method is (exit code, index).
+    """
+
+    def __init__(self):
+        self._cache = {}
+
+    def _get(self, key, cmd, parse):
+        if key not in self._cache:
+            ret, out = run_command(cmd)
+            try:
+                index = parse(out)
+            except Exception as e:
+                print("W: could not parse the output of `%s`: %s" % (cmd, e))
+                index = {}
+            self._cache[key] = (ret, index)
+        return self._cache[key]
+
+    def sge(self):
+        return self._get('sge', 'qstat', parse_sge_qstat)
+
+    def pbs(self):
+        return self._get('pbs', 'qstat -x -t', parse_pbs_qstat_xml)
+
+    def condor_q(self, submit_host):
+        # take care of the quotation, condor resquest that "" be used
+        # around string.
+        return self._get(('condor_q', submit_host),
+                         "condor_q -name '%s' -af GlobalJobId JobStatus" % submit_host,
+                         parse_condor_q)
+
+    def condor_status(self):
+        return self._get('condor_status',
+                         'condor_status -af Name State Activity RemoteUser RemoteOwner',
+                         parse_condor_status)
+
+
+################################################################################
+# Checks
+################################################################################
+
+def parse_walltime(walltime_str):
+    """Return the number of seconds in a [[dd:]hh:]mm:ss walltime."""
+    seconds = 0
+    for factor, part in zip((1, 60, 3600, 24 * 3600),
+                            reversed(walltime_str.split(':'))):
+        seconds += factor * int(part)
+    return seconds
+
+
+def check_running_pbs_jobs(r, now, queues):
     """ Verify jobs on Torque/PBS system"""
-    p = Popen('qstat -x %s' % r['jobman.sql.pbs_task_id'],
-              shell=True, stdout=PIPE, stderr=PIPE)
-    ret = p.wait()
-    out = p.stdout.read()
+    ret, index = queues.pbs()
+    job = index.get(r['jobman.sql.pbs_task_id'])
 
-    if len(out) == 0:
+    if job is None:
         print("E: Job %d marked as PBS job '%s',"
               " but 'qstat' don't know it." % (
                   r.id, r['jobman.sql.pbs_task_id']))
@@ -43,22 +222,17 @@ def check_running_pbs_jobs(r, now):
 
     # check runtime
     # <walltime>48:00:00</walltime>
-    ressource_str = re.search('<Resource_List>.*</Resource_List>',
-                              out).group(0)
-    walltime_str = re.search('<walltime>.*?</walltime>', ressource_str)
-    walltime_str = walltime_str.group(0)[10:-11]
-    assert walltime_str[2] == ':' and walltime_str[5] == ':'
-    walltime = (int(walltime_str[:2]) * 60 * 60 +
-                int(walltime_str[3:5]) * 60 +
-                int(walltime_str[-2:]))
-    if now - int(r["jobman.sql.start_time"]) > walltime:
-        print("W: Job %d is running for more then the specified"
-              " max time of %s. Run time %s" % (
-                  r.id, walltime_str, run_time))
+    walltime_str = job['walltime']
+    if walltime_str:
+        walltime = parse_walltime(walltime_str)
+        if now - int(r["jobman.sql.start_time"]) > walltime:
+            print("W: Job %d is running for more then the specified"
+                  " max time of %s. Run time %s" % (
+                      r.id, walltime_str, run_time))
 
     # check state
     # <job_state>R</job_state>
-    state_str = re.search('<job_state>.*</job_state>', out).group(0)[11:-12]
+    state_str = job['job_state']
     if state_str == "R":
         pass
     elif state_str == "Q":
@@ -74,56 +248,108 @@ def check_running_pbs_jobs(r, now):
               " state in the queue '%s'" % (r.id, state_str))
 
 
-def check_running_sge_jobs(r, now):
-    p = Popen('qstat', shell=True, stdout=PIPE)
-    ret = p.wait()
-    lines = p.stdout.readlines()
-    """
-                qstat output:
-
-                job-ID  prior   name       user         state submit/start at     queue                          slots ja-task-ID
-                -----------------------------------------------------------------------------------------------------------------
-                 776410 0.50000 dbi_6a5f45 bastienf     r     10/18/2010 13:26:46 smp@r106-n72                       1 1
-                  776410 0.50000 dbi_6a5f45 bastienf     r     10/18/2010 13:26:46 smp@r106-n72                       1 2
-                   776415 0.00000 dbi_5381a1 bastienf     qw    10/18/2010 13:30:21                                    1 1,2
-    """
-    if len(lines) == 0:
+def check_running_sge_jobs(r, now, queues):
+    ret, index = queues.sge()
+    if len(index) == 0:
         print("E: Job %d marked as a SGE job, but `qstat` on this host tell that their is no job running." % r.id)
         return
 
-    assert lines[0] == 'job-ID  prior   name       user         state submit/start at     queue                          slots ja-task-ID \n'
-    assert lines[1] == '-----------------------------------------------------------------------------------------------------------------\n'
     run_time = str_time(now - r["jobman.sql.start_time"])
     if now - int(r["jobman.sql.start_time"]) > (24 * 60 * 60):
         print("W: Job %d is running for more then 24h. The current colosse max run time is 24h. Run time %s" % (r.id, run_time))
 
-    found = False
-    for line in lines[2:]:
-        sp = line.split()
-        ta_sp = sp[9].split(',')
-        if len(sp) != 10:
-            print("W: Job %d. Don't understant one line of qstat output's. Can't tell reliably if it is still running or not" % r.id)
-            print("qstat output: ", line)
-        if (sp[0] == r["jobman.sql.job_id"] and
-                r["jobman.sql.sge_task_id"] in ta_sp):
-            if sp[4] == 'r':
-                pass
-            elif sp[4] == 'qw':
-                print("E: Job %d is running in the db on sge with job id %s and task id %s, but it is waiting in the sge queue. Run time %s" % (
-                    r.id, r["jobman.sql.job_id"],
-                    r["jobman.sql.sge_task_id"], run_time))
-            elif sp[4] == 't':
-                print("W: Job %d is running in the db, but it is marked as ended in the sge queue. This can be synchonization issue. Retry in 1 minutes. Run time %s." % (
-                    r.id, run_time))
-            else:
-                print(
-                    "W: Job %d is running in the db and in the sge queue, but we don't understant the state it is in the queue:", sp[4])
-                found = True  # in the sge queue
-                break
-    if not found:
+    state = index.get((r["jobman.sql.job_id"], r["jobman.sql.sge_task_id"]))
+    if state is None:
         print("E: Job %d marked as running in the db on sge with job id %s and task id %s, but not in sge queue. Run time %s." % (
             r.id, r["jobman.sql.job_id"],
             r["jobman.sql.sge_task_id"], run_time))
+    elif state == 'r':
+        pass
+    elif state == 'qw':
+        print("E: Job %d is running in the db on sge with job id %s and task id %s, but it is waiting in the sge queue. Run time %s" % (
+            r.id, r["jobman.sql.job_id"],
+            r["jobman.sql.sge_task_id"], run_time))
+    elif state == 't':
+        print("W: Job %d is running in the db, but it is marked as ended in the sge queue. This can be synchonization issue. Retry in 1 minutes. Run time %s." % (
+            r.id, run_time))
+    else:
+        print("W: Job %d is running in the db and in the sge queue, but we don't understant the state it is in the queue: %s" % (
+            r.id, state))
+
+
+def check_running_condor_jobs(r, now, queues):
+    gjid = None
+    if "jobman.sql.condor_global_job_id" in list(r.keys()):
+        gjid = r["jobman.sql.condor_global_job_id"]
+    elif "jobman.sql.condor_GlobalJobId" in list(r.keys()):
+        gjid = r["jobman.sql.condor_GlobalJobId"]
+    if gjid is not None:
+        submit_host = gjid.split('#')[0]
+        ret, index = queues.condor_q(submit_host)
+
+        if ret == 127 and len(index) == 0:
+            print("W: Job %d. condor_q failed. Is condor installed on this computer?" % r.id)
+            return
+
+        status = index.get(gjid)
+        if status is None:
+            print("E: Job %d is marked as running in the bd on this condor jobs %s, but condor tell that this jobs is finished" % (
+                r.id, gjid))
+            return
+        elif status == '0':  # condor unexpanded??? What should we do?
+            print("E: Job %d is marked as running in the db, but its condor submited job is marked as unexpanded. We don't know what that mean, so we use an euristic to know if the jobs is still running." % r.id)
+        elif status == '1':  # condor idle
+            print("E: Job %d is marked as running in the db, but its condor submited job is marked as idle. This can mean that the computer that was running this job crashed." % r.id)
+            return
+        elif status == '2':  # condor running
+            return
+        elif status == '3':  # condor removed
+            print("E: Job %d is marked as running in the db, but its condor submited job is marked as removed." % r.id)
+        elif status == '4':  # condor completed
+            print("E: Job %d is marked as running in the db, but its condor submited job is marked as completed." % r.id)
+        elif status == '5':  # condor held
+            print("E: Job %d is marked as running in the db, but its condor submited job is marked as held." % r.id)
+        elif status == '6':  # condor submission error
+            print("E: Job %d is marked as running in the db, but its condor submited job is marked as submission error(SHOULD not happen as if condor can't start the job, it don't select one in the db)." % r.id)
+        else:
+            print("W: condor return a not understood status for job %d: `%s`. We will try some euristic to determine if it is running." % (r.id, status))
+
+    info = (r.id,
+            r["jobman.experiment"],
+            r["jobman.sql.condor_slot"],
+            r["jobman.sql.host_name"],
+            r["jobman.sql.start_time"])
+    run_time = str_time(now - info[4])
+
+    if info[2] == "no_condor_slot":
+        print("W: Job %d is not running on condor(Should not happed...)" % info[0])
+        return
+
+    slot = info[2]
+    if not slot.startswith('slot'):
+        slot = 'slot' + slot
+    ret, index = queues.condor_status()
+    # when running: slot1@brams0b.iro.umontreal.ca Claimed Busy bastienf bastienf
+    sp = index.get('%s@%s' % (slot, info[3]))
+    if sp is None:
+        print("W: Job %d is running on a host(%s) that condor lost connection with. The job run for: %s" %
+              (r.id, info[3], run_time))
+    elif len(sp) != 4:
+        print("W: Job %d condor_status return not understood: " % r.id, sp)
+    elif sp[0] in ["Unclaimed", "Owner"] and sp[1] == "Idle":
+        print("E: Job %d db tell that this job is running on %s. condor tell that this host don't run a job. running time %s" % (
+            r.id, info[3], run_time))
+    elif sp[0] == "Claimed" and sp[1] in ["Busy", "Retiring"]:
+        if sp[2] != sp[3]:
+            print("W: Job %d condor_status return not understood: " % r.id, sp)
+        if sp[3].split('@')[0] == os.getenv("USER"):
+            print("W: Job %d is running on a condor host that is running a job of the same user. running time: %s" % (
+                r.id, run_time))
+        else:
+            print("E: Job %d is running on a condor host that is running a job for user %s. running time: %s" % (
+                r.id, sp[3].split('@')[0], run_time))
+    else:
+        print("W: Job %d condor state of host not understood" % r.id, sp)
 
 
 def check_serve(options, dbdescr):
@@ -132,11 +358,16 @@ def check_serve(options, dbdescr):
 
     print jobs that could have crashed/been killed ...
 
+    The status command of each jobs scheduler (qstat, condor_q per submit
+    host, condor_status) is run only once, whatever the number of running
+    jobs.
+
     Example usage:
 
         jobman check <tablepath>
 
     """
+    from .api0 import open_db
 
     db = open_db(dbdescr, serial=True)
 
@@ -150,7 +381,6 @@ def check_serve(options, dbdescr):
         err_sync = q.filter_eq('jobman.status', 4).all()
         err_run = q.filter_eq('jobman.status', 5).all()
         canceled = q.filter_eq('jobman.status', -1).all()
-        info = []
 
         print("I: number of job by status (%d:START, %d:RUNNING, %d:DONE,"
               " %d:ERR_START, %d:ERR_SYNC, %d:ERR_RUN, %d:CANCELED)"
@@ -175,6 +405,7 @@ def check_serve(options, dbdescr):
         # check not 2 jobs in same slot+host
         host_slot = {}
         now = time.time()
+        queues = SchedulerQueues()
 
         # check job still running
         for idx, r in enumerate(running):
@@ -191,7 +422,7 @@ def check_serve(options, dbdescr):
             if "jobman.sql.pbs_task_id" in list(r.keys()):
                 pbs_job = True
             if (sge_job + condor_job + pbs_job) > 1:
-                print("W: Job %d have info such that it run on condor, sge and/or pbs. We can't determine the good one.")
+                print("W: Job %d have info such that it run on condor, sge and/or pbs. We can't determine the good one." % r.id)
                 continue
             if not (sge_job or condor_job or pbs_job):
                 print("W: Job %d don't have condor, sge or pbs info attached to it. We can't determine if it is still running on the cluster. Old jobman to started the job?" % r.id)
@@ -199,15 +430,11 @@ def check_serve(options, dbdescr):
 
             # check that the job is still running.
             if sge_job:
-                check_running_sge_jobs(r, now)
+                check_running_sge_jobs(r, now, queues)
                 continue
 
             if pbs_job:
-                check_running_pbs_jobs(r, now)
-                continue
-
-            if not condor_job:
-                print("W: Job %d is running but don't have the information needed to check if they still run on the jobs scheduler condor/pbs/torque/sge. Possible reasons: the job started with an old version of jobman or on another jobs scheduler." % r.id)
+                check_running_pbs_jobs(r, now, queues)
                 continue
 
             # We suppose the jobs started on condor.
@@ -232,93 +459,7 @@ def check_serve(options, dbdescr):
             else:
                 host_slot[st] = idx
 
-            gjid = None
-            if "jobman.sql.condor_global_job_id" in list(r.keys()):
-                gjid = r["jobman.sql.condor_global_job_id"]
-            elif "jobman.sql.condor_GlobalJobId" in list(r.keys()):
-                gjid = r["jobman.sql.condor_GlobalJobId"]
-            if gjid is not None:
-                submit_host = gjid.split('#')[0]
-
-                #import pdb;pdb.set_trace()
-                # take care of the quotation, condor resquest that "" be used
-                # around string.
-                cmd = "condor_q -name %s -const 'GlobalJobId==\"%s\"' -format '%%s' 'JobStatus'" % (submit_host, gjid)
-                p = Popen(cmd, shell=True, stdout=PIPE)
-                ret = p.wait()
-                lines = p.stdout.readlines()
-
-                if ret == 127 and len(lines) == 0:
-                    print("W: Job %d. condor_q failed. Is condor installed on this computer?" % r.id)
-                    continue
-
-                if len(lines) == 0:
-                    print("E: Job %d is marked as running in the bd on this condor jobs %s, but condor tell that this jobs is finished" % (
-                        r.id, gjid))
-                    continue
-                elif len(lines) == 1:
-                    if lines[0] == '0':  # condor unexpanded??? What should we do?
-                        print("E: Job %d is marked as running in the db, but its condor submited job is marked as unexpanded. We don't know what that mean, so we use an euristic to know if the jobs is still running." % r.id)
-                    elif lines[0] == '1':  # condor idle
-                        print("E: Job %d is marked as running in the db, but its condor submited job is marked as idle. This can mean that the computer that was running this job crashed." % r.id)
-                        continue
-                    elif lines[0] == '2':  # condor running
-                        continue
-                    elif lines[0] == '3':  # condor removed
-                        print("E: Job %d is marked as running in the db, but its condor submited job is marked as removed." % r.id)
-                    elif lines[0] == '4':  # condor completed
-                        print("E: Job %d is marked as running in the db, but its condor submited job is marked as completed." % r.id)
-                    elif lines[0] == '5':  # condor held
-                        print("E: Job %d is marked as running in the db, but its condor submited job is marked as held." % r.id)
-                    elif lines[0] == '6':  # condor submission error
-                        print("E: Job %d is marked as running in the db, but its condor submited job is marked as submission error(SHOULD not happen as if condor can't start the job, it don't select one in the db)." % r.id)
-
-                else:
-                    print("W: condor return a not understood answer to a query. We will try some euristic to determine if it is running. test command `%s`. stdout returned `%s`" % (cmd, lines))
-    # except KeyError:
-    #            pass
-            info = (r.id,
-                    r["jobman.experiment"],
-                    r["jobman.sql.condor_slot"],
-                    r["jobman.sql.host_name"],
-                    r["jobman.sql.start_time"])
-            run_time = str_time(now - info[4])
-
-            if info[2] == "no_condor_slot":
-                print("W: Job %d is not running on condor(Should not happed...)" % info[0])
-            else:
-                p = Popen('''condor_status -constraint 'Name == "slot%s@%s"' -format "%%s" Name -format " %%s" State -format " %%s" Activity -format " %%s" RemoteUser -format " %%s\n" RemoteOwner''' % (info[2], info[3]),
-                          shell=True, stdout=PIPE)
-                p.wait()
-                lines = p.stdout.readlines()
-                # return when running: slot1@brams0b.iro.umontreal.ca Claimed Busy bastienf bastienf
-                # return when don't exist: empty
-                if len(lines) == 0:
-                    print("W: Job %d is running on a host(%s) that condor lost connection with. The job run for: %s" %
-                          (r.id, info[3], run_time))
-                    continue
-                elif len(lines) != 1 and not (len(lines) == 2 and lines[-1] == '\n'):
-                    print("W: Job %d condor_status return not understood: ", lines)
-                    continue
-                sp = lines[0].split()
-                if len(sp) >= 3 and sp[1] in ["Unclaimed", "Owner"] and sp[2] == "Idle":
-                    print("E: Job %d db tell that this job is running on %s. condor tell that this host don't run a job. running time %s" % (
-                        r.id, info[3], run_time))
-                elif len(sp) == 5:
-                    assert sp[0] == "slot%s@%s" % (info[2], info[3])
-                    if sp[3] != sp[4]:
-                        print("W: Job %d condor_status return not understood: ", lines)
-                    if sp[1] == "Claimed" and sp[2] in ["Busy", "Retiring"]:
-                        if sp[4].split('@')[0] == os.getenv("USER"):
-                            print("W: Job %d is running on a condor host that is running a job of the same user. running time: %s" % (
-                                r.id, run_time))
-                        else:
-                            print("E: Job %d is running on a condor host that is running a job for user %s. running time: %s" % (
-                                r.id, sp[4].split('@')[0], run_time))
-                    else:
-                        print("W: Job %d condor state of host not understood" % r.id, sp)
-                else:
-                    print("W: Job %d condor_status return not understood: ", lines)
+            check_running_condor_jobs(r, now, queues)
 
     finally:
         session.close()
@@ -1,23 +1,29 @@
 #! /usr/bin/env python
+import collections
+from concurrent import futures
 import datetime
+import io
 import os
 import re
 import shlex
+from shlex import quote
 import shutil
-import string
+import signal
 import subprocess
 from subprocess import Popen, PIPE, STDOUT
 import sys
+import tempfile
 from textwrap import dedent
 from threading import Lock, Thread
 import time
 from time import sleep
 import traceback
 
-from utils import (get_condor_platform, get_config_value, get_jobmandir,
-                   get_new_sid, set_config_value, truncate)
+from .utils import (get_condor_platform, get_config_value, get_jobmandir,
+                    get_new_sid, search_file, set_config_value, truncate)
 
 from random import shuffle
+from functools import reduce
 
 STATUS_FINISHED = 0
 STATUS_RUNNING = 1
@@ -39,6 +45,7 @@ ShortHelp = '''Usage: jobdispatch <common options> <back-end parameters> {--file
         [*--[no_]exec_in_exp_dir]
         [--only_n_first=N]
         [--repeat_jobs=N]
+        [--[*no_]jobman_sql]
         [--[*no_]whitespace]
         [--sort={generated*,random}]
         [--extra_param=STRING]
@@ -58,6 +65,8 @@ ShortHelp = '''Usage: jobdispatch <common options> <back-end parameters> {--file
     bqtools, condor, sge, sharcnet, torque local options:
                               [--env=VAR=VALUE[ VAR2=VALUE2]]  (must be quoted into the shell!)
                               [*--[no_]set_special_env]
+    local options            :[--[*no_]cpu_affinity]
+    ssh options              :[--machine=HOSTNAME+]
     bqtools, condor, sge, torque options:
                               [--raw=STRING[\nSTRING]]
     cluster, condor options  :[--32|--64|--3264] [--os=X]
@@ -147,14 +156,15 @@ common options:
     --ssh=N is the same as --ssh --nb_proc=N
     --condor=N is the same as --condor --nb_proc=N
     --torque=N is the same as --torque --nb_proc=N
-    condor, bqtools and torque default to -1. Cluster defaults to 32. local and
-    ssh default to 1.
+    condor, bqtools, torque and ssh default to -1. Cluster defaults to 32.
+    local defaults to 1. For ssh, -1 uses all the slots of the hosts.
 
     --local=FILE_PATH is accepted. The file should contain only the number of
-    threads wanted. This allows dynamically changing the number of threads.
-    The change in the number of threads happen before we start the threads or
-    when a thread ends. We wait until threads finish to lower the number of
-    running threads.
+    concurrent jobs wanted. The file is watched while the jobs run, so this
+    allows dynamically changing the number of concurrent jobs. We wait until
+    jobs finish to lower the number of running jobs. With --local, sending
+    SIGUSR1 to jobdispatch adds a concurrent job and SIGUSR2 removes one,
+    starting with the next job that ends.
 
   The '--exp_dir=dir' specifies the name of the temporary directory
     relative to LOGDIR, instead of one generated automatically based
@@ -173,6 +183,14 @@ common options:
     jobdispatch this time. Work only with jobs launched with jobdispatch.
   The '--only_n_first=N' option tell to launch only the first N jobs from the list.
   The '--repeat_jobs=N' option tell that we must repeat N time each jobs.
+  The '--[no_]jobman_sql' option tell that the command is a 'jobman sql'
+    worker. We count the START jobs of its table with one query and submit
+    only the needed number of workers: one per -n jobs (one per job if
+    -n <= 0), at most --repeat_jobs=N if given. Nothing is submitted if the
+    table has no START jobs. With --jobs_per_node, many workers share each
+    allocation. For example:
+      jobdispatch --torque --jobs_per_node=4 --jobman_sql jobman sql -n 5 \\
+          'postgres://user@host/db?table=t' /exp/root
   The '--tasks_filename={compact,explicit,nb0,nb1,sh}+' option will change the
     filename where the stdout, stderr are redirected. We can put many option
     separated by comma. They will apper in the filename in order separated by a
@@ -221,6 +239,20 @@ bqtools, condor, sge, sharcnet, torque and local options:
   The '--[no_]set_special_env' option will set the varialbe OMP_NUM_THREADS,
     MKL_NUM_THREADS and GOTO_NUM_THREADS to the number of cpus allocated to job.
 
+local option:
+  The '--[no_]cpu_affinity' option pins each job to --cpu cpus (default 1),
+    the least used ones first.
+
+ssh option:
+  The '--machine=HOSTNAME+' option gives the hosts to execute the jobs on.
+    By default, they are read from ~/.pymake/<platform>.hosts, one per line,
+    optionally followed by the number of jobs to execute at once on the host.
+    Otherwise, a host executes one job per --cpu cores at once. All the jobs
+    of a host share one ssh connection. A job whose ssh connection failed is
+    executed again, and a host that fails twice in a row is not used
+    anymore. The 'JOBDISPATCH_SSH' environment variable can change the ssh
+    command to use.
+
 bqtools, condor, sge and torque options:
   The '--raw=STRING1[\nSTRING2...]' option append all STRINGX in the submit file.
       if this option appread many time, they will be concatanated with a new line.
@@ -421,7 +453,7 @@ def parse_args(to_parse, dbi_param):
     command_argv = to_parse[:]
     for argv in to_parse:
         if argv == "--help" or argv == "-h":
-            print LongHelp
+            print(LongHelp)
             sys.exit(0)
     #--nodbilog should be allowed due to bug in old version that
     #  --requested it with _.
@@ -454,7 +486,8 @@ def parse_args(to_parse, dbi_param):
                        "--m32G", "--keep_failed_jobs_in_queue", "--restart",
                        "--debug", "--local_log_file",
                        "--exec_in_exp_dir", "--fast", "--whitespace",
-                       "--gpu", "--interactive"
+                       "--gpu", "--interactive", "--cpu_affinity",
+                       "--jobman_sql"
                    ]:
             dbi_param[argv[2:]] = True
         elif argv in ["--no_force", "--no_interruptible", "--no_long",
@@ -466,7 +499,8 @@ def parse_args(to_parse, dbi_param):
                       "--no_debug", "--no_local_log_file",
                       "--no_exec_in_exp_dir",
                       "--no_fast", "--no_whitespace",
-                      "--no_gpu", "--no_interactive"
+                      "--no_gpu", "--no_interactive", "--no_cpu_affinity",
+                      "--no_jobman_sql"
                       ]:
             dbi_param[argv[5:]] = False
         elif argv == "--testdbi":
@@ -527,8 +561,8 @@ def parse_args(to_parse, dbi_param):
             else:
                 dbi_param[param] += '&&(SERVER=?=False || SERVER =?= UNDEFINED )'
         elif argv[0:1] == '-':
-            print "Unknow option (%s)" % argv
-            print ShortHelp
+            print("Unknow option (%s)" % argv)
+            print(ShortHelp)
             sys.exit(1)
         else:
             break
@@ -553,7 +587,7 @@ class LockedIterator:
     def get(self):
         try:
             self._lock.acquire()
-            return self._iterator.next()
+            return next(self._iterator)
         finally:
             self._lock.release()
 
@@ -564,10 +598,10 @@ class LockedIterator:
         finally:
             self._lock.release()
 
-    def next(self):
+    def __next__(self):
         try:
             self._lock.acquire()
-            return self._iterator.next()
+            return next(self._iterator)
         finally:
             self._lock.release()
 
@@ -581,7 +615,7 @@ class LockedListIter:
     def __iter__(self):
         return self
 
-    def next(self):
+    def __next__(self):
         try:
             self._lock.acquire()
             self._last += 1
@@ -709,11 +743,11 @@ class MultiThread:
         self.running -= 1
         if self.print_when_finish:
             if callable(self.print_when_finish):
-                print self.print_when_finish(), "left running: %d/%d" % (
-                    self.running, self.init_len_list)
+                print(self.print_when_finish(), "left running: %d/%d" % (
+                    self.running, self.init_len_list))
             else:
-                print self.print_when_finish, "left running: %d/%d" % (
-                    self.running, self.init_len_list)
+                print(self.print_when_finish, "left running: %d/%d" % (
+                    self.running, self.init_len_list))
 
     def start(self):
         if self.maxThreads_file:
@@ -731,6 +765,209 @@ class MultiThread:
             thread.join(timeout)
 
 
+def _available_cpus():
+    """Return the list of the cpus this process can run on."""
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    import multiprocessing
+    return list(range(multiprocessing.cpu_count()))
+
+
+class LocalPool(object):
+    """Run tasks as local processes, at most `max_procs` at a time.
+
+    A single event loop, run(), starts the processes and collects them, so
+    the number of running processes is exact and no lock is needed. Each
+    process is waited for in a thread of a
+    concurrent.futures.ThreadPoolExecutor, with Popen.wait(), which only
+    reaps that process: the other children of the caller (the pre_batch,
+    its own subprocesses) keep their exit status. The loop waits for the
+    first of these futures to be done.
+
+    :param prepare: called as prepare(task) when a task is started. Must
+                    return None to skip the task or a tuple (command,
+                    stdout, stderr) that is executed in a shell. The
+                    stdout and stderr files are closed when it ends.
+    :param tasks: the list of tasks to execute, in order.
+    :param max_procs: the number of concurrent processes, or the path of a
+                      file containing it. The file is watched while the
+                      tasks run. When the number decreases, no running
+                      process is killed: we wait for them to finish.
+    :param cpus_per_task: if > 0, each process is pinned to that many cpus,
+                          the least used ones first.
+    :param callback: called as callback(task, returncode) when a process
+                     ends.
+    :param poll_interval: while tasks wait for a slot, a change of
+                          `max_procs` (by resize() or in the file) is seen
+                          within that many seconds.
+    """
+    def __init__(self, prepare, tasks, max_procs=1, cpus_per_task=0,
+                 callback=None, poll_interval=0.05):
+        self._prepare = prepare
+        self._tasks = tasks
+        self._pending = None
+        self._callback = callback
+        self.poll_interval = poll_interval
+        self.max_procs_file = None
+        self._file_stat = None
+        if isinstance(max_procs, str):
+            self.max_procs_file = max_procs
+            self.max_procs = 1
+            self._check_max_procs_file()
+        else:
+            self.resize(max_procs)
+        self.cpus_per_task = cpus_per_task
+        self._cpu_usage = None
+        if cpus_per_task > 0:
+            self._cpu_usage = dict((cpu, 0) for cpu in _available_cpus())
+            if not hasattr(os, 'sched_setaffinity'):
+                self._taskset = search_file('taskset', os.getenv('PATH', ''))
+                if not self._taskset:
+                    print("[DBI] WARNING: taskset not found, we won't set the cpu affinity of the jobs")
+                    self._cpu_usage = None
+        # future -> (process, task, resource, files)
+        self.running = {}
+        self.finished = 0
+        self._loop = None
+
+    def resize(self, max_procs):
+        """Change the number of concurrent processes. -1 means all the
+        tasks at once. Can be called from another thread or a signal
+        handler."""
+        if max_procs == -1:
+            max_procs = len(self._tasks)
+        elif max_procs <= 0:
+            raise DBIError("[DBI] ERROR: you set %d concurrent jobs."
+                           " Must be higher then 0!!" % (max_procs))
+        self.max_procs = max_procs
+
+    def _check_max_procs_file(self):
+        try:
+            st = os.stat(self.max_procs_file)
+        except OSError:
+            return
+        stat = (st.st_mtime, st.st_size)
+        if stat == self._file_stat:
+            return
+        self._file_stat = stat
+        with open(self.max_procs_file) as f:
+            try:
+                self.resize(int(f.readline()))
+            except (ValueError, DBIError) as e:
+                print("[DBI] WARNING: bad number of jobs in %s, keeping %d: %s" % (
+                    self.max_procs_file, self.max_procs, e))
+
+    def _take_cpus(self):
+        cpus = sorted(self._cpu_usage, key=self._cpu_usage.get)
+        cpus = cpus[:self.cpus_per_task]
+        for cpu in cpus:
+            self._cpu_usage[cpu] += 1
+        return cpus
+
+    def _free_slots(self):
+        return self.max_procs - len(self.running)
+
+    def _place(self, command):
+        """Return the (command, preexec_fn, resource) used to execute
+        `command`. The resource is given back to _release()."""
+        if self._cpu_usage is None:
+            return command, None, None
+        cpus = self._take_cpus()
+        if hasattr(os, 'sched_setaffinity'):
+            return command, lambda: os.sched_setaffinity(0, cpus), cpus
+        command = "%s -c %s %s" % (self._taskset, ','.join(map(str, cpus)),
+                                   command)
+        return command, None, cpus
+
+    def _release(self, cpus):
+        if cpus:
+            for cpu in cpus:
+                self._cpu_usage[cpu] -= 1
+
+    def _wait(self, p, resource):
+        """Wait for the process `p`, in a thread of the executor. Return its
+        exit status, and whether the back-end failed to execute it."""
+        return p.wait(), False
+
+    def _retry(self, task, resource, failed):
+        """Return True if the task must be executed again."""
+        return False
+
+    def _start(self, executor, task):
+        prepared = self._prepare(task)
+        if prepared is None:
+            return
+        command, stdout, stderr = prepared
+        command, preexec_fn, resource = self._place(command)
+        p = Popen(command, shell=True, stdout=stdout, stderr=stderr,
+                  preexec_fn=preexec_fn)
+        future = executor.submit(self._wait, p, resource)
+        self.running[future] = (p, task, resource, (stdout, stderr))
+
+    def _end(self, future):
+        p, task, resource, files = self.running.pop(future)
+        for f in files:
+            if hasattr(f, 'close'):
+                f.close()
+        self._release(resource)
+        returncode, failed = future.result()
+        if self._retry(task, resource, failed):
+            self._pending.appendleft(task)
+            return
+        self.finished += 1
+        if self._callback:
+            self._callback(task, returncode)
+
+    def run(self):
+        """Execute all the tasks, return when they are all finished."""
+        self._pending = collections.deque(self._tasks)
+        # The loop bounds the number of processes, and so the number of
+        # threads the executor starts; max_workers only has to be above
+        # any max_procs given to resize().
+        with futures.ThreadPoolExecutor(max(len(self._tasks), 1)) as executor:
+            while self._pending or self.running:
+                if self.max_procs_file:
+                    self._check_max_procs_file()
+                while self._pending and self._free_slots() > 0:
+                    self._start(executor, self._pending.popleft())
+                if not self.running:
+                    if self._pending and self._free_slots() <= 0:
+                        # Nowhere left to execute the pending tasks
+                        # (SshPool: no working host left)
+                        raise DBIError("[DBI] ERROR: no slot left to execute"
+                                       " the %d remaining task(s)" % len(self._pending))
+                    continue
+                # Wake up regularly only if some tasks wait for a slot
+                timeout = None
+                if self._pending:
+                    timeout = self.poll_interval
+                done, not_done = futures.wait(self.running, timeout,
+                                               futures.FIRST_COMPLETED)
+                for future in done:
+                    self._end(future)
+
+    def start(self):
+        """Execute run() in a background thread. join() raises the
+        exception it raised, if any."""
+        executor = futures.ThreadPoolExecutor(1)
+        self._loop = executor.submit(self.run)
+        executor.shutdown(wait=False)
+
+    def join(self, timeout=None):
+        """Wait for the end of the tasks started by start(), at most
+        `timeout` seconds if it is given."""
+        try:
+            self._loop.result(timeout)
+        except futures.TimeoutError:
+            pass
+
+
+def tasks_table_command(line, table):
+    """Return the bash command that executes the task on the line `line`
+    (an arithmetic expression, starting at 1) of the file `table`."""
+    return 'eval "$(sed -n "$((%s)){p;q}" %s)"' % (line, quote(table))
+
+
 class DBIBase:
 
     def __init__(self, commands, **args):
@@ -794,7 +1031,7 @@ class DBIBase:
         self.mem = "0"
         self.substitute_gpu = False
 
-        for key in args.keys():
+        for key in list(args.keys()):
             self.__dict__[key] = args[key]
 
         if self.substitute_gpu and self.gpu:
@@ -836,9 +1073,9 @@ class DBIBase:
             self.pre_tasks.append("echo %(var)s=${%(var)s}" % dict(var=var))
 
 
-    def n_avail_machines(self): raise NotImplementedError, "DBIBase.n_avail_machines()"
+    def n_avail_machines(self): raise NotImplementedError("DBIBase.n_avail_machines()")
 
-    def add_commands(self,commands): raise NotImplementedError, "DBIBase.add_commands()"
+    def add_commands(self,commands): raise NotImplementedError("DBIBase.add_commands()")
 
     def get_file_redirection(self, task_id):
         """ Calculate the file to use for stdout/stderr
@@ -880,7 +1117,7 @@ class DBIBase:
                 (output,error)=self.get_redirection(self.log_file + '.out',self.log_file + '.err')
                 self.pre = Popen(pre_batch_command, shell=True, stdout=output, stderr=error)
             else:
-                print "[DBI] pre_batch_command:",pre_batch_command
+                print("[DBI] pre_batch_command:",pre_batch_command)
 
     def exec_post_batch(self):
         # Execute post-batch
@@ -890,16 +1127,16 @@ class DBIBase:
                 (output,error)=self.get_redirection(self.log_file + '.out',self.log_file + '.err')
                 self.post = Popen(post_batch_command, shell=True, stdout=output, stderr=error)
             else:
-                print "[DBI] post_batch_command:",post_batch_command
+                print("[DBI] post_batch_command:",post_batch_command)
 
     def clean(self):
-        print "[DBI] WARNING the clean function was not overrided by the sub class!"
+        print("[DBI] WARNING the clean function was not overrided by the sub class!")
 
     def run(self):
         pass
 
     def wait(self):
-        print "[DBI] WARNING the wait function was not overrided by the sub class!"
+        print("[DBI] WARNING the wait function was not overrided by the sub class!")
 
     def print_jobs_status(self):
         finished=0
@@ -920,9 +1157,25 @@ class DBIBase:
                 waiting+=1
                 unfinished.append(t.id)
             else:
-                print "[DBI] jobs %i have an unknow status: %d",t.id
-        print "[DBI] %d jobs. finished: %d, running: %d, waiting: %d, init: %d"%(len(self.tasks),finished, running, waiting, init)
-        print "[DBI] jobs unfinished (starting at 1): ",unfinished
+                print("[DBI] jobs %i have an unknow status: %d",t.id)
+        print("[DBI] %d jobs. finished: %d, running: %d, waiting: %d, init: %d"%(len(self.tasks),finished, running, waiting, init))
+        print("[DBI] jobs unfinished (starting at 1): ",unfinished)
+
+    def write_tasks_table(self):
+        """Write the commands of the tasks in the file 'tasks' of the log
+        directory, one task per line. The task i of an array job executes
+        the line i (see tasks_table_command()). Return the path of the file.
+        """
+        path = os.path.join(self.log_dir, 'tasks')
+        f = open(path, 'w')
+        for task in self.tasks:
+            command = ';'.join(task.commands)
+            if '\n' in command:
+                raise DBIError("[DBI] ERROR: the command of a task can't"
+                               " contain a new line: %r" % command)
+            f.write(command + '\n')
+        f.close()
+        return path
 
     def check_path(self, p):
         """
@@ -946,6 +1199,11 @@ class DBIBase:
 
 
 
+# absolute path of the utils.py script of each (tmp_dir, cwd), see Task
+_utils_files = {}
+_non_alnum = re.compile('[^a-zA-Z0-9]')
+
+
 class Task:
 
     def __init__(self, command, tmp_dir, log_dir, time_format, pre_tasks=[], post_tasks=[], dolog = True, id=-1, gen_unique_id = True, args = {}):
@@ -958,16 +1216,20 @@ class Task:
         # the command itself. Therefore, no need for pre- and post-commands in
         # the Task class
 
-        utils_file = os.path.join(tmp_dir, 'utils.py')
-        utils_file = os.path.abspath(utils_file)
+        # All the tasks of a batch share the same tmp_dir
+        key = (tmp_dir, os.getcwd())
+        utils_file = _utils_files.get(key)
+        if utils_file is None:
+            utils_file = os.path.join(tmp_dir, 'utils.py')
+            utils_file = _utils_files[key] = os.path.abspath(utils_file)
 
-        for key in args.keys():
-            self.__dict__[key] = args[key]
+        self.__dict__.update(args)
         self.dolog = dolog
+        self.time_format = time_format
 
-        formatted_command = re.sub('[^a-zA-Z0-9]', '_', command);
+        formatted_command = _non_alnum.sub('_', command)
         if gen_unique_id:
-            self.unique_id = get_new_sid('')#compation intense
+            self.unique_id = get_new_sid('')
             self.log_file = truncate(os.path.join(log_dir, self.unique_id +'_'+ formatted_command), 200) + ".log"
         else:
             self.unique_id = formatted_command[:200]+'_'+str(datetime.datetime.now()).replace(' ','_').replace(':','-')
@@ -986,20 +1248,20 @@ class Task:
 
         if self.dolog == True:
             self.commands.append(utils_file + ' set_config_value '+
-                string.join([self.log_file,'STATUS',str(STATUS_RUNNING)],' '))
+                ' '.join([self.log_file,'STATUS',str(STATUS_RUNNING)]))
             # set the current date in the field LAUNCH_TIME
             self.commands.append(utils_file +  ' set_current_date '+
-                string.join([self.log_file,'LAUNCH_TIME',time_format],' '))
+                ' '.join([self.log_file,'LAUNCH_TIME',time_format]))
 
 
         self.commands.append(command)
         self.commands.extend(post_tasks)
         if self.dolog == True:
             self.commands.append(utils_file + ' set_config_value '+
-                string.join([self.log_file,'STATUS',str(STATUS_FINISHED)],' '))
+                ' '.join([self.log_file,'STATUS',str(STATUS_FINISHED)]))
             # set the current date in the field FINISHED_TIME
             self.commands.append(utils_file + ' set_current_date ' +
-                string.join([self.log_file,'FINISHED_TIME',time_format],' '))
+                ' '.join([self.log_file,'FINISHED_TIME',time_format]))
 
         #print "self.commands =", self.commands
         self.status=STATUS_INIT
@@ -1010,7 +1272,7 @@ class Task:
 
     def get_stdout(self):
         try:
-            if isinstance(self.p.stdout, file):
+            if isinstance(self.p.stdout, io.IOBase):
                 return self.p.stdout
             else:
                 return open(self.log_file + '.out','r')
@@ -1020,7 +1282,7 @@ class Task:
 
     def get_stderr(self):
         try:
-            if isinstance(self.p.stderr, file):
+            if isinstance(self.p.stderr, io.IOBase):
                 return self.p.stderr
             else:
                 return open(self.log_file + '.err','r')
@@ -1108,13 +1370,13 @@ class DBICluster(DBIBase):
         DBIBase.run(self)
         task.status=STATUS_RUNNING
 
-        remote_command=string.join(task.commands,';')
+        remote_command=';'.join(task.commands)
         filename=os.path.join(self.tmp_dir,task.unique_id)
         filename=os.path.abspath(filename)
         f=open(filename,'w')
         f.write(remote_command+'\n')
         f.close()
-        os.chmod(filename, 0750)
+        os.chmod(filename, 0o750)
         self.temp_files.append(filename)
 
         command = "cluster"
@@ -1148,7 +1410,7 @@ class DBICluster(DBIBase):
 
         self.started+=1
         started=self.started# not thread safe!!!
-        print "[DBI, %d/%d, %s] %s"%(started,len(self.tasks),time.ctime(),command)
+        print("[DBI, %d/%d, %s] %s"%(started,len(self.tasks),time.ctime(),command))
         if self.test:
             task.status=STATUS_FINISHED
             return
@@ -1170,21 +1432,21 @@ class DBICluster(DBIBase):
                 task.dbi_return_status=int(last.split()[-1])
 #        print "[DBI,%d/%d,%s] Job ended, popen returncode:%d, popen.wait.return:%d, dbi echo return code:%s"%(started,len(self.tasks),time.ctime(),task.p.returncode,task.p_wait_ret,task.dbi_return_status)
         if task.dbi_return_status==None:
-            print "[DBI, %d/%d, %s] Trouble with launching/executing '%s'." % (started,len(self.tasks),time.ctime(),command)
-            print "    Its execution did not finished. Probable cause is the back-end itself."
-            print "    You may want to run the task again."
-            print "    popen returncode: %d"     % task.p.returncode
-            print "    popen.wait.return: %d"    % task.p_wait_ret
-            print "    dbi echo return code: %s" % task.dbi_return_status
+            print("[DBI, %d/%d, %s] Trouble with launching/executing '%s'." % (started,len(self.tasks),time.ctime(),command))
+            print("    Its execution did not finished. Probable cause is the back-end itself.")
+            print("    You may want to run the task again.")
+            print("    popen returncode: %d"     % task.p.returncode)
+            print("    popen.wait.return: %d"    % task.p_wait_ret)
+            print("    dbi echo return code: %s" % task.dbi_return_status)
             self.backend_failed+=1
         elif task.dbi_return_status!=0:
             self.jobs_failed+=1
         task.status=STATUS_FINISHED
 
     def run(self):
-        print "[DBI] The Log file are under %s"%self.log_dir
+        print("[DBI] The Log file are under %s"%self.log_dir)
         if self.test:
-            print "[DBI] Test mode, we only print the command to be executed, we don't execute them"
+            print("[DBI] Test mode, we only print the command to be executed, we don't execute them")
         # Execute pre-batch
         self.exec_pre_batch()
 
@@ -1197,7 +1459,7 @@ class DBICluster(DBIBase):
         # Execute post-batchs
         self.exec_post_batch()
 
-        print "[DBI] The Log file are under %s"%self.log_dir
+        print("[DBI] The Log file are under %s"%self.log_dir)
 
     def clean(self):
         #TODO: delete all log files for the current batch
@@ -1208,16 +1470,16 @@ class DBICluster(DBIBase):
         if self.mt:
             try:
                 self.mt.join()
-            except KeyboardInterrupt, e:
-                print "[DBI] Catched KeyboardInterrupt"
+            except KeyboardInterrupt as e:
+                print("[DBI] Catched KeyboardInterrupt")
                 self.print_jobs_status()
                 raise
 
         else:
-            print "[DBI] WARNING jobs not started!"
+            print("[DBI] WARNING jobs not started!")
         self.print_jobs_status()
-        print "[DBI] %d jobs where the back-end failed." % (self.backend_failed)
-        print "[DBI] %d jobs returned a failure status." % (self.jobs_failed)
+        print("[DBI] %d jobs where the back-end failed." % (self.backend_failed))
+        print("[DBI] %d jobs returned a failure status." % (self.jobs_failed))
 
 class DBIBqtools(DBIBase):
 
@@ -1255,7 +1517,7 @@ class DBIBqtools(DBIBase):
         self.tmp_dir = os.path.join(self.tmp_dir,os.path.split(self.log_dir)[1])
         if not os.path.exists(self.tmp_dir):
             os.makedirs(self.tmp_dir)
-        print "[DBI] All bqtools file will be in ",self.tmp_dir
+        print("[DBI] All bqtools file will be in ",self.tmp_dir)
         os.chdir(self.tmp_dir)
 
         if self.long:
@@ -1373,7 +1635,7 @@ class DBIBqtools(DBIBase):
         if self.raw:
             bqsubmit_dat.write(self.raw+"\n")
 
-        print self.unique_id
+        print(self.unique_id)
         if self.clean_up:
             bqsubmit_dat.write('postBatch = rm -rf dbi_batch*.BQ ; rm -f logfiles tasks launcher bqsubmit.dat ;\n')
         bqsubmit_dat.close()
@@ -1381,7 +1643,7 @@ class DBIBqtools(DBIBase):
         # Execute pre-batch
         self.exec_pre_batch()
 
-        print "[DBI] All logs will be in the directory: ",self.log_dir
+        print("[DBI] All logs will be in the directory: ",self.log_dir)
         # Launch bqsubmit
         if not self.test:
             for t in self.tasks:
@@ -1393,15 +1655,15 @@ class DBIBqtools(DBIBase):
                 raise DBIError("[DBI] ERROR: bqsubmit returned an error code "
                                "of " + str(self.p.returncode))
         else:
-            print "[DBI] Test mode, we generated all files, but will not execute bqsubmit"
+            print("[DBI] Test mode, we generated all files, but will not execute bqsubmit")
             if self.dolog:
-                print "[DBI] The scheduling time will not be logged when you submit the generated file"
+                print("[DBI] The scheduling time will not be logged when you submit the generated file")
 
         # Execute post-batchs
         self.exec_post_batch()
 
     def wait(self):
-        print "[DBI] WARNING cannot wait until all jobs are done for bqtools, use bqwatch or bqstatus"
+        print("[DBI] WARNING cannot wait until all jobs are done for bqtools, use bqwatch or bqstatus")
 
 
 ###############################
@@ -1434,11 +1696,11 @@ class DBISge(DBIBase):
             jobs_per_node = self.cores_per_node // self.cpu
             assert jobs_per_node != 0, "Requested more cores per node then available"
             if self.cores_per_node % self.cpu != 0 and self.jobs_per_node == 0:
-                print """[DBI] WARNING: You requested %d cores per jobs
+                print("""[DBI] WARNING: You requested %d cores per jobs
                 and told there is %d cores per nodes. This could be
                 wastefull as this leave %d cores not used per node."""%(
                     self.cpu, self.cores_per_node,
-                    self.cores_per_node - (jobs_per_node*self.cpu))
+                    self.cores_per_node - (jobs_per_node*self.cpu)))
         if self.mem_per_node > 0 and self.mem > 0:
             jobs_per_node_ = self.mem_per_node // self.mem
             assert jobs_per_node_ != 0, "Requested more memory per node then available"
@@ -1448,9 +1710,9 @@ class DBISge(DBIBase):
                 jobs_per_node = min(jobs_per_node, jobs_per_node_)
 
         if self.jobs_per_node != 0 and jobs_per_node != self.jobs_per_node:
-            print """[DBI] WARNING: you specified the number of jobs
+            print("""[DBI] WARNING: you specified the number of jobs
             per nodes as %d, but we computed that %d would be
-            better. We use your number."""%(self.jobs_per_node, jobs_per_node)
+            better. We use your number."""%(self.jobs_per_node, jobs_per_node))
         assert jobs_per_node != 0
         if self.jobs_per_node == 0 and jobs_per_node > 0:
             self.jobs_per_node = jobs_per_node
@@ -1476,12 +1738,12 @@ class DBISge(DBIBase):
         if self.nb_proc != -1:
             sge_root = os.getenv("SGE_ROOT")
             if not sge_root:
-                print "[DBI] WARNING: DBISge need sge 6.2u4 or higher to work for nb_proc!=-1 to work. Can't determine the version of sge that is running.", self.nb_proc
+                print("[DBI] WARNING: DBISge need sge 6.2u4 or higher to work for nb_proc!=-1 to work. Can't determine the version of sge that is running.", self.nb_proc)
             elif os.path.split(sge_root)[1].startswith('ge'):
                 if os.path.split(sge_root)[1][2:]<'6.2u4':
-                    print "[DBI] WARNING: DBISge need sge 6.2u4 or higher to work for nb_proc!=-1 to work. We found version '%s' to be running."%(sge_root[2:]), self.nb_proc
+                    print("[DBI] WARNING: DBISge need sge 6.2u4 or higher to work for nb_proc!=-1 to work. We found version '%s' to be running."%(sge_root[2:]), self.nb_proc)
             else:
-                print "[DBI] WARNING: DBISge need sge 6.2u4 or higher to work for nb_proc!=-1 to work. Can't determine the version of sge that is running.", self.nb_proc
+                print("[DBI] WARNING: DBISge need sge 6.2u4 or higher to work for nb_proc!=-1 to work. Can't determine the version of sge that is running.", self.nb_proc)
 
 
     def add_commands(self,commands):
@@ -1506,63 +1768,42 @@ class DBISge(DBIBase):
 
     def create_separate_jobs_submit_files(self):
         """ We suppose SGE will launch the jobs separatly"""
+        tasks = self.write_tasks_table()
         launcher = open(os.path.join(self.log_dir, 'launcher'), 'w')
         launcher.write(dedent('''\
                 #!/bin/bash -l
-                # Bash is needed because we use its "array" data structure
                 # the -l flag means it will act like a login shell,
                 # and source the .profile, .bashrc, and so on
 
-                # List of all tasks to execute
-                tasks=(
-                '''))
-        for task in self.tasks:
-            launcher.write("'" + ';'.join(task.commands) + "'\n")
-        launcher.write(dedent('''\
-                )
-
-                # The index in 'tasks' array starts at 0,
-                # but SGE_TASK_ID starts at 1...
-                ID=$(($SGE_TASK_ID - 1))
-
                 ## Trap SIGUSR1 and SIGUSR2, so the job has time to react
                 # These signals are emitted by SGE before (respectively)
                 # SIGSTOP and SIGKILL (typically 60 s before on colosse)
                 ##trap "echo signal trapped by $0 >&2" SIGUSR1 SIGUSR2
 
-                # Execute the task
-                ${tasks[$ID]}
-                '''))
+                # Execute the task, SGE_TASK_ID starts at 1 like the lines
+                %s
+                ''' % tasks_table_command('$SGE_TASK_ID', tasks)))
+        launcher.close()
 
 
     def create_full_node_submit_files(self):
         """We reserve a full node and ourself we some jobs on it """
+        tasks = self.write_tasks_table()
         launcher = open(os.path.join(self.log_dir, 'launcher'), 'w')
+        (output_file, error_file)=self.get_file_redirection(0)
         launcher.write(dedent('''\
                 #!/bin/bash -l
-                # Bash is needed because we use its "array" data structure
                 # the -l flag means it will act like a login shell,
                 # and source the .profile, .bashrc, and so on
 
-                # List of all tasks to execute
-                tasks=(
-                '''))
-        for task in self.tasks:
-            launcher.write("'" + ';'.join(task.commands) + "'\n")
-
-        (output_file, error_file)=self.get_file_redirection(0)
-        launcher.write(dedent('''\
-                )
-
                 echo "IN LAUNCHER"
                 echo "SGE_TASK_ID=${SGE_TASK_ID}"
-                # The index in 'tasks' array starts at 0,
-                # but SGE_TASK_ID starts at 1...
-                ID=$(($SGE_TASK_ID - 1))
+                # The lines of the tasks file start at 1 like SGE_TASK_ID
+                ID=$SGE_TASK_ID
                 echo "ID=$ID"
                 JOBS_PER_NODE=%i
                 NB_TASKS=%i
-                UPPER_LIMIT=`python -c "print min(${ID} + ${JOBS_PER_NODE} - 1, ${NB_TASKS} - 1)"`
+                UPPER_LIMIT=$(( ID + JOBS_PER_NODE - 1 < NB_TASKS ? ID + JOBS_PER_NODE - 1 : NB_TASKS ))
                 echo "UPPER_LIMIT=$UPPER_LIMIT"
 
                 ## Trap SIGUSR1 and SIGUSR2, so the job has time to react
@@ -1575,13 +1816,15 @@ class DBISge(DBIBase):
                 date
                 for TASK_ID in `seq ${ID} ${UPPER_LIMIT}`; do
                     echo "Launching task id = ${TASK_ID}"
-                    ${tasks[${TASK_ID}]} > %s 2> %s &
+                    %s > %s 2> %s &
                 done
                 wait
                 echo "All jobs finished on this node"
                 date
                 '''%(self.jobs_per_node, len(self.tasks),
+                     tasks_table_command('TASK_ID', tasks),
                      output_file, error_file)))
+        launcher.close()
 
     def run(self):
 
@@ -1708,7 +1951,7 @@ class DBISge(DBIBase):
         # Execute pre-batch
         self.exec_pre_batch()
 
-        print "[DBI] All logs will be in the directory: ", self.log_dir
+        print("[DBI] All logs will be in the directory: ", self.log_dir)
         # Launch qsub
         submit_command = 'qsub ' + os.path.join(self.log_dir, 'submit.sh')
         if not self.test:
@@ -1722,11 +1965,11 @@ class DBISge(DBIBase):
                 raise DBIError("[DBI] ERROR: qsub returned an error code "
                                "of " + str(self.p.returncode))
         else:
-            print "[DBI] Test mode, we generated all files, but will not execute qsub"
-            print '[DBI] Test mode, to manually launch it execute "'+submit_command+'"'
+            print("[DBI] Test mode, we generated all files, but will not execute qsub")
+            print('[DBI] Test mode, to manually launch it execute "'+submit_command+'"')
 
             if self.dolog:
-                print "[DBI] The scheduling time will not be logged when you submit the generated file"
+                print("[DBI] The scheduling time will not be logged when you submit the generated file")
 
         # Execute post-batchs
         self.exec_post_batch()
@@ -1735,7 +1978,7 @@ class DBISge(DBIBase):
         pass
 
     def wait(self):
-        print "[DBI] WARNING cannot wait until all jobs are done for SGE, use qstat"
+        print("[DBI] WARNING cannot wait until all jobs are done for SGE, use qstat")
 
 ###############################
 # Torque
@@ -1815,48 +2058,37 @@ class DBITorque(DBIBase):
             id+=1
 
     def create_separate_jobs_submit_files(self):
+        tasks = self.write_tasks_table()
         launcher = open(os.path.join(self.log_dir, 'launcher'), 'w')
+        pre_tasks = "\n".join(self.pre_tasks)
+        # The array ids start at 0, the lines of the tasks file at 1
+        task_command = tasks_table_command(
+            '$%s + 1' % self.env_var_jobarray_id, tasks)
         launcher.write(dedent('''\
                 #!/bin/bash -l
-                # Bash is needed because we use its "array" data structure
                 # the -l flag means it will act like a login shell,
                 # and source the .profile, .bashrc, and so on
 
-                # List of all tasks to execute
-                tasks=(
-                '''))
-        for task in self.tasks:
-            # We need double quote in the launcher file as otherwise
-            # $VAR don't work.
-            launcher.write('"' + ';'.join(task.commands) + '"\n')
-        env_var_jobarray_id = self.env_var_jobarray_id
-        pre_tasks = "\n".join(self.pre_tasks)
-        launcher.write(dedent('''\
-                )
-
                 # Execute the pre tasks
                 %(pre_tasks)s
 
                 # Execute the task
-                ${tasks[$%(env_var_jobarray_id)s]}
+                %(task_command)s
                 ''') % locals())
+        launcher.close()
 
 
     def create_full_node_submit_files(self):
         """We reserve a full node and ourself we run many jobs on it """
+        tasks = self.write_tasks_table()
         launcher = open(os.path.join(self.log_dir, 'launcher'), 'w')
         launcher.write(dedent('''\
                 #!/bin/bash -l
-                # Bash is needed because we use its "array" data structure
                 # the -l flag means it will act like a login shell,
                 # and source the .profile, .bashrc, and so on
 
-                # List of all tasks to execute
-                tasks=(
                 '''))
 
-        for task in self.tasks:
-            launcher.write("'" + ';'.join(task.commands) + "'\n")
         pre_tasks = "\n".join(self.pre_tasks)
         restart_init = ""
         restart_submit = ""
@@ -1870,11 +2102,10 @@ if [ -e %s ] ; then
 fi
 """ % (self.restart_file, self.submit_command, self.submit_command)
         launcher.write(dedent('''\
-                )
-
                 echo "IN LAUNCHER"
                 echo "%(env_var_jobarray_id)s=$%(env_var_jobarray_id)s"
-                UPPER_LIMIT=`python -c "print min($%(env_var_jobarray_id)s + %(jobs_per_node)s - 1, %(nb_tasks)s - 1)"`
+                UPPER_LIMIT=$(( $%(env_var_jobarray_id)s + %(jobs_per_node)s - 1 ))
+                UPPER_LIMIT=$(( UPPER_LIMIT < %(nb_tasks)s - 1 ? UPPER_LIMIT : %(nb_tasks)s - 1 ))
                 echo "UPPER_LIMIT=$UPPER_LIMIT"
 
                 # Execute the task
@@ -1891,7 +2122,7 @@ fi
                     # Execute the pre tasks
                     %(pre_tasks)s
 
-                    ${tasks[${TASK_ID}]} >> %(log_dir)s/%(name)s.out.sub$TASK_ID 2>> %(log_dir)s/%(name)s.err.sub$TASK_ID &
+                    %(task_command)s >> %(log_dir)s/%(name)s.out.sub$TASK_ID 2>> %(log_dir)s/%(name)s.err.sub$TASK_ID &
 
                 done
                 wait
@@ -1906,7 +2137,11 @@ fi
                           log_dir=self.log_dir,
                           name=self.jobs_name,
                           restart_init=restart_init, restart_submit=restart_submit,
-                          pre_tasks=pre_tasks))))
+                          pre_tasks=pre_tasks,
+                          # The array ids start at 0, the lines at 1
+                          task_command=tasks_table_command('TASK_ID + 1',
+                                                           tasks)))))
+        launcher.close()
 
     def run(self):
         # why not call?
@@ -2022,7 +2257,7 @@ fi
             env += " JOBDISPATCH_RESUBMIT='%(cmd)s'" % dict(cmd=self.submit_command)
             if self.jobs_per_node > 0:
                 assert not self.restart
-                print "WARNING, YOU ARE USING AN OLD INTERFACE THAT WILL NOT BE SUPPORTED SHORTLY"
+                print("WARNING, YOU ARE USING AN OLD INTERFACE THAT WILL NOT BE SUPPORTED SHORTLY")
         if len(self.tasks) == self.jobs_per_node:
             fname = os.path.join(self.log_dir, 'jobdispatch_restart')
             env += " JOBDISPATCH_RESTART_FILE='%(fname)s'" % dict(fname=fname)
@@ -2074,7 +2309,7 @@ fi
         # Execute pre-batch
         self.exec_pre_batch()
 
-        print "[DBI] All logs will be in the directory: ", self.log_dir
+        print("[DBI] All logs will be in the directory: ", self.log_dir)
         # Launch qsub
         if not self.test:
             for t in self.tasks:
@@ -2088,11 +2323,11 @@ fi
                                " returned an error code "
                                "of " + str(self.p.returncode))
         else:
-            print "[DBI] Test mode, we generated all files, but will not execute " + self.launch_exec
-            print '[DBI] Test mode, to manually launch it execute "'+self.submit_command+'"'
+            print("[DBI] Test mode, we generated all files, but will not execute " + self.launch_exec)
+            print('[DBI] Test mode, to manually launch it execute "'+self.submit_command+'"')
 
             if self.dolog:
-                print "[DBI] The scheduling time will not be logged when you submit the generated file"
+                print("[DBI] The scheduling time will not be logged when you submit the generated file")
 
         # Execute post-batchs
         self.exec_post_batch()
@@ -2101,7 +2336,7 @@ fi
         pass
 
     def wait(self):
-        print "[DBI] WARNING cannot wait until all jobs are done for Torque, use qstat"
+        print("[DBI] WARNING cannot wait until all jobs are done for Torque, use qstat")
 
 
 
@@ -2141,7 +2376,7 @@ class DBIMoab(DBITorque):
         self.job_array_suffix = "]"
 
     def wait(self):
-        print "[DBI] WARNING cannot wait until all jobs are done for Moab, use 'showq -u $USER'"
+        print("[DBI] WARNING cannot wait until all jobs are done for Moab, use 'showq -u $USER'")
 
 ###################
 # Sharcnet tools
@@ -2165,7 +2400,7 @@ class DBISharcnet(DBIBase):
         self.tmp_dir = os.path.join(self.tmp_dir, os.path.split(self.log_dir)[1])
         if not os.path.exists(self.tmp_dir):
             os.makedirs(self.tmp_dir)
-        print "[DBI] All temporary files will be in ", self.tmp_dir
+        print("[DBI] All temporary files will be in ", self.tmp_dir)
 
         args['tmp_dir'] = self.tmp_dir
         self.args = args
@@ -2194,7 +2429,7 @@ class DBISharcnet(DBIBase):
     def run_one_job(self, task):
         DBIBase.run(self)
 
-        remote_command = string.join(task.commands, '\n')
+        remote_command = '\n'.join(task.commands)
         filename = os.path.join(self.tmp_dir, task.unique_id)
         filename = os.path.abspath(filename)
         f = open(filename, 'w')
@@ -2212,7 +2447,7 @@ class DBISharcnet(DBIBase):
         f.write(remote_command)
         f.write('\n')
         f.close()
-        os.chmod(filename, 0750)
+        os.chmod(filename, 0o750)
         self.temp_files.append(filename)
 
         command = 'sqsub'
@@ -2242,7 +2477,7 @@ class DBISharcnet(DBIBase):
 
         if not self.test:
             task.set_scheduled_time()
-            print "[DBI] Executing: " + command
+            print("[DBI] Executing: " + command)
 
             self.p = Popen(command, shell=True)
             self.p.wait()
@@ -2250,11 +2485,11 @@ class DBISharcnet(DBIBase):
                 raise DBIError("[DBI] ERROR: qsub returned an error code "
                                "of " + str(self.p.returncode))
         else:
-            print '[DBI] Test mode, to manually submit, execute "'+command+'"'
+            print('[DBI] Test mode, to manually submit, execute "'+command+'"')
 
 
     def run(self):
-        print "[DBI] The log files are under %s" % self.log_dir
+        print("[DBI] The log files are under %s" % self.log_dir)
         if self.test:
             "[DBI] Test mode, we generated all files, but will not execute sqsub"
 
@@ -2276,7 +2511,7 @@ class DBISharcnet(DBIBase):
             os.remove(f)
 
     def wait(self):
-        print "[DBI] WARNING cannot wait until all jobs are done on Sharcnet, use sqjobs or sqstat"
+        print("[DBI] WARNING cannot wait until all jobs are done on Sharcnet, use sqjobs or sqstat")
 
 
 # Transfor a string so that it is treated by Condor as a single argument
@@ -2338,6 +2573,7 @@ class DBICondor(DBIBase):
         self.notification = "Error"
 
         DBIBase.__init__(self, commands, substitute_gpu=True, **args)
+        self.nb_proc = int(self.nb_proc)
 
         if not 'mem' in args:
             # Default to 950 to be close to 1G, but account for condor rounding.
@@ -2355,13 +2591,14 @@ class DBICondor(DBIBase):
         if not self.universe in valid_universe:
             raise DBIError("[DBI] ERROR: the universe option have an invalid value",self.universe,". Valid values are:",valid_universe)
         if self.universe=="local":
-            n=subprocess.Popen("cat /proc/cpuinfo |grep processor|wc -l", shell = True, stdout=PIPE).stdout.readline()
+            n=subprocess.Popen("cat /proc/cpuinfo |grep processor|wc -l", shell = True, stdout=PIPE, universal_newlines=True).stdout.readline()
             if len(commands)>int(n):
                 raise DBIError("[DBI] ERROR we refuse to start more jobs on the local universe then the total number of core. Start less jobs or use another universe.")
 
         if not self.os:
             #if their is not required os, condor launch on the same os.
-            p=Popen("condor_config_val OpSyS", shell=True, stdout=PIPE, stderr=PIPE)
+            p=Popen("condor_config_val OpSyS", shell=True, stdout=PIPE, stderr=PIPE,
+                    universal_newlines=True)
             p.wait()
             out=p.stdout.readlines()
             err=p.stderr.readlines()
@@ -2427,7 +2664,7 @@ class DBICondor(DBIBase):
                 elif not os.path.isabs(c):
                     # We need to find where the file could be... easiest way to
                     # do it is ask the 'which' shell command.
-                    which_out = subprocess.Popen('which %s' % c, shell = True, stdout = PIPE).stdout.readlines()
+                    which_out = subprocess.Popen('which %s' % c, shell = True, stdout = PIPE, universal_newlines = True).stdout.readlines()
                     if len(which_out) == 1:
                         c = which_out[0].strip()
 
@@ -2501,7 +2738,8 @@ class DBICondor(DBIBase):
 #ssh HOSTNAME pkdilly +P
 
         cmd="pkdilly -S "+self.condor_submit_file
-        self.p = Popen(cmd, shell=True, stdout=PIPE, stderr=PIPE)
+        self.p = Popen(cmd, shell=True, stdout=PIPE, stderr=PIPE,
+                       universal_newlines=True)
         self.p.wait()
         l = self.p.stdout.readline()
         if l!="":
@@ -2601,7 +2839,7 @@ class DBICondor(DBIBase):
                     kerb_vars=self.make_kerb_script(fd, self.second_lauch_file, 3, out)
                     fd.close()
                     if len(kerb_vars)>0:
-                        os.chmod(launch_tmp_file, 0755)
+                        os.chmod(launch_tmp_file, 0o755)
                         os.rename(launch_tmp_file, self.launch_file)
                         s=os.stat(self.launch_file)[os.path.stat.ST_SIZE]
                         out.write(line_header()+
@@ -2629,7 +2867,7 @@ class DBICondor(DBIBase):
             if len(vars)>0:
                 break
         if len(vars)==0:
-            print "We didn't got any kerberos ticket after %d try! We don't redo the kerberos script."%(nb_try)
+            print("We didn't got any kerberos ticket after %d try! We don't redo the kerberos script."%(nb_try))
             return vars
 
         fd.write(dedent('''\
@@ -2652,13 +2890,13 @@ class DBICondor(DBIBase):
         dbi_file=os.path.join(get_jobmandir(),"dbi","dbi.py")
         overwrite_launch_file=False
         if not os.path.exists(dbi_file):
-            print '[DBI] WARNING: Can\'t locate file "dbi.py". Maybe the file "'+self.launch_file+'" is not up to date!'
+            print('[DBI] WARNING: Can\'t locate file "dbi.py". Maybe the file "'+self.launch_file+'" is not up to date!')
         else:
             if os.path.exists(self.launch_file):
                 mtimed=os.stat(dbi_file)[8]
                 mtimel=os.stat(self.launch_file)[8]
                 if mtimed>mtimel:
-                    print '[DBI] WARNING: We overwrite the file "'+self.launch_file+'" with a new version. Update it to your needs!'
+                    print('[DBI] WARNING: We overwrite the file "'+self.launch_file+'" with a new version. Update it to your needs!')
                     overwrite_launch_file=True
         if self.pkdilly:
             overwrite_launch_file = True
@@ -2668,7 +2906,7 @@ class DBICondor(DBIBase):
                                             os.path.basename(self.source_file))
             shutil.copy(self.source_file, source_file_dest)
             self.temp_files.append(source_file_dest)
-            os.chmod(source_file_dest, 0755)
+            os.chmod(source_file_dest, 0o755)
             self.source_file=source_file_dest
 
         launch_tmp_file=self.launch_file+".tmp"
@@ -2760,21 +2998,25 @@ class DBICondor(DBIBase):
                 echo "return value ${ret}"
                 exit ${ret}
                 '''))
+            # The jobs must not see a partially written file, even on NFS
+            fd.flush()
+            os.fsync(fd.fileno())
             fd.close()
             if self.pkdilly:
-                os.chmod(self.second_lauch_file, 0755)
+                os.chmod(self.second_lauch_file, 0o755)
 
-            os.chmod(launch_tmp_file, 0755)
+            os.chmod(launch_tmp_file, 0o755)
             os.rename(launch_tmp_file, self.launch_file)
 
     def print_common_condor_submit(self, fd, output, error, arguments=None):
         #check that their is some host with those requirement
-        cmd="""condor_status -const '%s' -tot |wc"""%self.req
-        p=Popen(cmd, shell=True,stdout=PIPE)
-        p.wait()
-        lines=p.stdout.readlines()
-        if p.returncode != 0 or lines==['      1       0       1\n']:
-            raise DBIError("Their is no compute node with those requirement: %s."%self.req)
+        if not self.test:
+            cmd="""condor_status -const '%s' -tot |wc"""%self.req
+            p=Popen(cmd, shell=True,stdout=PIPE, universal_newlines=True)
+            p.wait()
+            lines=p.stdout.readlines()
+            if p.returncode != 0 or lines==['      1       0       1\n']:
+                raise DBIError("Their is no compute node with those requirement: %s."%self.req)
 
 
         fd.write(dedent('''\
@@ -2865,63 +3107,42 @@ class DBICondor(DBIBase):
         condor_dag_fd.close()
 
         self.make_launch_script('$@')
-        time.sleep(5)#we do this in hope that the error 'launch.sh2.sh is not executable' disapear
 
         condor_cmd = self.condor_submit_dag_exec+' -maxjobs %s %s'%(str(self.nb_proc), condor_dag_file)
         return condor_cmd
 
     def run_non_dag(self):
-        condor_datas = []
-
-        #we supose that each task in tasks have the same number of commands
-        #it should be true.
-        #NOT IN DAG VERSION
-        if len(self.tasks[0].commands)>1:
-            for task in self.tasks:
-                condor_data = os.path.join(self.tmp_dir,self.unique_id +'.'+ task.unique_id + '.data')
-                condor_datas.append(condor_data)
-                self.temp_files.append(condor_data)
-                param_dat = open(condor_data, 'w')
-
-                param_dat.write(dedent('''\
+        # All the tasks are the processes of one cluster, the process i
+        # executes the line i+1 of the tasks file.
+        tasks = os.path.abspath(self.write_tasks_table())
+        run_task = os.path.abspath(os.path.join(self.log_dir, 'run_task.sh'))
+        fd = open(run_task, 'w')
+        fd.write(dedent('''\
                 #!/bin/bash
-                %s''' %('\n'.join(task.commands))))
-                param_dat.close()
-
+                %s
+                ''' % tasks_table_command('$1 + 1', tasks)))
+        fd.close()
+        os.chmod(run_task, 0o755)
 
         condor_submit_fd = open(self.condor_submit_file, 'w')
-
-        #DIFFER IN DAG VERSION
-        #self.print_common_condor_submit(condor_submit_fd, "$(stdout)", "$(stderr)","$(args)")
         self.print_common_condor_submit(condor_submit_fd, self.log_dir+"/$(Process).out", self.log_dir+"/$(Process).error")
-
-        if len(condor_datas)!=0:
-            for i in condor_datas:
-                condor_submit_fd.write("arguments      = sh "+i+" $$(Arch) \nqueue\n")
-        else:
-            def print_task(task, stdout_file, stderr_file,req=""):
-                argstring = condor_escape_argument(' ; '.join(task.commands))
-                condor_submit_fd.write("arguments    = %s \n" %argstring)
-                self.check_path(stdout_file)
-                self.check_path(stderr_file)
-                if stdout_file:
-                    condor_submit_fd.write("output       = %s \n" %stdout_file)
-                if stderr_file:
-                    condor_submit_fd.write("error        = %s \n" %stderr_file)
-                if req:
-                    condor_submit_fd.write("requirements   = %s\n"%(req))
+        condor_submit_fd.write("arguments      = %s $(Process)\n" % run_task)
+        if any(self.tasks_req):
+            # The requirements stay in effect for the next queue
+            # statements: the tasks without their own get back the common
+            # ones (self.req, written by print_common_condor_submit).
+            current = self.req
+            for req in self.tasks_req:
+                req = req or self.req
+                if req != current:
+                    condor_submit_fd.write("requirements   = %s\n" % req)
+                    current = req
                 condor_submit_fd.write("queue\n")
-
-            for i in range(len(self.tasks)):
-                task=self.tasks[i]
-                req=self.tasks_req[i]
-                (o,e)=self.get_file_redirection(task.id)
-                print_task(task,o,e,req)
-
+        else:
+            condor_submit_fd.write("queue %d\n" % len(self.tasks))
         condor_submit_fd.close()
 
-        self.make_launch_script('sh -c "$@"')
-        time.sleep(5)#we do this in hope that the error 'launch.sh2.sh is not executable' disapear
+        self.make_launch_script('"$@"')
 
         return self.condor_submit_exec + " " + self.condor_submit_file
 
@@ -2944,7 +3165,7 @@ class DBICondor(DBIBase):
                 if stdout_file==stderr_file:
                     raise DBIError("[DBI] ERROR: the condor back-end can't redirect the stdout and stderr to the same file!")
 
-        print "[DBI] The Log file are under %s"%self.log_dir
+        print("[DBI] The Log file are under %s"%self.log_dir)
         if self.source_file and self.source_file.endswith(".cshrc"):
             self.launch_file = os.path.join(self.log_dir, 'launch.csh')
         else:
@@ -3045,41 +3266,34 @@ class DBICondor(DBIBase):
             shutil.copy(os.path.join(get_jobmandir(),"dbi","utils.py"),
                          utils_file)
             self.temp_files.append(utils_file)
-            os.chmod(utils_file, 0755)
-
-        configobj_file = os.path.join(self.tmp_dir, 'configobj.py')
-        if not os.path.exists('configobj.py'):
-            shutil.copy(os.path.join(get_jobmandir(),"dbi","configobj.py"),
-                         configobj_file)
-            self.temp_files.append(configobj_file)
-            os.chmod(configobj_file, 0755)
+            os.chmod(utils_file, 0o755)
 
 
         #launch the jobs
         if self.test == False:
-            print "[DBI] Executing: " + cmd
+            print("[DBI] Executing: " + cmd)
             for task in self.tasks:
                 task.set_scheduled_time()
             self.p = Popen(cmd, shell=True)
             self.p.wait()
             if self.p.returncode != 0:
-                print "[DBI] submission failed! We can't stard the jobs (Hint: Check if their is a condor_schedd deamon running on the computer(ps -elf|grep condor_schedd) if not, you can't submit from this computer)"
+                print("[DBI] submission failed! We can't stard the jobs (Hint: Check if their is a condor_schedd deamon running on the computer(ps -elf|grep condor_schedd) if not, you can't submit from this computer)")
             if self.pkdilly:
                 self.renew_launch_file(os.path.join(self.log_dir,"renew.outerr")
                                        , 'sh -c "$@"')
 
         else:
-            print "[DBI] In test mode we don't launch the jobs. To do it,",
-            print " you need to execute '"+cmd+"'"
+            print("[DBI] In test mode we don't launch the jobs. To do it,", end=' ')
+            print(" you need to execute '"+cmd+"'")
             if self.dolog:
-                print "[DBI] The scheduling time will not be logged when you will submit the condor file"
+                print("[DBI] The scheduling time will not be logged when you will submit the condor file")
             if self.pkdilly:
-                print "[DBI] we won't renew the kerberos ticket.",
-                print " So the jobs must their execution in the next 8 hours."
+                print("[DBI] we won't renew the kerberos ticket.", end=' ')
+                print(" So the jobs must their execution in the next 8 hours.")
         self.exec_post_batch()
 
     def wait(self):
-        print "[DBI] WARNING no waiting for all job to finish implemented for condor, use 'condor_q' or 'condor_wait %s'"%(self.condor_wait_file)
+        print("[DBI] WARNING no waiting for all job to finish implemented for condor, use 'condor_q' or 'condor_wait %s'"%(self.condor_wait_file))
 
     def clean(self):
         pass
@@ -3090,10 +3304,10 @@ class DBILocal(DBIBase):
         self.nb_proc=1
         self.env = ""
         self.set_special_env = True
+        self.cpu_affinity = False
         DBIBase.__init__(self, commands, **args)
         self.args=args
-        self.threads=[]
-        self.mt = None
+        self.pool = None
         self.started=0
         self.nb_proc_file = ''
 
@@ -3102,7 +3316,7 @@ class DBILocal(DBIBase):
 
         try:
             self.nb_proc=int(self.nb_proc)
-        except ValueError,e:
+        except ValueError as e:
             self.nb_proc_file = self.nb_proc
             f = open(self.nb_proc_file)
             self.nb_proc = int(f.readlines()[0])
@@ -3123,9 +3337,13 @@ class DBILocal(DBIBase):
         post_tasks=self.post_tasks
         dolog=self.dolog
         args=self.args
+        cwd=os.getcwd()
+        # executables already checked (usually, all the commands run the
+        # same one)
+        executables=set()
         id=len(self.tasks)+1
         for command in commands:
-            pos = string.find(command,' ')
+            pos = command.find(' ')
             if pos>=0:
                 c = command[0:pos]
                 c2 = command[pos:]
@@ -3134,7 +3352,7 @@ class DBILocal(DBIBase):
                 c2=""
 
             # We use the absolute path so that we don't have corner case as with ./
-            c = os.path.normpath(os.path.join(os.getcwd(), c))
+            c = os.path.normpath(os.path.join(cwd, c))
             command = "".join([c,c2])
 
             # We will execute the command on the specified architecture
@@ -3142,32 +3360,44 @@ class DBILocal(DBIBase):
             # architecture we execute on both. Otherwise we execute on the
             # same architecture as the architecture of the launch computer
 
-            if not os.access(c, os.X_OK):
-                raise DBIError("[DBI] ERROR: The command '"+c+"' does not exist or does not have execution permission!")
+            if c not in executables:
+                if not os.access(c, os.X_OK):
+                    raise DBIError("[DBI] ERROR: The command '"+c+"' does not exist or does not have execution permission!")
+                executables.add(c)
             self.tasks.append(Task(command, tmp_dir, log_dir,
                                    time_format, pre_tasks,
                                    post_tasks,dolog,id,False,self.args))
             id+=1
         #keeps a list of the temporary files created, so that they can be deleted at will
 
-    def run_one_job(self, task):
+    def prepare_one_job(self, task):
         c = (';'.join(task.commands))
         task.set_scheduled_time()
 
         if self.test:
-            print "[DBI] " + c
+            print("[DBI] " + c)
             return
 
         (output, error) = self.get_redirection(
             *self.get_file_redirection(task.id))
 
-        self.started += 1  # Is this atomic?
-        print "[DBI,%d/%d,%s] %s" % (self.started, len(self.tasks),
-                                     time.ctime(), c)
-        c = self.env + " " + c
-        p = Popen(c, shell=True, stdout=output, stderr=error)
-        p.wait()
+        self.started += 1
+        print("[DBI,%d/%d,%s] %s" % (self.started, len(self.tasks),
+                                     time.ctime(), c))
+        return (self.env + " " + c, output, error)
+
+    def job_ended(self, task, returncode):
         task.status = STATUS_FINISHED
+        task.returncode = returncode
+
+    def change_nb_proc(self, signum, frame):
+        """SIGUSR1 adds a concurrent job, SIGUSR2 removes one."""
+        if signum == signal.SIGUSR1:
+            self.pool.resize(self.pool.max_procs + 1)
+        elif self.pool.max_procs > 1:
+            self.pool.resize(self.pool.max_procs - 1)
+        print("[DBI,%s] now running %d jobs at once" % (
+            time.ctime(), self.pool.max_procs))
 
     def clean(self):
         if len(self.temp_files) > 0:
@@ -3181,16 +3411,16 @@ class DBILocal(DBIBase):
 
     def run(self):
         if self.test:
-            print "[DBI] Test mode, we only print the command to be executed, we don't execute them"
+            print("[DBI] Test mode, we only print the command to be executed, we don't execute them")
         if not self.file_redirect_stdout and self.nb_proc > 1:
-            print "[DBI] WARNING: many process but all their stdout are redirected to the parent"
+            print("[DBI] WARNING: many process but all their stdout are redirected to the parent")
         elif not self.file_redirect_stdout and self.nb_proc_file:
-            print "[DBI] WARNING: nb process dynamic with one thread and their stdout are redirected to the parent. Don't change to more then 1 thread!"
+            print("[DBI] WARNING: nb process dynamic with one thread and their stdout are redirected to the parent. Don't change to more then 1 thread!")
         if not self.file_redirect_stderr and self.nb_proc > 1:
-            print "[DBI] WARNING: many process but all their stderr are redirected to the parent"
+            print("[DBI] WARNING: many process but all their stderr are redirected to the parent")
         elif not self.file_redirect_stderr and self.nb_proc_file:
-            print "[DBI] WARNING: nb process dynamic with one thread and their stderr are redirected to the parent. Don't change to more then 1 thread!"
-        print "[DBI] The Log file are under %s" % self.log_dir
+            print("[DBI] WARNING: nb process dynamic with one thread and their stderr are redirected to the parent. Don't change to more then 1 thread!")
+        print("[DBI] The Log file are under %s" % self.log_dir)
 
         # Execute pre-batch
         self.exec_pre_batch()
@@ -3199,9 +3429,18 @@ class DBILocal(DBIBase):
         nb_proc = self.nb_proc
         if self.nb_proc_file:
             nb_proc = self.nb_proc_file
-        self.mt = MultiThread(self.run_one_job, self.tasks,
-                              nb_proc, lambda :("[DBI,%s]" % time.ctime()))
-        self.mt.start()
+        cpus_per_task = 0
+        if self.cpu_affinity:
+            cpus_per_task = max(self.cpu, 1)
+        self.pool = LocalPool(self.prepare_one_job, self.tasks, nb_proc,
+                              cpus_per_task, self.job_ended)
+        try:
+            for signum in (signal.SIGUSR1, signal.SIGUSR2):
+                signal.signal(signum, self.change_nb_proc)
+        except ValueError:
+            # We are not in the main thread
+            pass
+        self.pool.start()
 
         #TODO: Need to wait before post_bach?
 
@@ -3212,88 +3451,146 @@ class DBILocal(DBIBase):
         pass
 
     def wait(self):
-        if self.mt:
+        if self.pool:
             try:
-                self.mt.join()
-            except KeyboardInterrupt, e:
-                print "[DBI] Catched KeyboardInterrupt"
+                self.pool.join()
+            except KeyboardInterrupt as e:
+                print("[DBI] Catched KeyboardInterrupt")
                 self.print_jobs_status()
-                print "[DBI] The Log file are under %s" % self.log_dir
+                print("[DBI] The Log file are under %s" % self.log_dir)
                 raise
         else:
-            print "[DBI] WARNING jobs not started!"
+            print("[DBI] WARNING jobs not started!")
         self.print_jobs_status()
-        print "[DBI] The Log file are under %s" % self.log_dir
+        print("[DBI] The Log file are under %s" % self.log_dir)
 
 
 class SshHost:
-    def __init__(self, hostname, nice=19, get_avail=True):
+    """A host of the ssh back-end that executes at most `slots` jobs at
+    once. When `slots` is None, it is set from the number of cores of the
+    host when we connect to it."""
+    def __init__(self, hostname, slots=None):
         self.hostname = hostname
-        self.minupdate = 15
-        self.lastupd = -1 - self.minupdate
+        self.slots = slots
+        self.running = 0
+        self.failures = 0
         self.working = True
-        (self.bogomips, self.ncores, self.loadavg) = (-1., -1, -1.)
-        self.nice = nice
-        if get_avail:
-            self.getAvailability()
-
-    def getAvailability(self):
-        # simple heuristic: mips / load
-        t = time.time()
-        if t - self.lastupd > self.minupdate:  # min. 15 sec. before update
-            (self.bogomips, self.ncores, self.loadavg) = self.getAllHostInfo()
-            self.lastupd = t
-            #print  self.hostname, self.bogomips, self.loadavg, (self.bogomips / (self.loadavg + 0.5))
-        return self.bogomips / (self.loadavg + 0.5)
-
-    def getAllHostInfo(self):
-        cmd = ["ssh", self.hostname , "cat /proc/cpuinfo;cat /proc/loadavg"]
-        p = Popen(cmd, stdout=PIPE)
-        bogomips = -1
-        ncores = -1
-        loadavg = -1
-        returncode = p.returncode
-        wait = p.wait()
-        if returncode:
-            self.working = False
-            return (-1., -1, -1.)
-        elif wait != 0:
-            self.working = False
-            return (-1., -1, -1.)
-
-        for l in p.stdout:
-            if l.startswith('bogomips'):
-                s = l.split(' ')
-                bogomips += float(s[-1])
-            if l.startswith('processor'):
-                s = l.split(' ')
-                ncores = int(s[-1]) + 1
 
-        if l:
-            loadavg = float(l[0])
-        #(bogomips,ncores,load average)
-        return (bogomips, ncores, loadavg)
-
-    def addToLoadavg(self, n):
-        self.loadavg += n
-        self.lastupd = time.time()
+    def free_slots(self):
+        if not self.working:
+            return 0
+        return self.slots - self.running
 
     def __str__(self):
-        return "SshHost(" + self.hostname + " <nice: "+   str(self.nice)\
-               +"bogomips:"+str(self.bogomips)\
-               +',ncores:'+str(self.ncores)\
-               +',loadavg'+str(self.loadavg)\
-               +',avail:'+str(self.getAvailability())\
-               +',lastupd:'+str(self.lastupd) + '>)'
+        return "SshHost(%s <slots:%s,running:%d,working:%s>)" % (
+            self.hostname, self.slots, self.running, self.working)
 
     def __repr__(self):
         return str(self)
 
 
+class SshPool(LocalPool):
+    """Run tasks on ssh hosts, in the free slots of the working hosts.
+
+    All the jobs of a host share one persistent ssh connection (OpenSSH
+    ControlMaster). ssh exits with the status 255 when it can't reach the
+    host. When a task ends with that status, the host is checked: if it
+    can't be reached, the task is executed again, up to `retries` times,
+    and a host that fails `max_failures` times in a row is not used
+    anymore; if it can, the status is the one of the task itself. When no
+    working host is left, run() raises DBIError.
+
+    :param max_procs: the maximum number of jobs running on all the hosts,
+                      -1 to use all the slots.
+    :param ssh: the ssh command to use.
+    """
+    def __init__(self, prepare, tasks, hosts, max_procs=-1, callback=None,
+                 ssh='ssh', retries=2, max_failures=2):
+        LocalPool.__init__(self, prepare, tasks, max_procs, 0, callback)
+        self.hosts = hosts
+        self.ssh = ssh
+        self.retries = retries
+        self.max_failures = max_failures
+        self._attempts = {}
+        self._control_dir = tempfile.mkdtemp(prefix='dbi_ssh')
+
+    def ssh_command(self, host, remote_command, options=''):
+        control_path = os.path.join(self._control_dir, '%r@%h:%p')
+        return "%s -n -o BatchMode=yes -o ControlMaster=auto" \
+               " -o ControlPersist=600 -o ControlPath=%s %s %s %s" % (
+                   self.ssh, quote(control_path), options,
+                   quote(host.hostname), quote(remote_command))
+
+    def connect(self, cpus_per_task=1):
+        """Open the connection to all the hosts at once. Set the number of
+        slots of the hosts that don't have one from their number of cores.
+        """
+        procs = [(host, Popen(self.ssh_command(host, 'getconf _NPROCESSORS_ONLN'),
+                              shell=True, stdout=PIPE, stderr=PIPE,
+                              universal_newlines=True))
+                 for host in self.hosts]
+        for host, p in procs:
+            out, err = p.communicate()
+            try:
+                ncores = int(out.split()[-1])
+            except (ValueError, IndexError):
+                host.working = False
+                print("[DBI] WARNING: host %s not working: %s" % (
+                    host.hostname, err.strip()))
+                continue
+            if host.slots is None:
+                host.slots = max(ncores // cpus_per_task, 1)
+
+    def close(self):
+        """Close the connections to the hosts."""
+        for host in self.hosts:
+            Popen(self.ssh_command(host, '', '-O exit'), shell=True,
+                  stdout=PIPE, stderr=PIPE).communicate()
+        shutil.rmtree(self._control_dir, ignore_errors=True)
+
+    def _free_slots(self):
+        free = sum([host.free_slots() for host in self.hosts])
+        return min(free, self.max_procs - len(self.running))
+
+    def _place(self, command):
+        host = max(self.hosts, key=SshHost.free_slots)
+        host.running += 1
+        return self.ssh_command(host, command), None, host
+
+    def _release(self, host):
+        host.running -= 1
+
+    def reachable(self, host):
+        """Return True if `host` can be reached by ssh."""
+        p = Popen(self.ssh_command(host, 'true'), shell=True,
+                  stdout=PIPE, stderr=PIPE)
+        p.communicate()
+        return p.returncode == 0
+
+    def _wait(self, p, host):
+        # ssh exits with 255 when it can't reach the host, but the task may
+        # too: the host is checked here, so that the loop doesn't wait for
+        # it.
+        returncode = p.wait()
+        return returncode, returncode == 255 and not self.reachable(host)
+
+    def _retry(self, task, host, failed):
+        if not failed:
+            host.failures = 0
+            return False
+        host.failures += 1
+        if host.failures >= self.max_failures and host.working:
+            host.working = False
+            print("[DBI] WARNING: host %s not working, we stop using it" % (
+                host.hostname))
+        attempts = self._attempts[task.id] = self._attempts.get(task.id, 0) + 1
+        return attempts <= self.retries
+
+
 def get_hostname():
     from socket import gethostname
     myhostname = gethostname()
-    pos = string.find(myhostname, '.')
+    pos = myhostname.find('.')
     if pos >= 0:
         myhostname = myhostname[0:pos]
     return myhostname
@@ -3307,7 +3604,7 @@ def get_platform():
     if pymake_osarch:
         return pymake_osarch
     platform = sys.platform
-    if platform == 'linux2':
+    if platform.startswith('linux'):
         linux_type = os.uname()[4]
         if linux_type == 'ppc':
             platform = 'linux-ppc'
@@ -3320,46 +3617,51 @@ def get_platform():
 
 # copied from PLearn/python_modules/plearn/pymake/pymake.py
 def find_all_ssh_hosts():
-    hostspath_list = [os.path.join(os.getenv("HOME"),
-                                   ".pymake",
-                                   get_platform() + '.hosts')]
-    if os.path.exists(hostspath_list[0]) == 0:
+    """Return the hosts listed in ~/.pymake/<platform>.hosts, one per line,
+    optionally followed by the number of jobs to execute on it at once."""
+    path = os.path.join(os.getenv("HOME"), ".pymake", get_platform() + '.hosts')
+    if not os.path.exists(path):
         raise DBIError("[DBI] ERROR: no host file %s for the ssh backend" % (
-            hostspath_list[0]))
-    print "[DBI] using file %s for the list of host" % (hostspath_list[0])
-#    from plearn.pymake.pymake import process_hostspath_list
-#    (list_of_hosts, nice_values) = process_hostspath_list(hostspath_list,19,get_hostname())
-    shuffle(list_of_hosts)
-    print list_of_hosts
-    print nice_values
-    h = []
-    for host in list_of_hosts:
-        print "connecting to", host
-        s=SshHost(host, nice_values[host], False)
-        if s.working:
-            h.append(s)
-        else:
-            print "[DBI] host not working:", s.hostname
-        print s
-    print h
-    return h
-
-
-def cmp_ssh_hosts(h1, h2):
-    return cmp(h2.getAvailability(), h1.getAvailability())
+            path))
+    print("[DBI] using file %s for the list of host" % (path))
+    hosts = []
+    f = open(path)
+    for line in f:
+        line = line.split('#')[0].split()
+        if not line:
+            continue
+        slots = None
+        if len(line) > 1:
+            slots = int(line[1])
+        hosts.append(SshHost(line[0], slots))
+    f.close()
+    shuffle(hosts)
+    return hosts
 
 
 class DBISsh(DBIBase):
 
     def __init__(self, commands, **args):
-        print "[DBI] WARNING: The SSH DBI is not fully implemented!"
-        print "[DBI] Use at your own risk!"
-        self.nb_proc = 1
+        self.nb_proc = -1
+        self.env = ""
+        self.set_special_env = True
+        self.machine = []
+        self.ssh = os.getenv("JOBDISPATCH_SSH", "ssh")
         DBIBase.__init__(self, commands, **args)
         self.args = args
+        self.nb_proc = int(self.nb_proc)
+        self.pool = None
+        self.started = 0
+
+        if self.set_special_env and self.cpu > 0:
+            self.env += ' OMP_NUM_THREADS=%d GOTO_NUM_THREADS=%d MKL_NUM_THREADS=%d' % (self.cpu, self.cpu, self.cpu)
+
         self.add_commands(commands)
-        self.hosts = find_all_ssh_hosts()
-        print "[DBI] hosts: ", self.hosts
+        if self.machine:
+            self.hosts = [SshHost(host) for host in self.machine]
+        else:
+            self.hosts = find_all_ssh_hosts()
+        print("[DBI] hosts: ", self.hosts)
 
     def add_commands(self, commands):
         if not isinstance(commands, list):
@@ -3374,97 +3676,46 @@ class DBISsh(DBIBase):
                                    self.args))
             id += 1
 
-    def getHost(self):
-        self.hosts.sort(cmp=cmp_ssh_hosts)
-        print "hosts= "
-        for h in self.hosts:
-            print h
-        self.hosts[0].addToLoadavg(1.0)
-        return self.hosts[0]
-
-    def run_one_job(self, task):
-        DBIBase.run(self)
-
-        host = self.getHost()
-
-        cwd = os.getcwd()
-        command = "ssh " + host.hostname + " 'cd " + cwd + "; " + string.join(task.commands,';') + "'"
-        print "[DBI] " + command
+    def prepare_one_job(self, task):
+        c = (';'.join(task.commands))
+        task.set_scheduled_time()
 
         if self.test:
+            print("[DBI] " + c)
             return
 
-        task.launch_time = time.time()
-        task.set_scheduled_time()
         (output, error) = self.get_redirection(
             *self.get_file_redirection(task.id))
 
-        task.p = Popen(command, shell=True, stdout=output, stderr=error)
-        task.p.wait()
-        task.status = STATUS_FINISHED
-
-    def run_one_job2(self, host):
-        DBIBase.run(self)
-
-        cwd = os.getcwd()
-        print self._locked_iter
-        for task in self._locked_iter:
-            print "task", task
-            command = "ssh " + host.hostname + " 'cd " + cwd + "; " + string.join(task.commands,';') + " ; echo $?'"
-            print "[DBI, %s] %s" % (time.ctime(), command)
-
-            if self.test:
-                return
-
-            task.launch_time = time.time()
-            task.set_scheduled_time()
+        self.started += 1
+        print("[DBI,%d/%d,%s] %s" % (self.started, len(self.tasks),
+                                     time.ctime(), c))
+        return ("cd %s;%s %s" % (quote(os.getcwd()), self.env, c),
+                output, error)
 
-
-            task.p = Popen(command, shell=True, stdout=PIPE, stderr=PIPE)
-            wait = task.p.wait()
-            returncode = p.returncode
-            if returncode:
-                self.working = False
-
-            elif wait != 0:
-                self.working = False
-                #redo it
-            return -1.
-
-            out = task.p.stdout.readlines()
-            err = task.p.stderr.readlines()
-            self.echo_result = None
-            if out:
-                self.echo_result = int(out[-1])
-                del out[-1]
-            print "out", out
-            print "err", err
-            print "echo result", self.echo_result
-            if err:
-                task.return_status = int(err[-1])  # last line was an echo $? (because rsh doesn't transmit the status byte correctly)
-                del err[-1]
-                print "return status", task.return_status
-            sleep(1)
-            task.status = STATUS_FINISHED
+    def job_ended(self, task, returncode):
+        task.status = STATUS_FINISHED
+        task.returncode = returncode
 
     def run(self):
-        print "[DBI] The Log file are under %s" % self.log_dir
-        if not self.file_redirect_stdout and self.nb_proc > 1:
-            print "[DBI] WARNING: many process but all their stdout are redirected to the parent"
-        if not self.file_redirect_stderr and self.nb_proc > 1:
-            print "[DBI] WARNING: many process but all their stderr are redirected to the parent"
+        print("[DBI] The Log file are under %s" % self.log_dir)
+        if not self.file_redirect_stdout and self.nb_proc != 1:
+            print("[DBI] WARNING: many process but all their stdout are redirected to the parent")
+        if not self.file_redirect_stderr and self.nb_proc != 1:
+            print("[DBI] WARNING: many process but all their stderr are redirected to the parent")
 
         # Execute pre-batch
         self.exec_pre_batch()
-        self._locked_iter = LockedListIter(iter(self.tasks))
         if self.test:
-            print "[DBI] In testmode, we only print the command that would be executed."
-        print "in run", self.hosts
-        # Execute all Tasks (including pre_tasks and post_tasks if any)
-        self.mt = MultiThread(self.run_one_job2, self.hosts,
-                              self.nb_proc,
-                              lambda :("[DBI,%s]" % time.ctime()))
-        self.mt.start()
+            print("[DBI] In testmode, we only print the command that would be executed.")
+            for task in self.tasks:
+                self.prepare_one_job(task)
+        else:
+            self.pool = SshPool(self.prepare_one_job, self.tasks, self.hosts,
+                                self.nb_proc, self.job_ended, self.ssh)
+            self.pool.connect(max(self.cpu, 1))
+            print("[DBI] hosts: ", self.hosts)
+            self.pool.start()
 
         # Execute post-batchs
         self.exec_post_batch()
@@ -3474,9 +3725,14 @@ class DBISsh(DBIBase):
         pass
 
     def wait(self):
-        #TODO
-        self.mt.join()
-        self.print_jobs_status()
+        if self.pool:
+            try:
+                self.pool.join()
+            finally:
+                self.pool.close()
+                self.print_jobs_status()
+        else:
+            self.print_jobs_status()
 
 
 # creates an object of type ('DBI' + launch_system) if it exists
@@ -3487,11 +3743,11 @@ def DBI(commands, launch_system, **args):
     """
     try:
         jobs = eval('DBI' + launch_system + '(commands,**args)')
-    except DBIError, e:
-        print e
+    except DBIError as e:
+        print(e)
         sys.exit(1)
     except NameError:
-        print 'The launch system ', launch_system, ' does not exists. Available systems are: Cluster, Ssh, Bqtools and Condor'
+        print('The launch system ', launch_system, ' does not exists. Available systems are: Cluster, Ssh, Bqtools and Condor')
         traceback.print_exc()
         sys.exit(1)
     return jobs
@@ -3499,9 +3755,9 @@ def DBI(commands, launch_system, **args):
 
 def main():
     if len(sys.argv) != 2:
-        print "Usage: %s {Condor|Cluster|Ssh|Local|Bqtools} < joblist" % (
-            sys.argv[0])
-        print "Where joblist is a file containing one experiment on each line"
+        print("Usage: %s {Condor|Cluster|Ssh|Local|Bqtools} < joblist" % (
+            sys.argv[0]))
+        print("Where joblist is a file containing one experiment on each line")
         sys.exit(0)
     DBI([s[0:-1] for s in sys.stdin.readlines()], sys.argv[1]).run()
 #    jobs.clean()
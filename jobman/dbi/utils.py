@@ -1,7 +1,7 @@
 #! /usr/bin/env python
 
-import sys,time,random,md5,glob,string,socket,os
-from configobj import ConfigObj
+import sys,time,glob,socket,os
+import hashlib, itertools, uuid
 
 #original version: http://aspn.activestate.com/ASPN/Cookbook/Python/Recipe/52224
 def search_file(filename, search_path):
@@ -9,7 +9,7 @@ def search_file(filename, search_path):
      Can be used with the PATH variable as search_path
     """
     file_found = 0
-    paths = string.split(search_path, os.pathsep)
+    paths = search_path.split(os.pathsep)
     for path in paths:
         if os.path.exists(os.path.join(path, filename)):
             file_found = 1
@@ -20,34 +20,68 @@ def search_file(filename, search_path):
         return None
     
 
+_sid_counter = itertools.count()
+
 def get_new_sid(tag):
-    """Build a new Session ID"""
-    t1 = time.time()
-    time.sleep( random.random() )
-    t2 = time.time()
-    base = md5.new( tag + str(t1 +t2) )
+    """Build a new Session ID
+
+    It is unique without waiting: the host, the process, a counter and a
+    random uuid go into it.
+    """
+    base = hashlib.md5(('%s %s %d %d %r %s' % (
+        tag, socket.gethostname(), os.getpid(), next(_sid_counter),
+        time.time(), uuid.uuid4().hex)).encode('utf-8'))
     sid = tag + '_' + base.hexdigest()
     return sid
 
 def file_exists(filename):
     return len(glob.glob(filename)) > 0
 
+# The log files of the tasks hold "keyword = value" lines. This script is
+# also executed alone, by python 2 or 3, on the nodes (see Task in dbi.py),
+# so they are read and written here rather than with a config file library.
+def read_config(file):
+    config = {}
+    if not os.path.exists(file):
+        return config
+    f = open(file)
+    try:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#') or '=' not in line:
+                continue
+            keyword, value = line.split('=', 1)
+            value = value.strip()
+            if len(value) > 1 and value[0] == value[-1] and value[0] in '"\'':
+                value = value[1:-1]
+            config[keyword.strip()] = value
+    finally:
+        f.close()
+    return config
+
+def write_config(file, config):
+    f = open(file, 'w')
+    try:
+        for keyword in sorted(config):
+            f.write('%s = %s\n' % (keyword, config[keyword]))
+    finally:
+        f.close()
+
 def set_config_value(file, keyword, value):
-    config = ConfigObj(file) 
+    config = read_config(file)
     config[keyword] = value
-    config.write()
+    write_config(file, config)
 
 def get_config_value(file, keyword):
-    config = ConfigObj(file)
+    config = read_config(file)
     try: 
         return config[keyword]
     except KeyError:
         return -1
 
 def set_current_date(file, keyword,time_format):
-    config = ConfigObj(file) 
-    config[keyword] = time.strftime(time_format, time.localtime(time.time()))
-    config.write()
+    set_config_value(file, keyword,
+                     time.strftime(time_format, time.localtime(time.time())))
     
 def truncate(s, length):
     if len(s) < length:
@@ -64,11 +98,11 @@ def string_replace(s,c,ch=''):
     return s
 
 def create_eval_command(function_name , args):
-    return function_name +"('" +  string.join(args,"','") + "')"
+    return function_name +"('" +  "','".join(args) + "')"
 
 def get_platform():
     platform = sys.platform
-    if platform=='linux2':
+    if platform.startswith('linux'):
         linux_type = os.uname()[4]
         if linux_type == 'ppc':
             platform = 'linux-ppc'
@@ -80,7 +114,7 @@ def get_platform():
 
 def get_condor_platform():
     platform = sys.platform
-    if platform=='linux2':
+    if platform.startswith('linux'):
         linux_type = os.uname()[4]
         if linux_type == 'ppc':
             platform = 'linux-ppc'
@@ -1,8 +1,18 @@
-import os, cPickle
+import collections
+import hashlib
+import numbers
+import os
+import pickle
 
 args_filename = 'args.pkl'
 results_filename = 'results.pkl'
 new_jobname_format = 'job%06i'
+# index of the hashes of the args of the jobs (see load_index). Its name
+# starts with '__' so that jobs_iter skips it.
+index_filename = '__args_index__'
+
+# Number of jobs read by each task of the thread pool (see _imap_chunks)
+_chunksize = 64
 
 #########################
 # Utilies inspecting jobs
@@ -18,19 +28,241 @@ def jobs_iter(exproot):
 
 def load_pkl(path):
     try:
-        return cPickle.load(open(path))
-    except (OSError, IOError), e:
+        with open(path, 'rb') as f:
+            # (latin1 reads the str of the pickles written by python 2)
+            return pickle.load(f, encoding='latin1')
+    except OSError:
         return None
 def load_args(jobroot):
     return load_pkl(os.path.join(jobroot, args_filename))
 def load_results(jobroot):
     return load_pkl(os.path.join(jobroot, results_filename))
 
-def load_all(exproot):
+def _default_threads():
+    # as concurrent.futures.ThreadPoolExecutor
+    return min(32, (os.cpu_count() or 1) + 4)
+
+def _imap_chunks(fn, items, threads):
+    """Yield fn(item) for each of `items`, in order.
+
+    The calls are made by a pool of `threads` threads, `_chunksize` items
+    per task, at most 4 tasks per thread ahead of the consumer, so that
+    the results are streamed. This is for I/O bound functions (reading
+    files, possibly on a network filesystem).
+    """
+    if threads <= 1:
+        for item in items:
+            yield fn(item)
+        return
+
+    def run(chunk):
+        return [fn(item) for item in chunk]
+
+    # (imported here, it is slow to import)
+    from concurrent.futures import ThreadPoolExecutor
+    with ThreadPoolExecutor(threads) as executor:
+        pending = collections.deque()
+        chunk = []
+        for item in items:
+            chunk.append(item)
+            if len(chunk) == _chunksize:
+                pending.append(executor.submit(run, chunk))
+                chunk = []
+                if len(pending) >= 4 * threads:
+                    for rval in pending.popleft().result():
+                        yield rval
+        if chunk:
+            pending.append(executor.submit(run, chunk))
+        while pending:
+            for rval in pending.popleft().result():
+                yield rval
+
+def load_all(exproot, results=True, threads=None):
     """Iterate over all (jobname, args, results) tuples
+
+    The files are read by a pool of `threads` threads (default: as many as
+    a ThreadPoolExecutor), and the tuples are yielded in the order of
+    jobs_iter as soon as they are read. If `results` is False, the
+    results.pkl files are not read, and results is None.
+    """
+    if threads is None:
+        threads = _default_threads()
+
+    def load(job):
+        jobname, jobpath = job
+        return (jobname, load_args(jobpath),
+                load_results(jobpath) if results else None)
+    return _imap_chunks(load, jobs_iter(exproot), threads)
+
+
+##########################
+# Index of the args hashes
+##########################
+
+def _canonical(value, out):
+    """Append to list `out` strings encoding `value`, such that args that
+    compare equal give the same strings (for the builtin types; other
+    objects are encoded by their repr)."""
+    if value is None:
+        out.append('N')
+    elif isinstance(value, numbers.Real):
+        # 1 == 1.0 == True: the integral numbers are encoded as ints
+        try:
+            integral = value == int(value)
+        except (OverflowError, ValueError):
+            # inf, nan
+            integral = False
+        if integral:
+            out.append('n%i' % value)
+        else:
+            out.append('n' + repr(float(value)))
+    elif isinstance(value, str):
+        if value.isascii():
+            out.append('s%i:%s' % (len(value), value))
+        else:
+            # (the length of the utf-8 encoding, as for the pickles of
+            # python 2 unicode strings)
+            out.append('u%i:%s' % (len(value.encode('utf-8', 'surrogatepass')), value))
+    elif isinstance(value, bytes):
+        out.append('b%i:%s' % (len(value), value.decode('latin1')))
+    elif isinstance(value, (list, tuple)):
+        out.append('[%i' % len(value))
+        for v in value:
+            _canonical(v, out)
+    elif isinstance(value, dict):
+        # sort the items by the encoding of the keys
+        items = []
+        for k, v in value.items():
+            key_out = []
+            _canonical(k, key_out)
+            items.append(('\x1f'.join(key_out), v))
+        items.sort(key=lambda item: item[0])
+        out.append('{%i' % len(items))
+        for k, v in items:
+            out.append(k)
+            _canonical(v, out)
+    elif isinstance(value, (set, frozenset)):
+        encoded = []
+        for v in value:
+            v_out = []
+            _canonical(v, v_out)
+            encoded.append('\x1f'.join(v_out))
+        encoded.sort()
+        out.append('<%i' % len(encoded))
+        out.extend(encoded)
+    else:
+        out.append('r' + repr(value))
+
+
+def args_hash(args):
+    """Return a hash (hex string) of `args`, stable across processes.
+
+    Args that compare equal have the same hash, even if they are not
+    hashable (lists, dicts, ...). Args with the same hash are not
+    necessarily equal, they still have to be compared.
+    """
+    out = []
+    _canonical(args, out)
+    return hashlib.sha1('\x1f'.join(out).encode('utf-8', 'surrogatepass')).hexdigest()
+
+
+def _index_line(jobname, args):
+    # '-' for the jobs without args
+    if args is None:
+        return '%s -\n' % jobname
+    return '%s %s\n' % (jobname, args_hash(args))
+
+
+def index_jobs(exproot, jobs):
+    """Append the (jobname, args) `jobs` to the index of `exproot`."""
+    lines = ''.join([_index_line(jobname, args) for jobname, args in jobs])
+    if lines:
+        with open(os.path.join(exproot, index_filename), 'a') as f:
+            f.write(lines)
+
+
+def load_index(exproot, threads=None):
+    """Return a dict mapping the name of each job of `exproot` to the hash
+    of its args (see args_hash), or None if it has no args.
+
+    The index is kept in the file `index_filename` of `exproot`, updated
+    as the jobs are added by add_named_jobs. The jobs added or removed by
+    other means are found by listing `exproot`: the args of the new jobs
+    are loaded (by `threads` threads, see load_all) and added to the
+    index, the removed jobs are dropped from it. Args modified in place
+    are not noticed: delete the index file to rebuild it.
     """
+    if threads is None:
+        threads = _default_threads()
+    names = set([jobname for jobname, jobpath in jobs_iter(exproot)])
+    index = {}
+    n_lines = 0
+    try:
+        f = open(os.path.join(exproot, index_filename))
+    except OSError:
+        pass
+    else:
+        with f:
+            for line in f:
+                fields = line.split()
+                # (a line cut by a crash is ignored)
+                if len(fields) == 2 and line.endswith('\n'):
+                    n_lines += 1
+                    index[fields[0]] = fields[1] if fields[1] != '-' else None
+
+    stale = [jobname for jobname in index if jobname not in names]
+    for jobname in stale:
+        del index[jobname]
+    new = sorted(names.difference(index))
+    new_lines = list(_imap_chunks(
+        lambda jobname: _index_line(jobname, load_args(os.path.join(exproot, jobname))),
+        new, threads))
+
+    if stale or n_lines > len(index):
+        # rewrite it
+        tmp = os.path.join(exproot, '%s.%i.tmp' % (index_filename, os.getpid()))
+        with open(tmp, 'w') as f:
+            for jobname in sorted(index):
+                f.write('%s %s\n' % (jobname, index[jobname] or '-'))
+            f.writelines(new_lines)
+        os.replace(tmp, os.path.join(exproot, index_filename))
+    elif new_lines:
+        with open(os.path.join(exproot, index_filename), 'a') as f:
+            f.writelines(new_lines)
+
+    for line in new_lines:
+        jobname, h = line.split()
+        index[jobname] = h if h != '-' else None
+    return index
+
+
+def iter_dups(exproot, threads=None):
+    """Iterate over the (jobname, original) pairs, where job `jobname`
+    has the same args as the job `original` listed before it by jobs_iter.
+
+    Only the args of the jobs whose hashes are equal are loaded.
+    """
+    index = load_index(exproot, threads)
+    # hash -> [(jobname, args)] of the first job with each args
+    seen = {}
     for jobname, jobpath in jobs_iter(exproot):
-        yield jobname, load_args(jobpath), load_results(jobpath)
+        h = index.get(jobname)
+        if h is None:
+            continue
+        if h not in seen:
+            seen[h] = [(jobname, None)]
+            continue
+        args = load_args(jobpath)
+        candidates = seen[h]
+        for i, (name, other) in enumerate(candidates):
+            if other is None:
+                other = load_args(os.path.join(exproot, name))
+                candidates[i] = (name, other)
+            if args == other:
+                yield jobname, name
+                break
+        else:
+            candidates.append((jobname, args))
 
 
 #############################
@@ -38,7 +270,9 @@ def load_all(exproot):
 #############################
 
 def new_names(exproot, N, format=new_jobname_format):
-    job_names = os.listdir(exproot)
+    """Return the first `N` names given by `format` % i, i = 0, 1, ... that
+    are not used in `exproot`."""
+    job_names = set(os.listdir(exproot))
     i = 0
     rvals = []
     while len(rvals) < N:
@@ -51,30 +285,35 @@ def new_names(exproot, N, format=new_jobname_format):
 def new_name(exproot, format=new_jobname_format):
     return new_names(exproot, 1, format=format)[0]
 
-def add_named_jobs(exproot, name_list, args_list, protocol=cPickle.HIGHEST_PROTOCOL):
+def add_named_jobs(exproot, name_list, args_list, protocol=pickle.HIGHEST_PROTOCOL):
     rval = []
     for name, args in zip(name_list, args_list):
         jobroot = os.path.join(exproot, name)
         os.mkdir(jobroot)
         if args is not None:
-            cPickle.dump(args, 
-                    open(os.path.join(exproot, name, args_filename), 'w'),
-                    protocol=protocol)
+            with open(os.path.join(exproot, name, args_filename), 'wb') as f:
+                pickle.dump(args, f, protocol=protocol)
         rval.append((jobroot, args))
+    index_jobs(exproot, zip(name_list, args_list))
     return rval
 
-def add_anon_jobs(exproot, args_list, protocol=cPickle.HIGHEST_PROTOCOL):
+def add_anon_jobs(exproot, args_list, protocol=pickle.HIGHEST_PROTOCOL):
     return add_named_jobs(exproot, new_names(exproot, len(args_list)), args_list,protocol)
 
-def add_unique_jobs(exproot, args_list, protocol=cPickle.HIGHEST_PROTOCOL):
-    # load existing jobs from db
-    existing_args = [args for args in [load_args(path) for (name,path) in jobs_iter(exproot)]
-            if args is not None]
-    try:
-        # this will make the next step much faster if all the args are hashable
-        existing_args = set(existing_args)
-    except:
-        pass
-    args_list = [a for a in args_list if a not in existing_args]
+def add_unique_jobs(exproot, args_list, protocol=pickle.HIGHEST_PROTOCOL):
+    # hashes of the args of the existing jobs (see load_index)
+    existing = {}
+    for jobname, h in load_index(exproot).items():
+        if h is not None:
+            existing.setdefault(h, []).append(jobname)
+    loaded = {}
+    def exists(args):
+        # only the existing args with the same hash are loaded
+        for jobname in existing.get(args_hash(args), ()):
+            if jobname not in loaded:
+                loaded[jobname] = load_args(os.path.join(exproot, jobname))
+            if loaded[jobname] == args:
+                return True
+        return False
+    args_list = [a for a in args_list if not exists(a)]
     return add_anon_jobs(exproot, args_list, protocol=protocol)
-
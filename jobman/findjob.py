@@ -6,15 +6,20 @@ import os
 from optparse import OptionParser
 from .runner import runner_registry
 from .tools import standard as jparse, filemerge
+from .catalog import Catalog
 
 
 parser_findjob = OptionParser(
-    usage='%prog findjob [--group [--dont-sort]] <table experiment directory> ... <key=value> ...',
+    usage='%prog findjob [--group [--dont-sort]] [--processes=N] <table experiment directory> ... <key=value> ...',
     add_help_option=False)
 parser_findjob.add_option('--group', action='store_true', dest='group', default=False,
                           help='group the output directories by keys name and sort them identically inside each group')
 parser_findjob.add_option('--dont-sort', action='store_true', dest='dont_sort', default=False,
                           help='when --group is their dont sort the directory inside each group.')
+parser_findjob.add_option('--no-refresh', action='store_false', dest='refresh', default=True,
+                          help='query the catalog of the directories as it is, without looking for jobs that changed since it was last updated.')
+parser_findjob.add_option('--processes', type='int', dest='processes', default=1,
+                          help='number of processes reading the state files of the jobs that changed (default 1). Only worth it on many cores with the files on a fast filesystem.')
 
 
 def runner_findjob(options, *strings):
@@ -23,6 +28,10 @@ def runner_findjob(options, *strings):
 
     Usage: findjob [options] <table experiment directory> ... <key=value> ...
 
+    The states of the jobs are indexed in a catalog file (.jobman_catalog.sqlite) in each
+    table experiment directory, which is updated with the jobs that
+    changed since the last call.
+
     """
 
     dirs = []
@@ -40,14 +49,17 @@ def runner_findjob(options, *strings):
             break
 
     if options.group:
-        exp_dirs = get_dir_by_key_name(dirs, keys, not options.dont_sort)
+        exp_dirs = get_dir_by_key_name(dirs, keys, not options.dont_sort,
+                                       refresh=options.refresh,
+                                       processes=options.processes)
         print("Keys:", keys)
         for group_id in range(exp_dirs[0]):
             print('Keys =', exp_dirs[1][group_id])
             for exp_dir in exp_dirs[2][group_id]:
                 print(exp_dir[0])
     else:
-        exp_dirs = get_dir_by_key_value(dirs, keys)
+        exp_dirs = get_dir_by_key_value(dirs, keys, refresh=options.refresh,
+                                        processes=options.processes)
         for d, id in exp_dirs:
             print(d)
 
@@ -55,7 +67,7 @@ def runner_findjob(options, *strings):
 runner_registry['findjob'] = (parser_findjob, runner_findjob)
 
 
-def get_dir_by_key_name(dirs, keys, sort_inside_groups=True):
+def get_dir_by_key_name(dirs, keys, sort_inside_groups=True, refresh=True, processes=None):
     '''
     Returns a 3-tuple
     The first is the number of key values that where found in the directory
@@ -71,12 +83,18 @@ def get_dir_by_key_name(dirs, keys, sort_inside_groups=True):
         Experiments parameters used to group the jobs
     sort_inside_groups: bool    
         We sort seach group so that each job in each group have the same other parameter
+    refresh: bool
+        Update the catalog of each directory before using it.
+    processes: int
+        Number of processes reading the state files when updating the catalog.
     Examples
     --------
 
         get_dir_by_key_name(['/data/lisa/exp/mullerx/exp/dae/mullerx_db/ms_0050'],'nb_groups')
     '''
 
+    if isinstance(dirs, str):
+        dirs = (dirs,)
     if isinstance(keys, str):
         keys = [keys]
 
@@ -84,33 +102,32 @@ def get_dir_by_key_name(dirs, keys, sort_inside_groups=True):
     dir_list = []
     nb_dir_per_group = []
     key_values = []
+    # index of the group of each key values (as matched by the catalog)
+    groups = {}
 
     for base_dir in dirs:
-        for expdir in os.listdir(base_dir):
+        with Catalog(base_dir) as catalog:
+            if refresh:
+                catalog.refresh(processes)
+            values = [catalog.values(key) for key in keys]
+            expdirs = catalog.jobs()
 
+        for expdir in expdirs:
             confdir = os.path.join(base_dir, expdir)
-            conf = os.path.join(confdir, 'current.conf')
-
-            # No conf file here, go to next dir.
-            if not os.path.isfile(conf):
-                continue
-
-            keys_to_match = {}
-            params = filemerge(conf)
 
             # Get the keyvalue in the conf file.
             kval = ()
-            for key in keys:
-                kval += params.get(key, None),
+            ktext = ()
+            for key_values_by_job in values:
+                value, text = key_values_by_job.get(expdir, (None, None))
+                kval += value,
+                ktext += text,
 
-            new_key = -1
-            # Check if we have this key value already.
-            for i in range(len(key_values)):
-                if kval == key_values[i]:
-                    new_key = i
+            new_key = groups.get(ktext, -1)
 
             # Update dir list accordingly.
             if new_key == -1:
+                groups[ktext] = nb_key_values
                 key_values.append(kval)
                 nb_dir_per_group.append(1)
                 dir_list.append([])
@@ -149,7 +166,8 @@ def get_dir_by_key_name(dirs, keys, sort_inside_groups=True):
                 # then swap it within the gorup so it has the same index as in group 0.
                 conf = os.path.join(dir_list[j][k][0], 'orig.conf')
                 current_params = filemerge(conf)
-                current_params[key] = original_params[key]
+                for key in keys:
+                    current_params[key] = original_params[key]
                 if current_params == original_params:
                     temp = dir_list[j].pop(k)
                     dir_list[j].insert(i, temp)
@@ -157,7 +175,7 @@ def get_dir_by_key_name(dirs, keys, sort_inside_groups=True):
     return (nb_key_values, key_values, dir_list)
 
 
-def get_dir_by_key_value(dirs, keys=['seed=0']):
+def get_dir_by_key_value(dirs, keys=['seed=0'], refresh=True, processes=None):
     '''
     Returns a list containing the name of the folders. Each element in the list is a list
     containing the full path and the id of the experiment as a string
@@ -168,6 +186,11 @@ def get_dir_by_key_value(dirs, keys=['seed=0']):
         Directories that correspond to the table path directory inside the experiment root directory.
     keys : str or list of str
         str of format key=value that represent the experiments that we want to select.
+        key1=value1:key2=value2 selects the experiments matching either.
+    refresh: bool
+        Update the catalog of each directory before using it.
+    processes: int
+        Number of processes reading the state files when updating the catalog.
 
     Examples
     --------
@@ -181,18 +204,11 @@ def get_dir_by_key_value(dirs, keys=['seed=0']):
 
     # Gather results.
     for base_dir in dirs:
-        for expdir in os.listdir(base_dir):
-
-            skip = False
-
-            confdir = os.path.join(base_dir, expdir)
-            conf = os.path.join(confdir, 'current.conf')
-            if not os.path.isfile(conf):
-                continue
-
-            params = filemerge(conf)
-
-            skip = len(keys)
+        with Catalog(base_dir) as catalog:
+            if refresh:
+                catalog.refresh(processes)
+            expdirs = catalog.jobs()
+            matching = set(expdirs)
 
             for k in keys:
                 keys_to_match = {}
@@ -200,20 +216,19 @@ def get_dir_by_key_value(dirs, keys=['seed=0']):
                 for t in subkeys:
                     if t.find('=') != -1:
                         keys_to_match.update(jparse(t))
+                    elif len(subkeys) != 1:
+                        raise ValueError('key1:key2 syntax requires keyval pairs')
+                # A key without a value does not restrict the selection.
+                if not keys_to_match:
+                    continue
 
-                    else:
-                        if len(subkeys) != 1:
-                            raise ValueError('key1:key2 syntax requires keyval pairs')
-                        kval = params.get(t)
-                        skip -= 1
-
+                found = set()
                 for fkey, fval in keys_to_match.items():
-                    kval = params.get(fkey, None)
-                    if kval == fval:
-                        skip -= 1
-                        break
+                    found |= catalog.find(fkey, [fval])
+                matching &= found
 
-            if not skip:
-                good_dir.append([confdir, expdir])
+        for expdir in expdirs:
+            if expdir in matching:
+                good_dir.append([os.path.join(base_dir, expdir), expdir])
 
     return good_dir
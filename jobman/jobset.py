@@ -6,12 +6,117 @@ from __future__ import unicode_literals
 
 from builtins import map
 from builtins import object
+
+import collections
+import os
+import queue
+import shutil
+import sys
+import tempfile
+import time
+import traceback
+
+from .tools import (expand, flatten, resolve, atomic_write, dump_binary_state,
+                    read_binary_state, BINARY_STATE_SUFFIX)
+from .channel import EmptyChannel
+
+# Values of jobman.status (the same as in the sql module)
+START = 0
+RUNNING = 1
+DONE = 2
+ERR_RUN = 5
+
+METHODS = ('local', 'multiprocess', 'sql')
+
+# Seconds after which the jobs of the table seen in ERR_SYNC at each poll
+# are reported (see JobSet._check_sync_errors)
+SYNC_ERROR_DELAY = 600
+
+
+def _batch_path(path, seq):
+    return os.path.join(path, '%i%s' % (seq, BINARY_STATE_SUFFIX))
+
+
+def _save_batch(path, seq, states, fsync):
+    """Save the flat `states` {job id: flat state or None} in the batch
+    file `seq` of the JobSet directory `path`."""
+    flat = {}
+    for jid, state in states:
+        if state is None:
+            flat[str(jid)] = None
+        else:
+            for k, v in state.items():
+                flat['%i.%s' % (jid, k)] = v
+    atomic_write(_batch_path(path, seq), dump_binary_state(flat), fsync=fsync)
+
+
+def _run_job(flat):
+    """Run the experiment of the flat state `flat`, return the new flat state."""
+    state = expand(flat)
+    channel = EmptyChannel()
+    try:
+        experiment = resolve(state.jobman.experiment)
+        rval = experiment(state, channel)
+    except Exception:
+        state.jobman.status = ERR_RUN
+        state.jobman.error = traceback.format_exc()
+    else:
+        # As SingleChannel.run. An experiment returning INCOMPLETE is
+        # started again.
+        if rval is channel.COMPLETE:
+            state.jobman.status = DONE
+        elif rval is channel.INCOMPLETE:
+            state.jobman.status = START
+        else:
+            state.jobman.status = ERR_RUN
+            state.jobman.error = 'The experiment returned %r' % (rval,)
+    return flatten(state)
+
+
+def _run_jobs(jobs, path, seq, fsync=False):
+    """Run the jobs [(id, flat state)] of a chunk, and save their new states
+    in the batch file `seq`. Return [(id, new flat state)]."""
+    rval = [(jid, _run_job(flat)) for jid, flat in jobs]
+    _save_batch(path, seq, rval, fsync)
+    return rval
+
+
 class JobSet(object):
     """Class representing an set of jobs, each represented by their DD "state" variables.
 
     This class works in-place on the state objects that have been added to it.
+
+    A state is run by calling the function named by its `jobman.experiment`
+    key with the state and a channel, as jobman does.
+
+    The states are stored in `path` by batches: each call to `update` (or
+    `add`), and each chunk of jobs that finishes, writes the states it
+    concerns to a new jobman binary state file <path>/<n>.jbin, so the
+    values can be any picklable object. The most recent batch holding a job
+    has its current state. Writing one file per job instead would cost more
+    than running short jobs.
+
+    The jobs are run by `method`:
+      * 'multiprocess': in a pool of `processes` local processes (default:
+        the number of CPUs), `chunksize` jobs at a time. Running the jobs by
+        chunks amortizes the cost of sending them to the pool, which is
+        larger than the jobs themselves when they are short. By default the
+        waiting jobs are split in about 4 chunks per process.
+      * 'local': one after the other, in this process, when waiting for them.
+      * 'sql': by `jobman sql` workers (started by you, locally or on other
+        machines), as the jobs of the table `db` (a DbHandle or a db
+        string). The waiting jobs are inserted in the table in bulk, and
+        the states of the jobs that finished are read back from it. Only
+        the rows of the jobs still running are polled, every
+        `poll_interval` seconds; with postgres the workers also notify the
+        end of the jobs (see sql.JobListener), so the results arrive
+        without waiting for the next poll. A job whose sync failed stays in
+        ERR_SYNC, and is not finished until it is fixed by hand: the jobs
+        seen in ERR_SYNC for more than SYNC_ERROR_DELAY seconds are
+        reported on stderr.
     """
-    def __init__(self, path, erase_and_forget_on_delete=False):
+    def __init__(self, path, erase_and_forget_on_delete=False, method='multiprocess',
+                 processes=None, chunksize=None, fsync=False, db=None, poll_interval=None):
         """If the path does not exist, a directory will be created there to store the internal
         states of this DDMap
 
@@ -21,109 +126,532 @@ class JobSet(object):
 
         :param erase_and_forget_on_delete: if this is True, all files associated with this
         DDMap will be erased when this object is garbage-collected.
+        :param fsync: flush the state files to disk when they are written. It is
+        only needed to recover the states after a crash of the machine.
+        :param poll_interval: for the 'sql' method, in seconds (default: 30 if the
+        database can notify the end of the jobs, 1 otherwise).
         """
-        raise NotImplementedError()
+        if method not in METHODS:
+            raise NotImplementedError('JobSet method %r (supported: %s)' % (
+                method, ', '.join(METHODS)))
+        self._listener = None
+        if method == 'sql':
+            if db is None:
+                raise ValueError("The 'sql' method needs a db")
+            if isinstance(db, str):
+                from .api0 import open_db
+                db = open_db(db)
+            from . import sql
+            self._listener = sql.JobListener.create(db)
+            if poll_interval is None:
+                poll_interval = 1.0 if self._listener is None else 30.0
+        self.db = db
+        self.poll_interval = poll_interval
+        if processes is None:
+            processes = os.cpu_count() or 1
+        self.path = os.path.abspath(path)
+        self.erase_and_forget_on_delete = erase_and_forget_on_delete
+        self.method = method
+        self.processes = processes
+        self.chunksize = chunksize
+        self.fsync = fsync
+
+        self._states = {}    # job id -> state
+        self._status = {}    # job id -> jobman.status
+        self._ids = {}       # id(state) -> job id
+        self._waiting = collections.deque()
+        self._finished = collections.deque()   # not returned by wait_any yet
+        self._results = queue.Queue()          # chunks done by the pool
+        self._n_running = 0
+        self._next_id = 0
+        self._next_seq = 0
+        self._pool = None
+        self._sql_ids = {}     # id in the table -> job id, of the running jobs
+        self._next_poll = 0
+        self._sync_errors = {}  # id in the table -> time first seen in ERR_SYNC
+        self._sync_errors_reported = set()
+
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+        self._load()
+
+    def _load(self):
+        """Take back the states saved in self.path by a previous JobSet, and
+        compact them in a single batch file."""
+        seqs = sorted(int(name[:-len(BINARY_STATE_SUFFIX)]) for name in os.listdir(self.path)
+                      if name.endswith(BINARY_STATE_SUFFIX)
+                      and name[:-len(BINARY_STATE_SUFFIX)].isdigit())
+        if not seqs:
+            return
+        states = {}
+        for seq in seqs:
+            try:
+                batch = read_binary_state(_batch_path(self.path, seq))
+            except (OSError, ValueError) as e:
+                print('WARNING: cannot read %s (%s). Skipping it' % (
+                    _batch_path(self.path, seq), e), file=sys.stderr)
+                continue
+            for jid, state in expand(batch).items():
+                states[int(jid)] = state
+        for jid in sorted(states):
+            state = states[jid]
+            self._next_id = jid + 1
+            if state is None:
+                # Deleted
+                continue
+            status = state.jobman.status
+            if status == RUNNING:
+                if self.method == 'sql' and 'id' in state.jobman:
+                    # It is still in the table
+                    self._sql_ids[state.jobman.id] = jid
+                    self._n_running += 1
+                else:
+                    # Its process has ended
+                    status = state.jobman.status = START
+            self._insert(jid, state, status)
+
+        self._next_seq = seqs[-1] + 1
+        self._save([(jid, flatten(self._states[jid])) for jid in sorted(self._states)])
+        for seq in seqs:
+            os.remove(_batch_path(self.path, seq))
+
+    def _save(self, states):
+        _save_batch(self.path, self._new_seq(), states, self.fsync)
+
+    def _new_seq(self):
+        seq = self._next_seq
+        self._next_seq += 1
+        return seq
+
+    def _insert(self, jid, state, status):
+        self._states[jid] = state
+        self._status[jid] = status
+        self._ids[id(state)] = jid
+        if status == START:
+            self._waiting.append(jid)
 
     # ITERATORS OVER JOBS
 
     def __iter__(self):
         """Return an iterator over all internal states
         """
+        return iter(list(self._states.values()))
+
+    def __len__(self):
+        return len(self._states)
+
+    def _iter_status(self, statuses):
+        return iter([self._states[jid] for jid, status in self._status.items()
+                     if status in statuses])
 
     def iter_finished(self):
-        """Return an iterator over all internal states that have finished computation"""
-        raise NotImplementedError()
+        """Return an iterator over all internal states that have finished computation
+        (jobman.status is DONE, or an error status such as ERR_RUN if the experiment
+        raised an exception)"""
+        return iter([self._states[jid] for jid, status in self._status.items()
+                     if status not in (START, RUNNING)])
 
     def iter_running(self):
-        """Return an iterator over all internal states that have finished computation"""
-        raise NotImplementedError()
+        """Return an iterator over all internal states that are being computed
+        (or, with the 'sql' method, that are in the table)"""
+        return self._iter_status((RUNNING,))
 
     def iter_waiting(self):
-        """Return an iterator over all internal states that have finished computation"""
-        raise NotImplementedError()
+        """Return an iterator over all internal states that have not been started yet"""
+        return self._iter_status((START,))
 
-    # ITERATORS OVER JOBS
+    # ADDING AND REMOVING JOBS
 
     def update(self, state_seq):
+        """Add the job-states of `state_seq` to this pool."""
+        new = []
         for state in state_seq:
-            self.add(state)
+            if id(state) in self._ids:
+                raise ValueError('This state is already in the JobSet')
+            flat = flatten(state)
+            flat['jobman.status'] = START
+            new.append((self._next_id, state, flat))
+            self._next_id += 1
+        if not new:
+            return
+        self._save([(jid, flat) for jid, state, flat in new])
+        for jid, state, flat in new:
+            self._insert(jid, state, START)
 
     def add(self, state):
         """Add a job-state to this pool. It will be started as soon as possible."""
-        raise NotImplementedError()
+        self.update([state])
 
     def delete(self, state):
         """Remove a job-state from this pool"""
-        raise NotImplementedError()
+        jid = self._ids.pop(id(state))
+        state = self._states.pop(jid)
+        status = self._status.pop(jid)
+        if status == START:
+            self._waiting.remove(jid)
+        elif status == RUNNING and self.method == 'sql':
+            # Cancel it if it did not start yet
+            self._sql_ids.pop(state['jobman']['id'])
+            self._n_running -= 1
+            from . import sql
+            with self.db._engine.begin() as conn:
+                self.db._set_status(conn, [state['jobman']['id']], sql.CANCELED, sql.START)
+        # The result of a running job will be ignored (and it will be saved
+        # in an older batch than this one).
+        self._save([(jid, None)])
+
+    # RUNNING THE JOBS
+
+    def _chunksize(self, n):
+        if self.chunksize is not None:
+            return self.chunksize
+        # As multiprocessing.Pool.map does
+        chunksize, extra = divmod(n, self.processes * 4)
+        return chunksize + 1 if extra else chunksize
+
+    def _take_chunk(self, size):
+        jobs = []
+        while self._waiting and len(jobs) < size:
+            jid = self._waiting.popleft()
+            self._status[jid] = RUNNING
+            flat = flatten(self._states[jid])
+            flat['jobman.status'] = RUNNING
+            jobs.append((jid, flat))
+        return jobs
+
+    def _start(self):
+        """Send all the waiting jobs to the pool (or to the table)."""
+        if not self._waiting:
+            return
+        if self.method == 'sql':
+            self._start_sql()
+            return
+        if self._pool is None:
+            # (imported here, it is slow to import)
+            import multiprocessing
+            self._pool = multiprocessing.Pool(self.processes)
+        size = self._chunksize(len(self._waiting))
+        while self._waiting:
+            self._submit(self._take_chunk(size))
+
+    def _submit(self, jobs):
+        def failed(e):
+            self._results.put((jobs, e))
+        self._n_running += len(jobs)
+        self._pool.apply_async(_run_jobs, (jobs, self.path, self._new_seq(), self.fsync),
+                               callback=self._results.put, error_callback=failed)
+
+    def _collect(self, rval):
+        """Update the states with the results `rval` of a chunk."""
+        if isinstance(rval, tuple):
+            # The pool could not run the chunk (e.g. a state can't be
+            # pickled): its jobs are waiting again.
+            jobs, e = rval
+            self._n_running -= len(jobs)
+            for jid, flat in jobs:
+                if jid in self._states:
+                    self._status[jid] = START
+                    self._waiting.appendleft(jid)
+            raise e
+        for jid, flat in rval:
+            self._n_running -= 1
+            state = self._states.get(jid)
+            if state is None:
+                # Deleted while it was running
+                continue
+            state.update(expand(flat))
+            status = flat['jobman.status']
+            self._status[jid] = status
+            if status == START:
+                self._waiting.append(jid)
+            else:
+                self._finished.append(state)
+
+    def _start_sql(self):
+        from . import sql
+        size = self.chunksize or 1000
+        while self._waiting:
+            jobs = self._take_chunk(size)
+            rows = []
+            for jid, flat in jobs:
+                flat.pop('jobman.id', None)
+                row = dict(flat)
+                row[sql.STATUS] = sql.START
+                row[sql.HASH] = sql.hash_state(row)
+                row.setdefault(sql.PRIORITY, 1.0)
+                rows.append(row)
+            sql_ids = self.db.insert_many(rows)
+            for (jid, flat), sql_id in zip(jobs, sql_ids):
+                flat['jobman.id'] = sql_id
+                self._states[jid].setdefault('jobman', {})['id'] = sql_id
+                self._sql_ids[sql_id] = jid
+            self._n_running += len(jobs)
+            # Remember their ids, to find them again after a restart
+            self._save(jobs)
+
+    def _wait_sql(self, deadline):
+        """Wait for some jobs of the table to finish, until `deadline`.
+        Return False if none did."""
+        from . import sql
+        while True:
+            now = time.time()
+            full_poll = now >= self._next_poll
+            if full_poll:
+                self._next_poll = now + self.poll_interval
+                ids = list(self._sql_ids)
+            else:
+                timeout = self._next_poll - now
+                if deadline is not None:
+                    timeout = min(timeout, deadline - now)
+                if self._listener is None:
+                    time.sleep(max(0, timeout))
+                    ids = []
+                else:
+                    ids = [i for i in self._listener.wait(timeout) if i in self._sql_ids]
+            if ids:
+                sync_errors = set() if full_poll else None
+                finished = sql.finished_jobs(self.db, ids, sync_errors=sync_errors)
+                if full_poll:
+                    self._check_sync_errors(sync_errors, now)
+                if finished:
+                    self._collect_sql(finished)
+                    return True
+            if deadline is not None and time.time() >= deadline:
+                return False
+
+    def _check_sync_errors(self, sync_errors, now):
+        """Report the jobs of the table that were in ERR_SYNC at each poll
+        for SYNC_ERROR_DELAY seconds, given those in ERR_SYNC at this poll."""
+        for sql_id in list(self._sync_errors):
+            if sql_id not in sync_errors:
+                del self._sync_errors[sql_id]
+                self._sync_errors_reported.discard(sql_id)
+        stuck = []
+        for sql_id in sync_errors:
+            since = self._sync_errors.setdefault(sql_id, now)
+            if (now - since >= SYNC_ERROR_DELAY
+                    and sql_id not in self._sync_errors_reported):
+                self._sync_errors_reported.add(sql_id)
+                stuck.append(sql_id)
+        if stuck:
+            print('WARNING: the jobs %s of the table %s are in ERR_SYNC for more '
+                  'than %i seconds. They will not finish until they are fixed '
+                  '(see jobman sqlreload and jobman sqlstatus)' % (
+                      ', '.join(map(str, sorted(stuck))), self.db.tablename,
+                      SYNC_ERROR_DELAY), file=sys.stderr)
+
+    def _collect_sql(self, finished):
+        """Update the states with those of the jobs `finished` of the table
+        (see sql.finished_jobs).
+
+        The jobs that were deleted from the table are lost: they finish
+        with the status ERR_RUN and an error message.
+        """
+        rows = self.db.get_many([i for i, status in finished.items()
+                                 if status is not None])
+        done = []
+        for sql_id, status in finished.items():
+            jid = self._sql_ids.pop(sql_id)
+            self._n_running -= 1
+            state = self._states[jid]
+            flat = rows.get(sql_id)
+            if flat is None:
+                status = ERR_RUN
+                state.setdefault('jobman', {}).update(
+                    status=status,
+                    error='The job %i was deleted from the table %s' % (
+                        sql_id, self.db.tablename))
+                flat = flatten(state)
+            else:
+                flat['jobman.status'] = status
+                state.update(expand(flat))
+            self._status[jid] = status
+            self._finished.append(state)
+            done.append((jid, flat))
+        self._save(done)
+
+    def _wait(self, deadline):
+        """Wait for some running jobs to finish, until `deadline`.
+        Return False if none did."""
+        if self.method == 'sql':
+            return self._wait_sql(deadline)
+        try:
+            if deadline is None:
+                rval = self._results.get()
+            else:
+                rval = self._results.get(timeout=max(0, deadline - time.time()))
+        except queue.Empty:
+            return False
+        self._collect(rval)
+        return True
+
+    def _run_local(self, size):
+        """Run a chunk of at most `size` waiting jobs in this process."""
+        jobs = self._take_chunk(size)
+        self._n_running += len(jobs)
+        self._collect(_run_jobs(jobs, self.path, self._new_seq(), self.fsync))
 
     # RESULTS
 
     def wait_any(self, timeout=None):
-        """Block until a job finishes, then return it.  Returns None if no job is running.
+        """Block until a job finishes, then return it.  Returns None if no job is running,
+        or if none finished within `timeout` seconds.
+
+        Each finished job is returned once.
         """
-        raise NotImplementedError()
+        deadline = None if timeout is None else time.time() + timeout
+        while not self._finished:
+            if self.method == 'local':
+                if not self._waiting:
+                    return None
+                self._run_local(self.chunksize or 1)
+                continue
+            self._start()
+            if not self._n_running:
+                return None
+            if not self._wait(deadline):
+                return None
+        return self._finished.popleft()
 
     def wait_all(self, timeout=None):
         """
         Initiate computation of any un-started state jobs.
         Wait for all jobs to complete and then return.
+
+        Returns True if all the jobs are finished, False if `timeout` seconds
+        elapsed before (the 'local' method ignores `timeout`).
         """
-        if method == 'local':
-            # do a for loop over all remaining jobs
-            raise NotImplementedError()
-        if method == 'multiprocess':
-            # use  things described here:
-            # http://docs.python.org/dev/library/multiprocessing.html
-            raise NotImplementedError()
-        if method == 'ssh':
-            # ssh into a machine and run jobman over there.
-            raise NotImplementedError()
-        if method == 'bqtools':
-            raise NotImplementedError()
-        if method == 'condor':
-            raise NotImplementedError()
-        if method == 'cluster':
-            raise NotImplementedError()
+        if self.method == 'local':
+            # (jobs returning INCOMPLETE are put back in self._waiting)
+            while self._waiting:
+                self._run_local(self._chunksize(len(self._waiting)))
+        deadline = None if timeout is None else time.time() + timeout
+        while self._waiting or self._n_running:
+            self._start()
+            if not self._wait(deadline):
+                return False
+        # They were all returned
+        self._finished.clear()
+        return True
 
     # BOOKKEEPING
-    
+
+    def close(self):
+        """Stop the worker processes. The running jobs are lost (except with
+        the 'sql' method: they stay in the table)."""
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
+        if self._listener is not None:
+            self._listener.close()
+            self._listener = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type_, value, traceback):
+        if self.erase_and_forget_on_delete:
+            self.erase_and_forget()
+        else:
+            self.close()
+
+    def __del__(self):
+        try:
+            if self.erase_and_forget_on_delete:
+                self.erase_and_forget()
+            else:
+                self.close()
+        except Exception:
+            pass
+
     def erase_and_forget(self):
         """
         Delete all the files corresponding to internal state objects, and the directory
         associated to this DDMap.
+
+        With the 'sql' method, the jobs are left in the table.
         """
-        raise NotImplementedError()
+        self.close()
+        shutil.rmtree(self.path, ignore_errors=True)
+        self._states.clear()
+        self._status.clear()
+        self._ids.clear()
+        self._waiting.clear()
+        self._finished.clear()
+        self._n_running = 0
+
+
+def fully_qualified_name_of_fn(fn):
+    """Return the name under which `fn` can be found by `tools.resolve`."""
+    name = getattr(fn, '__qualname__', fn.__name__)
+    if '<' in name or fn.__module__ is None:
+        # A lambda or a function defined in another function
+        raise ValueError('%r can not be loaded from a toplevel import' % (fn,))
+    return '%s.%s' % (fn.__module__, name)
+
 
 def generic_dd_fn(state, channel):
-    """Generic driver to run an arbitary function using a job DD"""
-    raise NotImplementedError()
-    fn, args, kwargs = None, None, None
-    state.rval = fn(*args, **kwargs)
+    """Generic driver to run an arbitary function using a job DD
+
+    Calls the function named by `state.fn` with `state.arg` as argument,
+    and saves its return value in `state.rval`.
+    """
+    fn = resolve(state.fn)
+    state.rval = fn(state.arg)
+
 
+def jobset_map(fn, arg_seq, method=JobSet, path=None, cleanup=True, timeout=None, **kwargs):
+    """Perform a map operation using JobMan
 
-def jobset_map(fn, arg_seq, method=JobSet, path=None, cleanup=True):
-    """Perform a map operation using JobMan"""
-    def to_jobstate(fn, arg):
+    Return [fn(arg) for arg in arg_seq], computed by the jobs of a JobSet.
+    `fn` must be loadable from a toplevel import, and the elements of
+    `arg_seq` and the return values of `fn` must be picklable.
+
+    `method` is the JobSet class to use, or the name of a JobSet method (e.g.
+    'local', or 'sql' with db=<db string> to run the jobs with `jobman sql`
+    workers). Other keyword arguments (e.g. `processes`, `chunksize`) are
+    given to the JobSet.
+
+    With the 'sql' method, the arguments and return values are stored in the
+    table, so they must be saved by their repr, as the other values of jobman
+    states, and `fn` must be importable by the workers.
+
+    Raises RuntimeError if a call to `fn` raised an exception, or if the
+    calls did not all finish within `timeout` seconds (see JobSet.wait_all).
+    With the 'sql' method, the jobs left in the table keep running.
+    """
+    fn_name = fully_qualified_name_of_fn(fn)
+    if method == 'sql' and fn.__module__ == '__main__':
+        raise ValueError('%s can not be loaded by the workers of the sql method' % fn_name)
+
+    def to_jobstate(arg):
         """Return a DD that will compute"""
-        # TODO: ensure that fn can be loaded from a toplevel import
-        
-        # TODO: ensure that all elements of arg_seq can be put into DD instances
-
-        return dict(
-                fn=fully_qualified_name_of_fn(fn),
-                arg=arg
-                )
+        return {'jobman': {'experiment': 'jobman.jobset.generic_dd_fn'},
+                'fn': fn_name,
+                'arg': arg}
+
     def from_jobstate(state):
-        return state.rval
+        if state['jobman']['status'] != DONE:
+            raise RuntimeError('%s(%r) failed:\n%s' % (
+                fn_name, state['arg'], state['jobman'].get('error', '')))
+        return state['rval']
 
-    if path is None:
-        path = random_tmp_folder
+    if isinstance(method, str):
+        kwargs['method'] = method
+        method = JobSet
 
     #create a temporary path to sychronize jobs, which will be cleaned up automatically
-    jobset = method(path, erase_and_forget_on_delete=cleanup) 
+    if path is None:
+        path = tempfile.mkdtemp(prefix='jobset_')
 
-    states = [to_jobstate(fn, arg) for arg in arg_seq]
-    jobset.update(states)
-    jobset.wait()                     # computation takes place here
-    return list(map(from_jobstate, states))
-    
+    jobset = method(path, erase_and_forget_on_delete=cleanup, **kwargs)
+    with jobset:
+        states = [to_jobstate(arg) for arg in arg_seq]
+        jobset.update(states)
+        # computation takes place here
+        if not jobset.wait_all(timeout):
+            raise RuntimeError('%i of the %i calls of %s did not finish within %g seconds' % (
+                len(list(jobset.iter_waiting())) + len(list(jobset.iter_running())),
+                len(states), fn_name, timeout))
+        return list(map(from_jobstate, states))
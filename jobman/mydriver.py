@@ -5,8 +5,8 @@ import logging
 
 from .tools import flatten
 from .api0 import open_db as sql_db, parse_dbstring
-from .sql import HOST, HOST_WORKDIR, EXPERIMENT, FUCKED_UP
-from .sql import insert_dict, hash_state
+from .sql import HOST, HOST_WORKDIR, EXPERIMENT
+from .sql import insert_dict, hash_state, find_hashes
 
 
 class Cmd(object):
@@ -94,8 +94,6 @@ def insert(db, dbstring, argv, job_fn, job_dct_seq, exp_root, **kwargs):
     full_job_fn_name = job_fn.__module__ + '.' + job_fn.__name__
     S = db.session()
     for i, dct in enumerate(job_dct_seq):
-        # TODO: use hashlib, not the builtin hash function.  Requires changing in .sql as well, maybe more places?
-        # Also, will break old experiment code because inserts will all work even though jobs have already run.
         state = dict(flatten(dct))
         if EXPERIMENT in state:
             if state[EXPERIMENT] != full_job_fn_name:
@@ -112,12 +110,7 @@ def insert(db, dbstring, argv, job_fn, job_dct_seq, exp_root, **kwargs):
         jobhash = hash_state(state)
 
         if dryrun:
-            # TODO: detect if dct is a duplicate or not
-            if (None is S.query(db._Dict).filter(db._Dict.hash == jobhash).filter(db._Dict.status != FUCKED_UP).first()):
-                is_dup = False
-
-            else:
-                is_dup = True
+            is_dup = bool(find_hashes(db, S, [jobhash]))
             # print 'DEBUG', inserted, jobhash
         else:
             if None is insert_dict(state, db, force_dup=False, priority=1, session=S):
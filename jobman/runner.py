@@ -2,7 +2,7 @@ import os
 import sys
 import time
 import tempfile
-import inspect
+import importlib
 import shutil
 import optparse
 from optparse import OptionParser
@@ -37,7 +37,8 @@ def parse_and_run(command, arguments):
 
 
 def run(runner, arguments):
-    argspec = inspect.getargspec(runner)
+    import inspect
+    argspec = inspect.getfullargspec(runner)
     minargs = len(argspec[0])
     if argspec[3]:
         minargs -= len(argspec[3])
@@ -90,7 +91,73 @@ def warn_if_sql_failure():
 # Registry
 ################################################################################
 
-runner_registry = dict()
+class CommandRegistry(dict):
+    """Maps the name of each command to (OptionParser or None, function).
+
+    A module defining commands registers them when it is imported. The
+    modules listed in `modules` (command name -> module name) are only
+    imported when one of their commands is looked up, so that a command
+    doesn't pay for importing the others (e.g. sqlalchemy, for the sql
+    commands).
+    """
+
+    def __init__(self, modules):
+        dict.__init__(self)
+        self.modules = modules
+
+    def _import(self, module):
+        try:
+            importlib.import_module(module, __package__)
+        except ImportError as e:
+            print('WARNING: could not import %s: %s' % (module, e), file=sys.stderr)
+
+    def __missing__(self, command):
+        if command in self.modules:
+            self._import(self.modules[command])
+            if dict.__contains__(self, command):
+                return dict.__getitem__(self, command)
+        raise KeyError(command)
+
+    def __contains__(self, command):
+        try:
+            self[command]
+        except KeyError:
+            return False
+        return True
+
+    def get(self, command, default=None):
+        try:
+            return self[command]
+        except KeyError:
+            return default
+
+    def load_all(self):
+        """Import the modules of all the commands."""
+        for module in sorted(set(self.modules.values())):
+            self._import(module)
+
+    def items(self):
+        self.load_all()
+        return dict.items(self)
+
+
+runner_registry = CommandRegistry({
+    'analyze': '.analyze_runner',
+    'cachesync': '.cachesync_runner',
+    'check': '.check',
+    'findjob': '.findjob',
+    'raw': '.raw_runner',
+    'rsync_any': '.rsync_runner',
+    'serve': '.rsync_runner',
+    'sql': '.sql_runner',
+    'sqlreap': '.sql_runner',
+    'sqlrehash': '.sql_runner',
+    'sqlreload': '.sql_runner',
+    'sqlschedule': '.sql_runner',
+    'sqlschedules': '.sql_runner',
+    'sqlstatus': '.sql_runner',
+    'sqlview': '.sql_runner',
+})
 
 
 ################################################################################
@@ -142,6 +209,12 @@ parser_cmdline.add_option('--save-every', action='store',
                           dest='save_every',
                           default=None,
                           help='Interval (in seconds) after which the call to channel.switch() will return "save". Asks the experiment to save at the next checkpoint. It is up to the experiment use channel.switch() and respect it.')
+parser_cmdline.add_option('--fsync-every', action='store', type='int',
+                          dest='fsync_every', default=1,
+                          help='fsync the state files only every N saves (0: only the last one). Useful if the experiment saves very often.')
+parser_cmdline.add_option('--max-save-fraction', action='store', type='float',
+                          dest='max_save_fraction', default=None,
+                          help='Stretch the --save-every interval so that saving takes at most this fraction of the time (e.g. 0.05). Disabled by default.')
 
 
 def runner_cmdline(options, experiment, *strings):
@@ -194,6 +267,8 @@ def runner_cmdline(options, experiment, *strings):
                               save_interval=options.save_every or None
                               )
     channel.catch_sigint = not options.allow_sigint
+    channel.fsync_every = options.fsync_every
+    channel.max_save_fraction = options.max_save_fraction
     channel.run(force=options.force)
     if options.dry_run:
         shutil.rmtree(workdir, ignore_errors=True)
@@ -374,6 +449,11 @@ def runner_help(options, topic=None):
             b=2.3         state.b <- 2.3
             c.d="hello"   state.c.d <- "hello"
 
+          The value is parsed as a python literal (number, inf, nan,
+          string, True, False, None, or tuple, list, set or dict of
+          those). Anything else is kept as a string: expressions like
+          2**10 are not evaluated, unless you use --parser=eval_filemerge.
+
         key::builder
 
           This is equivalent to key.__builder__=builder.
@@ -2,20 +2,14 @@ import sys
 import copy
 import time
 import hashlib
+import numbers
 import random
 import json
+import importlib.util
 
-sqlalchemy_ok = True
-try:
-    import sqlalchemy
-    from sqlalchemy.orm import eagerload
-    try:
-        from sqlalchemy.orm.exc import StaleDataError as CONCURRENT_ERROR
-    except ImportError:
-        from sqlalchemy.orm.exc import ConcurrentModificationError as CONCURRENT_ERROR
-
-except ImportError:
-    sqlalchemy_ok = False
+# sqlalchemy is slow to import: it is only imported by the functions that
+# access a db, so that the commands that don't use one start quickly.
+sqlalchemy_ok = importlib.util.find_spec('sqlalchemy') is not None
 
 JOBID = 'jobman.id'
 EXPERIMENT = 'jobman.experiment'
@@ -35,6 +29,8 @@ ERR_START = 3
 ERR_SYNC = 4
 ERR_RUN = 5
 CANCELED = -1
+# waiting for other jobs to be DONE, see DbHandle.add_dependencies
+WAITING = 6
 FUCKED_UP = 666
 
 _TEST_CONCURRENCY = False
@@ -51,7 +47,114 @@ def hash_js(js):
     return hashlib.sha224(js.encode('utf-8')).hexdigest()
 
 
-def book_dct_postgres_serial(db, retry_max_sleep=10.0, verbose=1):
+def _concurrent_error():
+    """Return the exception raised by sqlalchemy when a concurrent
+    transaction modified the same rows."""
+    try:
+        from sqlalchemy.orm.exc import StaleDataError
+        return StaleDataError
+    except ImportError:
+        from sqlalchemy.orm.exc import ConcurrentModificationError
+        return ConcurrentModificationError
+
+
+class BookingPolicy(object):
+    """Order in which the jobs waiting in a table are booked.
+
+    Jobs are booked by decreasing effective priority: their priority, plus
+    `aging` per full hour spent waiting since their insertion (jobs
+    inserted by an older jobman don't age). Among the jobs of equal
+    effective priority, the group (the value of `group_key`, the experiment
+    by default) with the fewest running jobs, relative to its weight in
+    `weights` (default 1), goes first, so that groups sharing a table get
+    their share of the workers whatever their number of jobs. Remaining
+    ties are broken by id, first inserted first.
+
+    Aging is applied by whole hours so that the jobs of equal priority
+    inserted within the same hour tie, and fair share orders them: aging
+    continuously would give every job a different effective priority, and
+    fair share would never apply. A job that waited an hour more than
+    another still goes first, whatever the groups: that is the point of
+    aging.
+
+    `group_key` must be a key with string values. With group_key=None,
+    there is no fair share.
+
+    All this is computed by the booking query.
+    """
+
+    def __init__(self, group_key=EXPERIMENT, weights=None, aging=0.0):
+        self.group_key = group_key
+        self.weights = dict(weights or {})
+        self.aging = aging
+
+    def order(self, db, q):
+        """Return query `q` on the jobs of `db` in booking order."""
+        from sqlalchemy import Integer, and_, case, cast, extract, func, literal
+        from sqlalchemy.orm import aliased
+
+        D = db._Dict
+        order = []
+
+        priority = func.coalesce(D.priority, 0.0)
+        if self.aging:
+            # priority + aging * (full hours since create)
+            created = extract('epoch', D.create)
+            now = time.time()
+            hours = (now - func.coalesce(created, now)) / 3600.0
+            if db._engine.dialect.name == 'sqlite':
+                # (no floor(), but the cast truncates)
+                hours = cast(hours, Integer)
+            else:
+                hours = func.floor(hours)
+            priority = priority + self.aging * hours
+        order.append(priority.desc())
+
+        if self.group_key:
+            group = aliased(db._KeyVal)
+            q = q.outerjoin(group, and_(group.dict_id == D.id,
+                                        group.name == self.group_key))
+
+            # number of RUNNING jobs per group
+            R = aliased(D)
+            running_group = aliased(db._KeyVal)
+            running = (q.session.query(running_group.sval.label('grp'),
+                                       func.count(R.id).label('n'))
+                       .join(R, R.id == running_group.dict_id)
+                       .filter(R.status == RUNNING)
+                       .filter(running_group.name == self.group_key)
+                       .group_by(running_group.sval)
+                       .subquery())
+            q = q.outerjoin(running, running.c.grp == group.sval)
+
+            share = func.coalesce(running.c.n, 0)
+            if self.weights:
+                share = share * case(
+                    dict((g, 1.0 / w) for g, w in self.weights.items()),
+                    value=group.sval, else_=literal(1.0))
+            order.append(share.asc())
+
+        order.append(D.id.asc())
+        return q.order_by(*order)
+
+
+def parse_share_weights(s):
+    """Parse weights given as 'group:weight,group:weight' (see BookingPolicy).
+
+    >>> sorted(parse_share_weights('a.b:2,c.d:0.5').items())
+    [('a.b', 2.0), ('c.d', 0.5)]
+    """
+    weights = {}
+    for item in s.split(','):
+        if item:
+            group, weight = item.rsplit(':', 1)
+            weights[group] = float(weight)
+            if weights[group] <= 0:
+                raise ValueError('share weights must be positive', item)
+    return weights
+
+
+def book_dct_postgres_serial(db, retry_max_sleep=10.0, verbose=1, policy=None):
     """Find a trial in the lisa_db with status START.
 
     A trial will be returned with status=RUNNING.
@@ -62,7 +165,16 @@ def book_dct_postgres_serial(db, retry_max_sleep=10.0, verbose=1):
     process will retrieve the same dct.  It is designed to facilitate writing
     a "consumer" for a Producer-Consumer pattern based on the database.
 
+    The trial is chosen according to `policy`, a BookingPolicy (default:
+    BookingPolicy()).
+
     """
+    import sqlalchemy.exc
+    from sqlalchemy.orm import eagerload
+    CONCURRENT_ERROR = _concurrent_error()
+    if policy is None:
+        policy = BookingPolicy()
+
     print("""#TODO: use the priority field, not the status.""", file=sys.stderr)
     print("""#TODO: ignore entries with key PUSH_ERROR.""", file=sys.stderr)
 
@@ -86,7 +198,7 @@ def book_dct_postgres_serial(db, retry_max_sleep=10.0, verbose=1):
         # use dedicated column to retrieve jobs, not the dictionary keyval pair
         # This should be much faster.
         q = q.filter(db._Dict.status == START)
-        q = q.order_by(db._Dict.priority.desc())
+        q = policy.order(db, q)
 
         # this doesn't seem to work, hene the string hack below
         q = q.options(eagerload('_attrs'))  # hard-coded in api0
@@ -108,7 +220,21 @@ def book_dct_postgres_serial(db, retry_max_sleep=10.0, verbose=1):
                 if verbose:
                     print('book_unstarted_dct retrieved, ', dct)
 
+                # Take the job only if it is still START: without
+                # serializable transactions (sqlite), another worker may
+                # have booked it since the query.
+                t = db._dict_table
+                taken = s.execute(t.update()
+                                  .where(t.c.id == dct.id)
+                                  .where(t.c.status == START)
+                                  .values(status=RUNNING))
+                if taken.rowcount != 1:
+                    s.rollback()
+                    dct = None
+                    continue
                 dct._set_in_session(STATUS, RUNNING, s)
+                # start the lease, see reap_expired_jobs
+                dct.write = db.utcnow()
                 if _TEST_CONCURRENCY:
                     print('SLEEPING BEFORE BOOKING', file=sys.stderr)
                     time.sleep(10)
@@ -143,6 +269,192 @@ def book_dct_postgres_serial(db, retry_max_sleep=10.0, verbose=1):
     return dct
 
 
+def reap_expired_jobs(db, lease, priority=2.0, dry_run=False, verbose=1):
+    """Put the RUNNING jobs whose lease has expired back to START.
+
+    A running job renews its lease by updating the `write` column of its
+    row (see DbHandle.heartbeat). If that did not happen for `lease`
+    seconds, the process running the job is considered dead (killed by the
+    OOM killer, node crash, ...), the job is set back to START and its
+    priority is raised to at least `priority`, so it is booked again before
+    the jobs that never ran. The times are those of the database server.
+
+    The expired rows are locked (SELECT ... FOR UPDATE, on the databases
+    that support it) and updated in the same transaction, with the
+    conditions checked again, so that a job whose heartbeat arrives in
+    between is not reaped.
+
+    Jobs booked by a jobman without heartbeats (NULL `write`) are left
+    alone.
+
+    Returns the list of the ids of the reaped jobs.
+
+    """
+    from sqlalchemy import and_, or_, select
+    from .api0 import _keyval_columns
+
+    t = db._dict_table
+    kv = db._pair_table
+    expired = and_(t.c.status == RUNNING, t.c.write < db.utcnow(lease))
+    priority = float(priority)
+
+    with db._engine.begin() as conn:
+        rows = conn.execute(select([t.c.id, t.c.write])
+                            .where(expired)
+                            .order_by(t.c.id)
+                            .with_for_update()).fetchall()
+        ids = [id for id, write in rows]
+        if verbose:
+            for id, write in rows:
+                print('job %i: no heartbeat since %s' % (id, write))
+        if dry_run:
+            return ids
+
+        reaped = []
+        for i in range(0, len(ids), 500):
+            chunk = ids[i:i + 500]
+            chunk_reaped = [id for id, in conn.execute(
+                select([t.c.id]).where(t.c.id.in_(chunk)).where(expired))]
+            if not chunk_reaped:
+                continue
+            reaped.extend(chunk_reaped)
+            conn.execute(t.update()
+                         .where(t.c.id.in_(chunk_reaped))
+                         .values(status=START))
+            conn.execute(kv.update()
+                         .where(kv.c.dict_id.in_(chunk_reaped))
+                         .where(kv.c.name == STATUS)
+                         .values(ival=START))
+            low = [id for id, in conn.execute(
+                select([t.c.id]).where(t.c.id.in_(chunk_reaped))
+                .where(or_(t.c.priority.is_(None), t.c.priority < priority)))]
+            if low:
+                conn.execute(t.update()
+                             .where(t.c.id.in_(low))
+                             .values(priority=priority))
+                # the priority key, replaced or added
+                conn.execute(kv.delete()
+                             .where(kv.c.dict_id.in_(low))
+                             .where(kv.c.name == PRIORITY))
+                conn.execute(kv.insert(), [
+                    dict(dict_id=id, name=PRIORITY, **_keyval_columns(priority))
+                    for id in low])
+        return reaped
+
+
+def count_jobs(db):
+    """Return a dict mapping each status to the number of jobs of `db`
+    that have it, computed by one aggregated query."""
+    from sqlalchemy import func
+
+    s = db.session()
+    try:
+        q = s.query(db._Dict.status, func.count(db._Dict.id))
+        return dict(q.group_by(db._Dict.status).all())
+    finally:
+        s.close()
+
+
+def finished_jobs(db, ids, chunksize=500, sync_errors=None):
+    """Return a dict mapping those of the jobs `ids` that are not waiting
+    or running anymore (they are DONE, ERR_START, ERR_RUN or CANCELED) to
+    their status, and those that are not in the table anymore (deleted) to
+    None.
+
+    ERR_SYNC is not in the list: the workers set it for a moment each time
+    they save a job. A job that really stays in ERR_SYNC has to be fixed by
+    hand (see `jobman sqlreload`) anyway. If `sync_errors` is a set, the
+    ids of the jobs in ERR_SYNC are added to it.
+
+    Only the rows of `ids` are read (by primary key), `chunksize` ids per
+    query, so polling the jobs of a large table stays cheap.
+    """
+    from sqlalchemy.sql import select
+    t = db._dict_table
+    ended = (DONE, ERR_START, ERR_RUN, CANCELED)
+    ids = list(ids)
+    rval = {}
+    conn = db._engine.connect()
+    try:
+        for i in range(0, len(ids), chunksize):
+            chunk = ids[i:i + chunksize]
+            q = select([t.c.id, t.c.status]).where(t.c.id.in_(chunk))
+            status = dict(conn.execute(q).fetchall())
+            for id in chunk:
+                if id not in status:
+                    rval[id] = None
+                elif status[id] in ended:
+                    rval[id] = status[id]
+                elif status[id] == ERR_SYNC and sync_errors is not None:
+                    sync_errors.add(id)
+    finally:
+        conn.close()
+    return rval
+
+
+def _notify_channel(db):
+    # Names of postgres channels are identifiers
+    return 'jobman_%s' % db.tablename.replace('"', '')
+
+
+def notify_job_end(db, id):
+    """Tell the JobListeners of the table of `db` that job `id` ended.
+
+    This is a postgres NOTIFY; it does nothing with the other databases.
+    """
+    if db._engine.dialect.name != 'postgresql':
+        return
+    from sqlalchemy import text
+    conn = db._engine.connect().execution_options(isolation_level='AUTOCOMMIT')
+    try:
+        conn.execute(text('SELECT pg_notify(:channel, :payload)'),
+                      channel=_notify_channel(db), payload=str(id))
+    finally:
+        conn.close()
+
+
+class JobListener(object):
+    """Receive the ids of the jobs of a table that end (see notify_job_end),
+    with postgres LISTEN.
+
+    Use `JobListener.create(db)`, which returns None for the databases
+    that don't support it.
+    """
+
+    def __init__(self, db):
+        self.conn = db._engine.raw_connection()
+        # The notifications are only delivered outside of transactions
+        self.conn.connection.autocommit = True
+        cursor = self.conn.cursor()
+        cursor.execute('LISTEN "%s"' % _notify_channel(db))
+        cursor.close()
+
+    @classmethod
+    def create(cls, db):
+        if db._engine.dialect.name != 'postgresql':
+            return None
+        return cls(db)
+
+    def wait(self, timeout):
+        """Return the ids of the jobs that ended, waiting at most `timeout`
+        seconds for one if there is none yet."""
+        import select
+        pgconn = self.conn.connection
+        pgconn.poll()
+        if not pgconn.notifies:
+            select.select([pgconn], [], [], max(0, timeout))
+            pgconn.poll()
+        ids = []
+        while pgconn.notifies:
+            payload = pgconn.notifies.pop(0).payload
+            if payload.isdigit():
+                ids.append(int(payload))
+        return ids
+
+    def close(self):
+        self.conn.close()
+
+
 def book_dct_non_postgres(db):
     print("""#TODO: use the priority field, not the status.""", file=sys.stderr)
     print("""#TODO: ignore entries with key self.push_error.""", file=sys.stderr)
@@ -162,7 +474,92 @@ def db(dbstr):
 ###########
 
 
+# Version of the state fingerprint computed by hash_state. It is digested
+# with the state, so that fingerprints computed with a different encoding
+# never match.
+HASH_VERSION = 1
+
+
+def _hashed_key(key):
+    """Whether `key` is part of the fingerprint of a state.
+
+    The jobman.* keys are set by jobman when the job is inserted or run
+    (status, priority, host, times...), only the experiment is kept.
+    """
+    return not key.startswith('jobman.') or key == EXPERIMENT
+
+
+def _canonical(value, out):
+    """Append to list `out` strings encoding `value` and its type, such that
+    equal states give the same strings in any interpreter."""
+    t = type(value)
+    if t is str:
+        out.append(f's{len(value)}:{value}')
+    elif t is float:
+        out.append('f' + repr(value))
+    elif t is int:
+        out.append('i%i' % value)
+    elif value is None or t is bool:
+        out.append(repr(value))
+    elif isinstance(value, str):
+        out.append(f's{len(value)}:{value}')
+    elif isinstance(value, numbers.Integral):
+        # numpy integers, ...
+        out.append('i%i' % value)
+    elif isinstance(value, numbers.Real):
+        out.append('f' + repr(float(value)))
+    elif isinstance(value, bytes):
+        out.append('b' + repr(value))
+    elif isinstance(value, (list, tuple)):
+        # The db may return a tuple for a list (or vice versa)
+        out.append('[%i' % len(value))
+        for v in value:
+            _canonical(v, out)
+    elif isinstance(value, dict):
+        out.append('{%i' % len(value))
+        for k in sorted(value, key=str):
+            _canonical(str(k), out)
+            _canonical(value[k], out)
+    elif isinstance(value, (set, frozenset)):
+        # The iteration order of a set depends on PYTHONHASHSEED: sort the
+        # encodings of the elements
+        encoded = []
+        for v in value:
+            v_out = []
+            _canonical(v, v_out)
+            encoded.append('\x1f'.join(v_out))
+        encoded.sort()
+        out.append('<%i' % len(encoded))
+        out.extend(encoded)
+    else:
+        out.append('r%s.%s:%r' % (t.__module__, t.__qualname__, value))
+
+
 def hash_state(state):
+    """Return the fingerprint of the (flat) job dictionary `state`.
+
+    It is a signed 64-bit integer (it fits the `hash` column): the BLAKE2b
+    digest of a canonical encoding of the items of the state, ignoring the
+    keys set by jobman (see _hashed_key). It does not depend on the
+    interpreter, so it can be compared with the fingerprints computed by
+    other processes and stored in the db.
+    """
+    out = []
+    for key in sorted(state):
+        if not _hashed_key(key):
+            continue
+        # The keys are strings, and each is followed by a value
+        out.append(key)
+        _canonical(state[key], out)
+    digest = hashlib.blake2b('\x1f'.join(out).encode('utf-8', 'surrogatepass'),
+                             digest_size=8,
+                             person=b'jobman.state.v%i' % HASH_VERSION).digest()
+    return int.from_bytes(digest, 'big', signed=True)
+
+
+def hash_state_sha224(state):
+    """Fingerprint used before HASH_VERSION 1. It uses the builtin hash(),
+    so it is not stable across interpreters."""
     l = sorted((k, str(v)) for k, v in state.items())
     rl = repr(l)
     if isinstance(rl, str):
@@ -175,6 +572,19 @@ def hash_state_old(state):
     return hash(repr(state))
 
 
+def find_hashes(db, session, hashes):
+    """Return the subset of `hashes` that are the hash of a job of `db`
+    (except the FUCKED_UP ones)."""
+    hashes = list(set(hashes))
+    rval = set()
+    # Keep the IN clauses of a reasonable size
+    for i in range(0, len(hashes), 500):
+        q = session.query(db._Dict.hash).filter(db._Dict.hash.in_(hashes[i:i + 500]))
+        q = q.filter(db._Dict.status != FUCKED_UP)
+        rval.update(h for h, in q)
+    return rval
+
+
 def insert_dict(jobdict, db, force_dup=False, session=None, priority=1.0, hashalgo=hash_state):
     """Insert a new `job` dictionary into database `db`.
 
@@ -193,8 +603,7 @@ def insert_dict(jobdict, db, force_dup=False, session=None, priority=1.0, hashal
     else:
         s = session
 
-    do_insert = force_dup or (None is s.query(db._Dict).filter(
-        db._Dict.hash == jobhash).filter(db._Dict.status != FUCKED_UP).first())
+    do_insert = force_dup or not find_hashes(db, s, [jobhash])
 
     rval = None
     if do_insert:
@@ -226,10 +635,8 @@ def insert_job(experiment_fn, state, db, force_dup=False, session=None, priority
     return insert_dict(state, db, force_dup=force_dup, session=session, priority=priority)
 
 
-# TODO: FIXME: WARNING
-# Should use insert_dict instead of db.insert.  Need one entry point for adding jobs to
-# database, so that hashing can be done consistently
-def add_experiments_to_db(jobs, db, verbose=0, force_dup=False, type_check=None, session=None):
+def add_experiments_to_db(jobs, db, verbose=0, force_dup=False, type_check=None, session=None,
+                          after=()):
     """Add experiments paramatrized by jobs[i] to database db.
 
     Default behaviour is to ignore jobs which are already in the database.
@@ -244,33 +651,57 @@ def add_experiments_to_db(jobs, db, verbose=0, force_dup=False, type_check=None,
     :param verbose: print which jobs are added and which are skipped
     :param force_dup: forces insertion even if an identical dictionary is already in the db.
     :type force_dup: Bool
+    :param after: ids of jobs that must be DONE before the inserted jobs can start
+    :type after: list of int
 
     :returns: list of (Bool,job[i]) in which the flags mean the corresponding job actually was
     inserted.
 
     """
-    rval = []
-    for job in jobs:
-        job = copy.copy(job)
-        if session is None:
-            s = db.session()
-            do_insert = force_dup or (None is db.query(s).filter_eq_dct(job).first())
-            s.close()
-        else:
-            do_insert = force_dup or (None is db.query(session).filter_eq_dct(job).first())
+    jobs = [copy.copy(job) for job in jobs]
+    hashes = [hash_state(job) for job in jobs]
 
-        if do_insert:
+    if after:
+        # Check the parents before inserting jobs that would wait forever
+        s = db.session()
+        found = set(i for i, in s.query(db._Dict.id).filter(db._Dict.id.in_(after)))
+        s.close()
+        missing = sorted(set(after) - found)
+        if missing:
+            raise ValueError('No job with id(s) %s' % missing)
+
+    if force_dup:
+        seen = set()
+    elif session is None:
+        s = db.session()
+        seen = find_hashes(db, s, hashes)
+        s.close()
+    else:
+        seen = find_hashes(db, session, hashes)
+
+    rval = []
+    for job, jobhash in zip(jobs, hashes):
+        if jobhash not in seen:
             if type_check:
                 for k, v in list(job.items()):
                     if type(v) != getattr(type_check, k):
                         raise TypeError('Experiment contains value with wrong type',
                                         ((k, v), getattr(type_check, k)))
 
-            job[STATUS] = START
+            job[STATUS] = WAITING if after else START
             job[PRIORITY] = 1.0
+            job[HASH] = jobhash
             if verbose:
                 print('ADDING  ', job)
-            db.insert(job)
+            if after:
+                # The job and its dependencies are inserted in one
+                # transaction: nothing is inserted if a parent is missing.
+                db.insert_many([job], after=after)
+            else:
+                db.insert(job)
+            if not force_dup:
+                # Don't insert the same job twice either
+                seen.add(jobhash)
             rval.append((True, job))
         else:
             if verbose:
@@ -279,6 +710,52 @@ def add_experiments_to_db(jobs, db, verbose=0, force_dup=False, type_check=None,
     return rval
 
 
+def rehash_jobs(db, dry_run=False, verbose=1, chunksize=1000):
+    """Recompute the hash of the jobs of `db` that never started with
+    hash_state.
+
+    Tables filled by an older jobman have hashes computed differently (or
+    none at all, for the jobs added by add_experiments_to_db), which would
+    not match those of the jobs inserted now. The hash can only be computed
+    from the current state of a job, which is its state at insertion only
+    if the job never started (START or WAITING, and no jobman.start_time):
+    the hashes of the other jobs are left as they are. A job that ran may
+    have added results to its state, and its hash must keep matching the
+    state it was inserted with.
+
+    Returns the number of jobs whose hash changed.
+    """
+    from sqlalchemy.orm import eagerload
+    n_changed = 0
+    last_id = -1
+    while True:
+        s = db.session()
+        try:
+            q = s.query(db._Dict).filter(db._Dict.id > last_id)
+            q = q.filter(db._Dict.status.in_([START, WAITING]))
+            q = q.order_by(db._Dict.id).limit(chunksize)
+            dcts = q.options(eagerload('_attrs')).all()
+            if not dcts:
+                return n_changed
+            for dct in dcts:
+                state = dict(dct.items())
+                if 'jobman.start_time' in state:
+                    # put back to START after it ran
+                    continue
+                jobhash = hash_state(state)
+                if dct.hash != jobhash:
+                    n_changed += 1
+                    if verbose > 1:
+                        print('job %i: hash %s -> %i' % (dct.id, dct.hash, jobhash))
+                    if not dry_run:
+                        dct._set_in_session(HASH, jobhash, s)
+            last_id = dcts[-1].id
+            if not dry_run:
+                s.commit()
+        finally:
+            s.close()
+
+
 def duplicate_job(db, job_id, priority=1.0, delete_keys=[], *args, **kwargs):
     """
     In its simplest form, this function retrieves a specific job from the database, and
@@ -301,9 +778,9 @@ def duplicate_job(db, job_id, priority=1.0, delete_keys=[], *args, **kwargs):
     newjob = dict(jobdict[0])  # this detaches the job dict from the api0.Dict object
 
     # those should be added @ insertion time
-    newjob.pop(HASH)
-    newjob.pop(STATUS)
-    newjob.pop(PRIORITY)
+    newjob.pop(HASH, None)
+    newjob.pop(STATUS, None)
+    newjob.pop(PRIORITY, None)
 
     # These ones should be removed
     for key in delete_keys:
@@ -1,7 +1,12 @@
+import ast
 import sys
 import os
 import re
 import copy
+import pickle
+import struct
+import tempfile
+import mmap
 # We use Numpy to de-serialize Inf and NaN. If Numpy is not available then they
 # will be de-serialized as strings instead.
 try:
@@ -10,60 +15,119 @@ except ImportError:
     numpy = None
 
 from functools import partial
-try:
-    from . import sql
-except ImportError as _sqlex:
-    print('Error importing sql: {}'.format(_sqlex))
+from itertools import chain
 
 ################################################################################
 # misc
 ################################################################################
 
 
+# Values that copy.deepcopy returns as they are
+_ATOMIC_TYPES = frozenset([int, float, complex, str, bytes, bool, type(None)])
+
+
 class DD(dict):
-    def __getattr__(self, attr):
-        if attr == '__getstate__':
-            return super(DD, self).__getstate__
-        elif attr == '__setstate__':
-            return super(DD, self).__setstate__
-        elif attr == '__slots__':
-            return super(DD, self).__slots__
+    # No instance __dict__: all the attributes are items.
+    __slots__ = ()
 
+    # Only called when the attribute is not found on the class.
+    def __getattr__(self, attr):
         try:
             return self[attr]
         except KeyError:
-            raise AttributeError(attr)
-#         if attr.startswith('__'):
-#             return super(DD, self).__getattr__(attr)
-#         try:
-#             return self[attr]
-#         except KeyError:
-#             raise AttributeError(attr)
+            raise AttributeError(attr) from None
 
     def __setattr__(self, attr, value):
         # Safety check to ensure consistent behavior with __getattr__.
         assert attr not in ('__getstate__', '__setstate__', '__slots__')
-#         if attr.startswith('__'):
-#             return super(DD, self).__setattr__(attr, value)
         self[attr] = value
 
+    def __delattr__(self, attr):
+        try:
+            del self[attr]
+        except KeyError:
+            raise AttributeError(attr) from None
+
     def __str__(self):
         return 'DD%s' % dict(self)
 
     def __repr__(self):
         return str(self)
 
+    def __copy__(self):
+        return DD(self)
+
     def __deepcopy__(self, memo):
         z = DD()
+        memo[id(self)] = z
+        deepcopy = copy.deepcopy
         for k, kv in self.items():
-            z[k] = copy.deepcopy(kv, memo)
+            z[k] = kv if type(kv) in _ATOMIC_TYPES else deepcopy(kv, memo)
         return z
 
+    def freeze(self):
+        """Return a frozen (hashable) copy of this DD, see freeze()."""
+        return freeze(self)
+
+
+def freeze(obj):
+    """Return an immutable version of `obj`: dictionaries become
+    FrozenDDs, lists tuples and sets frozensets, recursively. Other values
+    are returned as they are."""
+    if isinstance(obj, FrozenDD):
+        return obj
+    if isinstance(obj, dict):
+        return FrozenDD((k, freeze(v)) for k, v in obj.items())
+    if isinstance(obj, (list, tuple)):
+        return tuple(freeze(v) for v in obj)
+    if isinstance(obj, (set, frozenset)):
+        return frozenset(freeze(v) for v in obj)
+    return obj
+
+
+class FrozenDD(DD):
+    """A DD that can't be modified, and can be hashed (if its values can).
+
+    Use DD.freeze() or freeze() to make one from a nested state.
+    """
+    __slots__ = ('_hash',)
+
+    def _immutable(self, *args, **kwargs):
+        raise TypeError('FrozenDD objects are immutable')
+
+    __setitem__ = __delitem__ = __setattr__ = __delattr__ = _immutable
+    clear = pop = popitem = setdefault = update = __ior__ = _immutable
+
+    def __hash__(self):
+        try:
+            # not self._hash, which would fall back on the item '_hash'
+            return object.__getattribute__(self, '_hash')
+        except AttributeError:
+            h = hash(frozenset(self.items()))
+            object.__setattr__(self, '_hash', h)
+            return h
+
+    def __str__(self):
+        return 'FrozenDD%s' % dict(self)
+
+    def __reduce__(self):
+        return (FrozenDD, (dict(self),))
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return FrozenDD((k, copy.deepcopy(v, memo)) for k, v in self.items())
+
 
 def defaults_merge(d, defaults):
     for k, v in defaults.items():
         if isinstance(v, dict):
-            defaults_merge(d.setdefault(k, DD()), v)
+            try:
+                sub = d[k]
+            except KeyError:
+                sub = d[k] = DD()
+            defaults_merge(sub, v)
         else:
             d.setdefault(k, v)
 
@@ -145,61 +209,161 @@ def reval(s, **d):
 ################################################################################
 
 
+# Values of these types are never flattened (see _flatten_leaf).
+_LEAF_TYPES = frozenset([str, int, float, bool, list, tuple, set, type(None)])
+
+
+def _flatten_leaf(obj):
+    """Return True if flatten() stores `obj` as a value rather than
+    flattening it."""
+    if type(obj) in _LEAF_TYPES:
+        return True
+    # Dictionaries that are not instances of `DD` and have keys which are
+    # not strings are not flattened: otherwise we would lose the unique
+    # mapping between the dictionary version and the flattened version.
+    if isinstance(obj, dict):
+        if isinstance(obj, DD):
+            return False
+        for k in obj.keys():
+            if not isinstance(k, str):
+                return True
+        return False
+    # TODO: add numpy.floating, numpy.integer?
+    # add numpy.ndarray
+    return (isinstance(obj, (str, int, float, list, tuple, set)) or
+            obj in (True, False, None))
+
+
+def _flatten_items(obj, prefix):
+    if isinstance(obj, dict):
+        return iter(obj.items())
+    elif hasattr(obj, 'state'):
+        subd = obj.state()
+        subd['__builder__'] = '%s.%s' % (obj.__module__, obj.__class__.__name__)
+        return iter(subd.items())
+    raise TypeError('Cannot flatten object %s, of type %s, for prefix %s' %
+                    (str(obj), str(type(obj)), prefix))
+
+
 def flatten(obj):
     """nested dictionary -> flat dictionary with '.' notation """
-    d = {}
+    if _flatten_leaf(obj):
+        return {'': obj}
 
-    def helper(d, prefix, obj):
-        # Dictionaries that are not instances of `DD` and have keys which are
-        # not strings are not flattened: otherwise we would lose the unique
-        # mapping between the dictionary version and the flattened version.
-        prevent_flatten = False
-        if isinstance(obj, dict) and not isinstance(obj, DD):
-            for k in obj.keys():
-                if not isinstance(k, str):
-                    prevent_flatten = True
-                    break
-        # TODO: add numpy.floating, numpy.integer?
-        if (prevent_flatten or
-            # add numpy.ndarray
-            isinstance(obj, (str, str, int, float, list, tuple, set)) or
-                obj in (True, False, None)):
-            # We do not flatten these objects.
-            d[prefix] = obj  # convert(obj)
-        else:
-            if isinstance(obj, dict):
-                subd = obj
-            elif hasattr(obj, 'state'):
-                subd = obj.state()
-                subd['__builder__'] = '%s.%s' % (obj.__module__, obj.__class__.__name__)
+    # Fast path for dictionaries that are already flat
+    if isinstance(obj, dict) and all(type(v) in _LEAF_TYPES for v in obj.values()):
+        return dict(obj)
+
+    d = {}
+    # Depth-first traversal, with a stack of (prefix, items left to visit),
+    # so that the keys are in the same order as with a recursive traversal.
+    stack = [('', _flatten_items(obj, ''))]
+    while stack:
+        prefix, items = stack[-1]
+        for k, v in items:
+            if prefix:
+                k = prefix + '.' + k
+            if _flatten_leaf(v):
+                d[k] = v  # convert(obj)
             else:
-                raise TypeError('Cannot flatten object %s, of type %s, for prefix %s' %
-                                (str(obj), str(type(obj)), prefix))
-            for k, v in subd.items():
-                if prefix:
-                    pfx = '.'.join([prefix, k])
-                else:
-                    pfx = k
-                helper(d, pfx, v)
-    helper(d, '', obj)
+                stack.append((k, _flatten_items(v, k)))
+                break
+        else:
+            stack.pop()
     return d
 
 
+# Dotted key -> (parent key, last part, all the parts)
+_split_cache = {}
+_SPLIT_CACHE_SIZE = 100000
+
+
+def _split_key(k):
+    try:
+        return _split_cache[k]
+    except KeyError:
+        keys = tuple(sys.intern(x) for x in k.split('.'))
+        split = (k.rpartition('.')[0], keys[-1], keys)
+        if len(_split_cache) >= _SPLIT_CACHE_SIZE:
+            _split_cache.clear()
+        _split_cache[k] = split
+        return split
+
+
 def expand(d, dict_type=DD):
     """inverse of flatten()"""
     struct = dict_type()
+    # dotted key -> sub-dictionary, for the parents already found
+    parents = {'': struct}
     for k, v in d.items():
         if k == '':
             raise NotImplementedError()
-        else:
-            keys = k.split('.')
-        current = struct
-        for k2 in keys[:-1]:
-            current = current.setdefault(k2, dict_type())
-        current[keys[-1]] = v  # convert(v)
+        if '.' not in k:
+            struct[k] = v
+            continue
+        parent_key, last, keys = _split_key(k)
+        current = parents.get(parent_key)
+        if current is None:
+            current = struct
+            for k2 in keys[:-1]:
+                try:
+                    current = current[k2]
+                except KeyError:
+                    current[k2] = current = dict_type()
+            parents[parent_key] = current
+        current[last] = v  # convert(v)
     return struct
 
 
+class IncrementalFlattener(object):
+    """Flatten states, and keep the keys and values that were flattened,
+    so that only the keys whose value changed since are returned.
+
+    Use it to write only the changes of a state that is saved again and
+    again. `changes` does not forget the previous values until `commit`
+    is called (once the changes were written).
+    """
+
+    def __init__(self):
+        self.committed = {}
+        self.pending = None
+
+    def changes(self, obj):
+        """Return the flat dictionary of the keys of `obj` whose value
+        changed (or that are new) since the last commit."""
+        flat = flatten(obj)
+        committed = self.committed
+        changed = {}
+        for k, v in flat.items():
+            try:
+                old = committed[k]
+            except KeyError:
+                changed[k] = v
+                continue
+            try:
+                same = type(old) is type(v) and bool(old == v or (old != old and v != v))
+            except Exception:
+                same = False
+            if not same:
+                changed[k] = v
+        self.pending = flat
+        return changed
+
+    def commit(self):
+        """Remember the values of the last call to `changes` as written."""
+        if self.pending is not None:
+            # Keep copies of mutable values, which could be modified in place.
+            self.committed = dict(
+                (k, copy.deepcopy(v) if isinstance(v, (list, set, dict)) else v)
+                for k, v in self.pending.items())
+            self.pending = None
+
+    def reset(self):
+        """Forget the values, the next changes will be the whole state."""
+        self.committed = {}
+        self.pending = None
+
+
 def realize(d):
     if not isinstance(d, dict):
         return d
@@ -278,12 +442,327 @@ def format_help(topic):
     return s
 
 
+################################################################################
+# State files
+################################################################################
+
+# Last line of the state files written by `write_state_file`. It is a comment,
+# so `filemerge` ignores it, and its presence shows the file is complete.
+STATE_FILE_TRAILER = '# end of jobman state'
+
+
+def _fsync_dir(dirname):
+    try:
+        fd = os.open(dirname, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        # Some platforms/filesystems do not support fsync on directories.
+        pass
+    finally:
+        os.close(fd)
+
+
+def atomic_write(path, data, fsync=True, backup=None):
+    """Write `data` (bytes or str) to `path` atomically.
+
+    The data is written to a temporary file in the same directory, which is
+    then renamed over `path`, so readers never see a partially written file,
+    even if the process is killed in the middle of the write.
+
+    :param fsync: flush the data to disk before renaming, and the directory
+                  after. Without it, a crash of the machine (not only of the
+                  process) can still lose the last write.
+    :param backup: if given and `path` exists, the previous version of `path`
+                   is kept under this name (as a hard link when possible).
+    """
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    dirname, basename = os.path.split(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix='.%s.' % basename, dir=dirname)
+    try:
+        # mkstemp creates the file readable only by us, give it the usual mode.
+        umask = os.umask(0)
+        os.umask(umask)
+        os.chmod(tmp_path, 0o666 & ~umask)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        if backup is not None and os.path.exists(path):
+            _keep_backup(path, backup)
+        os.replace(tmp_path, path)
+        if fsync:
+            _fsync_dir(dirname)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def _keep_backup(path, backup):
+    tmp_backup = '%s.%i.tmp' % (backup, os.getpid())
+    try:
+        os.link(path, tmp_backup)
+    except OSError:
+        # No hard links on this filesystem: copy it.
+        import shutil
+        shutil.copyfile(path, tmp_backup)
+    os.replace(tmp_backup, backup)
+
+
+def write_state_file(path, d, fsync=True, backup=None):
+    """Save the state `d` in the text file `path` with `atomic_write`.
+
+    The file contains `format_d(d)` followed by `STATE_FILE_TRAILER`.
+    """
+    atomic_write(path, '%s\n%s\n' % (format_d(d), STATE_FILE_TRAILER),
+                 fsync=fsync, backup=backup)
+
+
+def state_file_complete(path):
+    """Return True if the state file `path` ends with `STATE_FILE_TRAILER`."""
+    trailer = STATE_FILE_TRAILER.encode('utf-8')
+    with open(path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        f.seek(max(0, f.tell() - len(trailer) - 2))
+        return f.read().rstrip(b'\r\n').endswith(trailer)
+
+
+################################################################################
+# Binary state files
+################################################################################
+
+# A binary state file holds the same flat state as a `format_d` text file, but
+# each value is pickled instead of repr'd, and an index of the keys is stored
+# at the beginning of the file so that it can be read back (entirely or only
+# for some keys) without parsing or eval'ing anything.
+#
+# Layout (little endian):
+#   header: magic, format version, number of keys
+#   index:  for each key: key length, value offset, value length, utf-8 key
+#   values: the pickled values, at the offsets given by the index
+
+BINARY_STATE_MAGIC = b'JMBS'
+BINARY_STATE_VERSION = 1
+BINARY_STATE_SUFFIX = '.jbin'
+
+_binary_header = struct.Struct('<4sHI')
+_binary_index_entry = struct.Struct('<HQI')
+
+
+def binary_state_path(conf_path):
+    """Return the path of the binary state file paired with `conf_path`."""
+    return os.path.splitext(conf_path)[0] + BINARY_STATE_SUFFIX
+
+
+def dump_binary_state(flat):
+    """Serialize the flat dictionary `flat` to the binary state format."""
+    keys = []
+    values = []
+    for k, v in flat.items():
+        keys.append(k.encode('utf-8'))
+        values.append(pickle.dumps(v, protocol=pickle.HIGHEST_PROTOCOL))
+
+    offset = _binary_header.size + sum(_binary_index_entry.size + len(k) for k in keys)
+    chunks = [_binary_header.pack(BINARY_STATE_MAGIC, BINARY_STATE_VERSION, len(keys))]
+    for k, v in zip(keys, values):
+        chunks.append(_binary_index_entry.pack(len(k), offset, len(v)))
+        chunks.append(k)
+        offset += len(v)
+    chunks.extend(values)
+    return b''.join(chunks)
+
+
+def write_binary_state(path, d, fsync=True):
+    """Flatten `d` and save it atomically in the binary state file `path`."""
+    atomic_write(path, dump_binary_state(flatten(d)), fsync=fsync)
+
+
+def _read_binary_index(buf):
+    magic, version, nkeys = _binary_header.unpack_from(buf, 0)
+    if magic != BINARY_STATE_MAGIC:
+        raise ValueError('Not a jobman binary state file')
+    if version != BINARY_STATE_VERSION:
+        raise ValueError('Unsupported jobman binary state version %i' % version)
+    index = {}
+    pos = _binary_header.size
+    for i in range(nkeys):
+        klen, offset, vlen = _binary_index_entry.unpack_from(buf, pos)
+        pos += _binary_index_entry.size
+        index[bytes(buf[pos:pos + klen]).decode('utf-8')] = (offset, vlen)
+        pos += klen
+    return index
+
+
+def read_binary_state(path, keys=None):
+    """Return the flat state saved in the binary state file `path`.
+
+    :param keys: if given, only these keys are unpickled (missing keys are
+                 ignored).
+
+    Raises ValueError if the file is not a valid binary state file.
+    """
+    with open(path, 'rb') as f:
+        try:
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # mmap refuses empty files
+            raise ValueError('Empty jobman binary state file: %s' % path)
+    try:
+        index = _read_binary_index(buf)
+        if keys is None:
+            keys = list(index.keys())
+        d = {}
+        for k in keys:
+            if k in index:
+                offset, vlen = index[k]
+                if offset + vlen > len(buf):
+                    raise ValueError('Truncated jobman binary state file: %s' % path)
+                d[k] = pickle.loads(buf[offset:offset + vlen])
+        return d
+    except struct.error:
+        raise ValueError('Truncated jobman binary state file: %s' % path)
+    finally:
+        buf.close()
+
+
+def load_conf(path):
+    """Return the flat state saved in the configuration file `path`.
+
+    If a binary state file (see `binary_state_path`) is present and is at
+    least as recent as `path`, it is read instead, which is much faster than
+    parsing the text file. Otherwise (or if the binary file can't be read
+    back, whatever the reason), this is the same as `filemerge(path)`.
+    """
+    bin_path = binary_state_path(path)
+    try:
+        bin_mtime = os.stat(bin_path).st_mtime_ns
+    except OSError:
+        bin_mtime = None
+    if bin_mtime is not None:
+        try:
+            use_bin = bin_mtime >= os.stat(path).st_mtime_ns
+        except OSError:
+            use_bin = True
+        if use_bin:
+            try:
+                return read_binary_state(bin_path)
+            except Exception:
+                # The binary file is only a cache: parse the text file
+                # if it is corrupted, or if a value can't be unpickled
+                # here (e.g. its class is in a module of the experiment
+                # that is not importable).
+                pass
+    return filemerge(path)
+
+
 ################################################################################
 # Helper functions operating on experiment directories
 ################################################################################
 
 
-def find_conf_files(cwd, fname='current.conf', recurse=True):
+def iter_job_dirs(cwd, fname='current.conf', recurse=True):
+    """
+    Yield (name, path) for each job directory under `cwd`, where `path` is
+    the job config file `fname` in that directory. Directories containing
+    `fname` are job directories; their subdirectories are not searched.
+
+    @param cwd: directory to start iterating from
+    @param fname: name of the job config file to look for
+    @param recurse: also search the subdirectories that are not job directories
+    """
+    to_visit = [cwd]
+    while to_visit:
+        try:
+            entries = os.scandir(to_visit.pop())
+        except OSError:
+            continue
+        with entries:
+            for entry in entries:
+                if not entry.is_dir():
+                    continue
+                conf = os.path.join(entry.path, fname)
+                if os.path.isfile(conf):
+                    yield entry.name, conf
+                elif recurse:
+                    to_visit.append(entry.path)
+
+
+def _load_conf_chunk(paths):
+    rval = []
+    for path in paths:
+        try:
+            rval.append((path, load_conf(path), None))
+        except Exception as e:
+            rval.append((path, None, '%s: %s' % (type(e).__name__, e)))
+    return rval
+
+
+def _chunks(iterable, size):
+    chunk = []
+    for x in iterable:
+        chunk.append(x)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def load_conf_files(paths, processes=None, chunksize=64):
+    """
+    Yield (path, flat state) for each job config file in `paths`, in order,
+    as they are parsed (see load_conf). Files that can't be read are skipped
+    with a warning.
+
+    The files are parsed in this process by default. With `processes` > 1,
+    they are parsed by a pool of that many processes, `chunksize` files at a
+    time. Parsing a current.conf is CPU bound (one eval per line), but
+    reading it from a shared filesystem often costs more, and the pool can't
+    help with that: only use it on many cores with the files on a fast
+    filesystem. (A current.jbin is cheap to read either way.)
+    """
+    if processes is None:
+        processes = 1
+    chunks = _chunks(paths, chunksize)
+
+    pool = None
+    if processes > 1:
+        first = next(chunks, None)
+        if first is None:
+            return
+        second = next(chunks, None)
+        if second is None:
+            # Not worth starting a pool
+            chunks = iter([first])
+        else:
+            # (imported here, it is slow to import)
+            import multiprocessing
+            pool = multiprocessing.Pool(processes)
+            chunks = pool.imap(_load_conf_chunk, chain([first, second], chunks))
+    if pool is None:
+        chunks = map(_load_conf_chunk, chunks)
+
+    try:
+        for chunk in chunks:
+            for path, state, error in chunk:
+                if error is not None:
+                    print("WARNING: cannot read %s (%s). Skipping it" % (path, error),
+                          file=sys.stderr)
+                    continue
+                yield path, state
+    finally:
+        if pool is not None:
+            pool.terminate()
+
+
+def find_conf_files(cwd, fname='current.conf', recurse=True, processes=None):
     """
     This generator will iterator from the given directory, and find all job
     configuration files recursively (if specified). Job config files are read
@@ -292,24 +771,16 @@ def find_conf_files(cwd, fname='current.conf', recurse=True):
     @param cwd: diretory to start iterating from
     @param fname: name of the job config file to look for and parse
     @param recurse: enable recursive search of job config files
+    @param processes: number of processes parsing the files (see load_conf_files)
     """
-    for jobid in os.listdir(cwd):
-        e = os.path.join(cwd, jobid)
-
-        if os.path.isdir(e) and recurse:
-            find_conf_files(e, fname)
-
-        try:
-            jobdd = DD(filemerge(os.path.join(e, fname)))
-        except IOError:
-            print("WARNING: %s file not found. Skipping it" % os.path.join(e, fname))
-            continue
-
+    for path, state in load_conf_files((conf for name, conf in iter_job_dirs(cwd, fname, recurse)),
+                                       processes=processes):
+        jobid = os.path.basename(os.path.dirname(path))
         try:
             jobid = int(jobid)
         except ValueError:
             jobid = None
-        yield (jobid, jobdd)
+        yield (jobid, DD(state))
 
 
 def rebuild_DB_from_FS(db, cwd='./', keep_id=True, verbose=False):
@@ -323,6 +794,7 @@ def rebuild_DB_from_FS(db, cwd='./', keep_id=True, verbose=False):
     @param keep_id: attempt to use the directory name as job id for inserting in DB
     @param verbose: prints info about which jobs are succesfully inserted
     """
+    from . import sql
     tot = 0
     for (jobid, jobdd) in find_conf_files(cwd):
         if keep_id and jobid:
@@ -338,7 +810,101 @@ def rebuild_DB_from_FS(db, cwd='./', keep_id=True, verbose=False):
         print('==== Inserted %i jobs ====' % tot)
 
 
-def _convert(obj):
+################################################################################
+# Parsing of the values
+################################################################################
+
+_NAMED_VALUES = {'True': True, 'False': False, 'None': None,
+                 'inf': float('inf'), 'nan': float('nan')}
+_INT_PATTERN = re.compile(r'[-+]?(?:0|[1-9][0-9]*)\Z')
+_FLOAT_PATTERN = re.compile(r'[-+]?(?:[0-9]+\.[0-9]*|\.[0-9]+|[0-9]+(?=[eE]))(?:[eE][-+]?[0-9]+)?\Z')
+_MUTABLE_TYPES = (list, dict, set)
+
+# (value, mutable) of the literals already parsed, where `mutable` is
+# whether the value contains a mutable (see _has_mutable). Conf files of the
+# jobs of a table share most of their values.
+_literal_cache = {}
+_LITERAL_CACHE_SIZE = 100000
+
+
+def _literal(node):
+    if isinstance(node, ast.Constant):
+        return node.value
+    elif isinstance(node, ast.Name) and node.id in _NAMED_VALUES:
+        return _NAMED_VALUES[node.id]
+    elif isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.UAdd, ast.USub)):
+        operand = _literal(node.operand)
+        if not isinstance(operand, (int, float, complex)):
+            raise ValueError(node)
+        return -operand if isinstance(node.op, ast.USub) else +operand
+    elif isinstance(node, ast.BinOp) and isinstance(node.op, (ast.Add, ast.Sub)):
+        # complex numbers, as in ast.literal_eval
+        left = _literal(node.left)
+        right = _literal(node.right)
+        if not (isinstance(left, (int, float)) and isinstance(right, complex)):
+            raise ValueError(node)
+        return left + right if isinstance(node.op, ast.Add) else left - right
+    elif isinstance(node, ast.Tuple):
+        return tuple(_literal(x) for x in node.elts)
+    elif isinstance(node, ast.List):
+        return [_literal(x) for x in node.elts]
+    elif isinstance(node, ast.Set):
+        return set(_literal(x) for x in node.elts)
+    elif isinstance(node, ast.Dict):
+        if None in node.keys:
+            raise ValueError(node)
+        return dict((_literal(k), _literal(v)) for k, v in zip(node.keys, node.values))
+    raise ValueError(node)
+
+
+def _has_mutable(value):
+    if isinstance(value, _MUTABLE_TYPES):
+        return True
+    if isinstance(value, (tuple, frozenset)):
+        return any(_has_mutable(x) for x in value)
+    return False
+
+
+def _parse_literal(s):
+    if s in _NAMED_VALUES:
+        return _NAMED_VALUES[s]
+    if _INT_PATTERN.match(s):
+        return int(s)
+    if _FLOAT_PATTERN.match(s):
+        return float(s)
+    if s.isidentifier():
+        return s
+    try:
+        return _literal(ast.parse(s, mode='eval').body)
+    except (ValueError, SyntaxError, TypeError, MemoryError, RecursionError):
+        return s
+
+
+def parse_literal(s):
+    """Return the value of the python literal `s`, or `s` itself if it is
+    not a literal.
+
+    Literals are numbers (including inf and nan), strings, bytes, True,
+    False, None, and tuples, lists, sets and dicts of literals. Unlike
+    eval, nothing is ever executed.
+    """
+    try:
+        value, mutable = _literal_cache[s]
+    except KeyError:
+        value = _parse_literal(s)
+        mutable = _has_mutable(value)
+        if len(_literal_cache) >= _LITERAL_CACHE_SIZE:
+            _literal_cache.clear()
+        _literal_cache[s] = value, mutable
+    if mutable:
+        return copy.deepcopy(value)
+    return value
+
+
+_convert = parse_literal
+
+
+def _eval_convert(obj):
     if numpy is None:
         globals_ = {}
     else:
@@ -409,3 +975,9 @@ def filemerge(*strings, **kwargs):
 raw = partial(standard, converter=lambda x: x)
 
 raw_filemerge = partial(filemerge, lineparser=raw)
+
+# The values used to be parsed with eval, which can run arbitrary code. Use
+# these parsers (e.g. --parser=eval_filemerge) if you rely on that.
+eval_standard = partial(standard, converter=_eval_convert)
+
+eval_filemerge = partial(filemerge, lineparser=eval_standard)
@@ -0,0 +1,33 @@
+import os
+
+from jobman.findjob import get_dir_by_key_name
+from jobman.tools import write_state_file
+
+
+def _make_jobs(table_dir, states):
+    for i, state in enumerate(states):
+        job_dir = os.path.join(str(table_dir), str(i + 1))
+        os.makedirs(job_dir)
+        for name in ('orig.conf', 'current.conf'):
+            write_state_file(os.path.join(job_dir, name), state, fsync=False)
+
+
+def test_group_sorted_inside_groups(tmp_path):
+    # The jobs of the two groups are inserted in different orders
+    _make_jobs(tmp_path, [{'model': 'a', 'seed': 0},
+                          {'model': 'a', 'seed': 1},
+                          {'model': 'b', 'seed': 1},
+                          {'model': 'b', 'seed': 0}])
+    nb_groups, key_values, dir_list = get_dir_by_key_name(str(tmp_path), ['model'])
+    assert nb_groups == 2
+    assert sorted(key_values) == [('a',), ('b',)]
+    # The jobs with the same other parameters are at the same index
+    # in each group
+    orders = []
+    for group in dir_list:
+        order = []
+        for confdir, expdir in group:
+            with open(os.path.join(confdir, 'orig.conf')) as f:
+                order.append([l for l in f if l.startswith('seed')])
+        orders.append(order)
+    assert orders[0] == orders[1]